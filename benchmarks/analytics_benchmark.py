@@ -0,0 +1,83 @@
+"""
+Measures WindowedAnalytics: the cost of recording payloads, and of querying
+a field over 1 min, 15 min and 1 h windows after recording 1 h and 24 h of
+history, compared with filtering a list of every recorded payload
+(what answering the same question from the history log amounts to).
+
+Run from the repository root:
+    python -m benchmarks.analytics_benchmark
+"""
+import time
+
+from models import DeviceLocation, WindowedAnalytics
+from benchmarks.rules_benchmark import make_payloads
+
+# simulated fleet reporting every 5 seconds
+DEVICES = 1_000
+INTERVAL = 5.0
+HISTORIES = [3_600.0, 86_400.0]
+WINDOWS = [60.0, 900.0, 3_600.0]
+QUERIES = 100
+
+
+def scan(history: list, now: float, window: float) -> dict:
+    values = [
+        payload.current_temp
+        for received, payload in history
+        if received > now - window
+        and payload.location == DeviceLocation.KITCHEN
+        and hasattr(payload, "current_temp")
+    ]
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "min": min(values, default=None),
+        "max": max(values, default=None),
+    }
+
+
+def main():
+    payloads = make_payloads(DEVICES)
+
+    print(
+        f"{'history (s)':>11} {'record (us/payload)':>20} {'window (s)':>11} "
+        f"{'query (us)':>11} {'scan (ms)':>10}"
+    )
+    for history_seconds in HISTORIES:
+        analytics = WindowedAnalytics()
+        history = []
+        rounds = int(history_seconds / INTERVAL)
+
+        start = time.perf_counter()
+        for round_ in range(rounds):
+            analytics.record(payloads, now=round_ * INTERVAL)
+        record_us = (time.perf_counter() - start) / (rounds * DEVICES) * 1e6
+
+        # only the 1 h history is scanned, keeping every payload of 24 h takes too much memory
+        if history_seconds <= 3_600.0:
+            history = [(round_ * INTERVAL, payload) for round_ in range(rounds) for payload in payloads]
+
+        now = (rounds - 1) * INTERVAL
+        for window in WINDOWS:
+            start = time.perf_counter()
+            for _ in range(QUERIES):
+                result = analytics.query("current_temp", window, location=DeviceLocation.KITCHEN, now=now)
+            query_us = (time.perf_counter() - start) / QUERIES * 1e6
+
+            scan_ms = "-"
+            if history:
+                start = time.perf_counter()
+                expected = scan(history, now, window)
+                scan_ms = f"{(time.perf_counter() - start) * 1000:.1f}"
+                # both answer the same question
+                assert result["count"] == expected["count"]
+                assert result["min"] == expected["min"] and result["max"] == expected["max"]
+
+            print(
+                f"{history_seconds:>11.0f} {record_us:>20.2f} {window:>11.0f} "
+                f"{query_us:>11.1f} {scan_ms:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Encode/decode microbenchmark of the packet codecs, for every device type.
+
+Run from the repository root:
+    python -m benchmarks.codec_benchmark
+"""
+import time
+from datetime import datetime
+
+from models import DeviceLocation
+from models.PacketCodec import CODECS
+from models.devices import SmartThermostat, SmartBulb, SmartCamera
+
+ITERATIONS = 50_000
+
+
+def per_call_us(function, *args) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        function(*args)
+    return (time.perf_counter() - start) / ITERATIONS * 1e6
+
+
+def main():
+    camera = SmartCamera("Garage Camera", DeviceLocation.GARAGE, 100)
+    camera.execute_command("take_snapshot")
+    devices = [
+        SmartThermostat("Living Room Thermostat", DeviceLocation.LIVING_ROOM, 22.0, 23.0, 30.0),
+        SmartBulb("Bedroom Light", DeviceLocation.BEDROOM, 100),
+        camera,
+    ]
+
+    print(f"{'device':>11} {'codec':>7} {'bytes':>6} {'encode (us)':>12} {'decode (us)':>12}")
+    for device in devices:
+        status = device.get_status()
+        timestamp = datetime.now()
+        for codec in CODECS.values():
+            packet = codec.encode(str(device.id), timestamp, status)
+            # both codecs must decode to the same payload
+            assert codec.decode(packet) == CODECS["json"].decode(
+                CODECS["json"].encode(str(device.id), timestamp, status)
+            )
+
+            encode_us = per_call_us(codec.encode, str(device.id), timestamp, status)
+            decode_us = per_call_us(codec.decode, packet)
+            print(
+                f"{device.device_type:>11} {codec.name:>7} {len(packet):>6} "
+                f"{encode_us:>12.2f} {decode_us:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Measures command delivery: how long the consume loop spends per command when
+it executes command strings on the device itself (the previous path) and when
+it queues typed commands with a CommandDispatcher; and the dispatch latency,
+commands per delivery and queue depth when bursts of commands are delivered
+by the dispatcher task.
+
+Run from the repository root:
+    python -m benchmarks.command_benchmark
+"""
+import asyncio
+import contextlib
+import os
+import random
+import time
+
+from models import CommandDispatcher, DeviceLocation
+from models.devices import SmartThermostat, SetTargetTemp
+from benchmarks.load_generator import percentiles
+
+DEVICES = 10_000
+BURSTS = [1_000, 10_000, 100_000]
+
+
+def make_thermostats(count: int) -> list:
+    return [
+        SmartThermostat(f"Thermostat {index}", DeviceLocation.BEDROOM, 14.0, 16.0, 50.0)
+        for index in range(count)
+    ]
+
+
+def inline_ms(devices: list, count: int) -> float:
+    start = time.perf_counter()
+    for index in range(count):
+        devices[index % len(devices)].execute_command("set_target_temp 20.0")
+    return (time.perf_counter() - start) * 1000
+
+
+def queue_ms(devices: list, count: int) -> float:
+    dispatcher = CommandDispatcher()
+    command = SetTargetTemp(20.0)
+    ids = [str(device.id) for device in devices]
+    start = time.perf_counter()
+    for index in range(count):
+        device = index % len(devices)
+        dispatcher.send(ids[device], devices[device], command)
+    return (time.perf_counter() - start) * 1000
+
+
+async def dispatch_burst(devices: list, count: int) -> dict:
+    latencies = []
+    depths = []
+    dispatcher = CommandDispatcher(on_result=lambda result: latencies.append(result.latency_ms))
+    runner = asyncio.create_task(dispatcher.run())
+
+    ids = [str(device.id) for device in devices]
+    for _ in range(count):
+        device = random.randrange(len(devices))
+        dispatcher.send(ids[device], devices[device], SetTargetTemp(20.0))
+
+    start = time.perf_counter()
+    while dispatcher.pending:
+        depths.append(dispatcher.pending)
+        await asyncio.sleep(0)
+    seconds = time.perf_counter() - start
+
+    runner.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await runner
+
+    stats = dispatcher.stats()
+    return {
+        "seconds": seconds,
+        "latency_ms": percentiles(latencies, (50, 99)),
+        "per_delivery": stats["average_commands_per_delivery"],
+        "max_depth": max(depths, default=0),
+    }
+
+
+def main():
+    devices = make_thermostats(DEVICES)
+
+    print(f"{'commands':>9} {'inline (us/command)':>20} {'queued (us/command)':>20}")
+    for count in BURSTS:
+        # devices print every command they apply
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            inline = inline_ms(devices, count)
+        queued = queue_ms(devices, count)
+        print(f"{count:>9} {inline / count * 1000:>20.2f} {queued / count * 1000:>20.2f}")
+
+    print(
+        f"\n{'burst':>9} {'drain (ms)':>11} {'latency p50 (ms)':>17} {'latency p99 (ms)':>17} "
+        f"{'commands/delivery':>18} {'max depth':>10}"
+    )
+    for count in BURSTS:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(dispatch_burst(devices, count))
+        latency = result["latency_ms"]
+        print(
+            f"{count:>9} {result['seconds'] * 1000:>11.1f} {latency['p50']:>17.2f} "
+            f"{latency['p99']:>17.2f} {result['per_delivery']:>18.2f} {result['max_depth']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Simulates a sustained alarm: cameras that keep detecting motion and thermostats
+stuck above 30 °C report for a number of rounds, with every round of packets already
+sent before the controller handles the first one. Compares the commands sent,
+console lines printed and processing time without an EventDeduplicator, with
+level-triggered events (without and with a cooldown) and with edge-triggered events.
+
+Run from the repository root:
+    python -m benchmarks.dedup_benchmark
+"""
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+from models import Controller, DeviceLocation, EventDeduplicator, TriggerMode
+from models.devices import SmartCamera, SmartThermostat
+
+DEVICES = 2_000
+ROUNDS = 20
+BATCH_SIZE = 256
+
+
+def make_alarming_fleet(count: int) -> list:
+    devices = []
+    for index in range(count):
+        if index % 2:
+            camera = SmartCamera(f"Camera {index}", DeviceLocation.LIVING_ROOM, 100)
+            camera._motion_detected = True
+            devices.append(camera)
+        else:
+            devices.append(
+                SmartThermostat(f"Thermostat {index}", DeviceLocation.KITCHEN, 35.0, 24.0, 50.0)
+            )
+    return devices
+
+
+async def run(deduplicator: EventDeduplicator | None, path: str) -> dict:
+    controller = Controller(storage_options={"path": path}, deduplicator=deduplicator)
+    devices = make_alarming_fleet(DEVICES)
+    for device in devices:
+        await device.connect(controller)
+
+    # the alarm does not clear while these are in flight
+    packets = [device.build_packet() for _ in range(ROUNDS) for device in devices]
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        for index in range(0, len(packets), BATCH_SIZE):
+            controller._process_batch(packets[index : index + BATCH_SIZE])
+        seconds = time.perf_counter() - start
+    controller.end_storage_thread()
+
+    lines = output.getvalue().splitlines()
+    return {
+        "commands": sum(line.startswith("[CRITICAL]") for line in lines),
+        "lines": len(lines),
+        "seconds": seconds,
+        "stats": deduplicator.stats() if deduplicator is not None else {},
+    }
+
+
+def main():
+    variants = {
+        "none": lambda: None,
+        # events are all handled, only repeated commands are suppressed
+        "level, no cooldown": lambda: EventDeduplicator(cooldown=0.0),
+        "level, 60 s cooldown": lambda: EventDeduplicator(cooldown=60.0),
+        "edge": lambda: EventDeduplicator(cooldown=0.0, mode=TriggerMode.EDGE),
+    }
+
+    print(
+        f"{'deduplicator':>22} {'commands':>9} {'console lines':>14} "
+        f"{'time (ms)':>10} {'suppressed events':>18} {'suppressed commands':>20}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.log")
+        for name, make in variants.items():
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = asyncio.run(run(make(), path))
+            stats = result["stats"]
+            print(
+                f"{name:>22} {result['commands']:>9} {result['lines']:>14} "
+                f"{result['seconds'] * 1000:>10.1f} {stats.get('suppressed_events', 0):>18} "
+                f"{stats.get('suppressed_commands', 0):>20}"
+            )
+
+
+if __name__ == "__main__":
+    main()
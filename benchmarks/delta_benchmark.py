@@ -0,0 +1,60 @@
+"""
+Measures the delta protocol with the load generator: the same fleet and rate with
+full packets and with keyframes and deltas, for both codecs. Reports bytes on
+the wire per packet, parse CPU per packet, controller throughput and the size of
+the history log.
+
+Run from the repository root:
+    python -m benchmarks.delta_benchmark
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+
+from benchmarks.load_generator import LoadConfig, run_load
+
+DEVICES = 10_000
+RATE = 20_000.0
+DURATION = 10.0
+
+CODECS = ["json", "json-delta", "binary", "binary-delta"]
+
+
+def main():
+    print(
+        f"{'codec':>13} {'bytes/packet':>13} {'vs full':>8} {'parse (us/pkt)':>15} "
+        f"{'throughput (pkt/s)':>19} {'log (MB)':>9} {'heartbeats':>11} {'gaps':>5}"
+    )
+    full = {}
+    for codec in CODECS:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "history.log")
+            config = LoadConfig(
+                devices=DEVICES,
+                rate=RATE,
+                duration=DURATION,
+                batch_size=64,
+                codec=codec,
+                instrumentation=True,
+                storage_options={"path": path},
+            )
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results = asyncio.run(run_load(config))
+            log_mb = os.path.getsize(path) / 2**20
+
+        base = codec.removesuffix("-delta")
+        full.setdefault(base, results["bytes_per_packet"])
+        parse = results["instrumentation"]["stages"]["parse"]
+        delta = results["decoding"].get("delta", {})
+        processed = results["packets_processed"]
+        print(
+            f"{codec:>13} {results['bytes_per_packet']:>13.0f} "
+            f"{results['bytes_per_packet'] / full[base]:>7.0%} "
+            f"{parse['total_ms'] * 1000 / processed:>15.2f} {results['throughput_pps']:>19.0f} "
+            f"{log_mb:>9.1f} {delta.get('heartbeats', 0) / processed:>10.0%} {delta.get('gaps', 0):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
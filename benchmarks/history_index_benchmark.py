@@ -0,0 +1,130 @@
+"""
+Compares queries through the history log index (HistoryIndex) with scanning
+the whole log: the records of one device, of a one minute time range, and of
+one device in a one hour time range.
+
+The log is written the way the StorageWorker writes it (commits of 512 records,
+indexed as they are written); its size is configurable, e.g. for a multi-GB log:
+    python -m benchmarks.history_index_benchmark --megabytes 4096
+
+Run from the repository root:
+    python -m benchmarks.history_index_benchmark
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from models import DeviceLocation, HistoryIndex, LogFormat
+from models.HistoryIndex import HistoryIndexWriter, index_path
+from models.HistoryLog import BinaryLogEncoder, BinaryLogReader, TextLogEncoder, read_text_log
+from models.devices import ThermostatPayload
+
+COMMIT_SIZE = 512
+# devices report every 10 seconds
+INTERVAL = timedelta(seconds=10)
+
+
+def device_id(device: int) -> str:
+    return f"00000000-0000-0000-0000-{device:012d}"
+
+
+def write_log(path: str, log_format: LogFormat, megabytes: int, devices: int) -> tuple[int, datetime]:
+    """
+    Writes a log of about megabytes, with every device reporting every INTERVAL.
+    Returns the number of records and the time of the last one.
+    """
+    encoder = BinaryLogEncoder() if log_format == LogFormat.BINARY else TextLogEncoder()
+    index = HistoryIndexWriter(path, log_format, encoder)
+    start = datetime(2024, 1, 1)
+    step = INTERVAL / devices
+    records = 0
+    with open(path, "wb") as file:
+        file.write(encoder.header())
+        while file.tell() < megabytes * 2**20:
+            batch = [
+                ThermostatPayload(
+                    device_id=device_id(record % devices),
+                    name=f"Thermostat {record % devices}",
+                    location=DeviceLocation.LIVING_ROOM,
+                    current_temp=20.0 + record % 7,
+                    target_temp=22.0,
+                    humidity=45.0,
+                    timestamp=start + step * record,
+                )
+                for record in range(records, records + COMMIT_SIZE)
+            ]
+            offset = file.tell()
+            file.write(encoder.encode(batch))
+            index.add(offset, file.tell() - offset, batch)
+            records += COMMIT_SIZE
+    index.close()
+    return records, start + step * (records - 1)
+
+
+def scan(path: str, log_format: LogFormat):
+    if log_format == LogFormat.BINARY:
+        with BinaryLogReader(path) as reader:
+            yield from reader
+    else:
+        yield from read_text_log(path)
+
+
+def matches(payload, device, start, end) -> bool:
+    if device is not None and payload.device_id != device:
+        return False
+    if start is not None and payload.timestamp < start:
+        return False
+    return end is None or payload.timestamp <= end
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--megabytes", type=int, default=256, help="approximate log size")
+    parser.add_argument("--devices", type=int, default=10_000)
+    parser.add_argument(
+        "--format", choices=[log_format.value for log_format in LogFormat], action="append",
+        help="log formats to measure (default: both)",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'format':>7} {'log (MB)':>9} {'index (KB)':>11} {'query':>15} "
+        f"{'records':>8} {'blocks read':>12} {'index (ms)':>11} {'scan (ms)':>10} {'speedup':>8}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for log_format in map(LogFormat, args.format or [log_format.value for log_format in LogFormat]):
+            path = os.path.join(directory, f"history.{log_format.value}")
+            records, last = write_log(path, log_format, args.megabytes, args.devices)
+
+            device = device_id(args.devices // 2)
+            middle = last - (last - datetime(2024, 1, 1)) / 2
+            queries = [
+                ("device", device, None, None),
+                ("1 min", None, middle, middle + timedelta(minutes=1)),
+                ("device, 1 h", device, middle, middle + timedelta(hours=1)),
+            ]
+            with HistoryIndex(path, log_format) as index:
+                blocks = index.stats()["blocks"]
+                for name, device_, start, end in queries:
+                    begin = time.perf_counter()
+                    found = sum(1 for _ in index.query(device_, start, end))
+                    index_ms = (time.perf_counter() - begin) * 1000
+                    blocks_read = len(index.candidate_blocks(device_, start, end))
+
+                    begin = time.perf_counter()
+                    expected = sum(1 for payload in scan(path, log_format) if matches(payload, device_, start, end))
+                    scan_ms = (time.perf_counter() - begin) * 1000
+                    assert found == expected
+
+                    print(
+                        f"{log_format.value:>7} {os.path.getsize(path) / 2**20:>9.0f} "
+                        f"{os.path.getsize(index_path(path)) / 2**10:>11.0f} {name:>15} {found:>8} "
+                        f"{f'{blocks_read}/{blocks}':>12} {index_ms:>11.1f} {scan_ms:>10.0f} "
+                        f"{scan_ms / index_ms:>7.0f}x"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Compares the text and binary history log formats:
+file size, write throughput and read (parse back) throughput.
+
+Run from the repository root:
+    python -m benchmarks.history_log_benchmark
+"""
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from models import DeviceLocation
+from models.HistoryLog import (
+    TextLogEncoder,
+    BinaryLogEncoder,
+    BinaryLogReader,
+    read_text_log,
+)
+from models.devices import ThermostatPayload, BulbPayload, CameraPayload
+
+RECORDS = 200_000
+DEVICES = 1_000
+CHUNK_SIZE = 512
+
+
+def make_payloads() -> list:
+    start = datetime.now()
+    payloads = []
+    for i in range(RECORDS):
+        device = i % DEVICES
+        common = dict(
+            device_id=f"00000000-0000-0000-0000-{device:012d}",
+            name=f"Device {device}",
+            location=random.choice(list(DeviceLocation)),
+            timestamp=start + timedelta(milliseconds=i),
+        )
+        kind = device % 3
+        if kind == 0:
+            payloads.append(
+                ThermostatPayload(
+                    **common,
+                    current_temp=random.uniform(15.0, 30.0),
+                    target_temp=22.0,
+                    humidity=random.uniform(20.0, 70.0),
+                )
+            )
+        elif kind == 1:
+            payloads.append(BulbPayload(**common, is_on=True, brightness=random.randint(0, 100)))
+        else:
+            payloads.append(
+                CameraPayload(
+                    **common,
+                    motion_detected=random.choice([True, False]),
+                    battery_level=random.uniform(0.0, 100.0),
+                    last_snapshot=start,
+                    is_on=True,
+                )
+            )
+    return payloads
+
+
+def write_log(path: str, encoder, payloads: list) -> float:
+    start = time.perf_counter()
+    with open(path, "wb") as file:
+        file.write(encoder.header())
+        for i in range(0, len(payloads), CHUNK_SIZE):
+            file.write(encoder.encode(payloads[i : i + CHUNK_SIZE]))
+    return time.perf_counter() - start
+
+
+def read_binary(path: str) -> int:
+    with BinaryLogReader(path) as reader:
+        return sum(1 for _ in reader)
+
+
+def read_text(path: str) -> int:
+    return sum(1 for _ in read_text_log(path))
+
+
+def main():
+    payloads = make_payloads()
+
+    print(f"{'format':>7} {'size (MB)':>10} {'write (rec/s)':>14} {'read (rec/s)':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, encoder, reader in (
+            ("text", TextLogEncoder(), read_text),
+            ("binary", BinaryLogEncoder(), read_binary),
+        ):
+            path = os.path.join(directory, f"history.{name}")
+            write_seconds = write_log(path, encoder, payloads)
+
+            start = time.perf_counter()
+            records = reader(path)
+            read_seconds = time.perf_counter() - start
+            assert records == RECORDS
+
+            print(
+                f"{name:>7} {os.path.getsize(path) / 2**20:>10.2f} "
+                f"{RECORDS / write_seconds:>14.0f} {RECORDS / read_seconds:>13.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
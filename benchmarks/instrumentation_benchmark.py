@@ -0,0 +1,90 @@
+"""
+Measures the cost of pipeline instrumentation: processes the same packet batches
+with instrumentation disabled and enabled, and times the checks the disabled
+path adds to every batch on their own. Prints the per-stage snapshot
+of the instrumented run.
+
+Run from the repository root:
+    python -m benchmarks.instrumentation_benchmark
+"""
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+import timeit
+
+from models import Controller, Instrumentation
+from benchmarks.load_generator import make_fleet
+
+DEVICES = 5_000
+BATCH_SIZES = [1, 64, 512]
+PACKETS = 20_000
+# None checks _process_batch and get_metrics add when instrumentation is disabled
+DISABLED_CHECKS = 9
+
+
+async def make_controller(devices: list, path: str, instrumentation) -> Controller:
+    controller = Controller(
+        storage_options={"path": path},
+        instrumentation=instrumentation,
+    )
+    for device in devices:
+        await device.connect(controller)
+    return controller
+
+
+def make_packets(devices: list, count: int) -> list:
+    packets = []
+    for index in range(count):
+        device = devices[index % len(devices)]
+        device.update_state()
+        packets.append(device.build_packet())
+    return packets
+
+
+def run(devices: list, packets: list, batch_size: int, path: str, instrumentation) -> float:
+    batches = [packets[i:i + batch_size] for i in range(0, len(packets), batch_size)]
+
+    # devices print when they connect and the controller prints metrics for every batch
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        controller = asyncio.run(make_controller(devices, path, instrumentation))
+        start = time.perf_counter()
+        for batch in batches:
+            controller._process_batch(batch)
+        seconds = time.perf_counter() - start
+        controller.end_storage_thread()
+
+    return seconds / len(batches) * 1e6
+
+
+def main():
+    devices = make_fleet(DEVICES)
+    packets = make_packets(devices, PACKETS)
+
+    check = timeit.timeit("instruments is not None", globals={"instruments": None}, number=1_000_000)
+    checks_us = check * DISABLED_CHECKS
+
+    print(
+        f"{'batch size':>10} {'disabled (us/batch)':>20} {'enabled (us/batch)':>19} "
+        f"{'enabled overhead':>17} {'disabled checks':>16}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.log")
+        for batch_size in BATCH_SIZES:
+            instruments = Instrumentation()
+            disabled_us = run(devices, packets, batch_size, path, None)
+            enabled_us = run(devices, packets, batch_size, path, instruments)
+            print(
+                f"{batch_size:>10} {disabled_us:>20.2f} {enabled_us:>19.2f} "
+                f"{(enabled_us / disabled_us - 1) * 100:>16.1f}% "
+                f"{checks_us / disabled_us * 100:>15.3f}%"
+            )
+
+    print("\nstages of the last instrumented run:")
+    print(json.dumps(instruments.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures lazy packet decoding: parse CPU per packet and whole-batch cost per packet,
+decoding every packet and decoding only packets whose content changed, for fleets
+with different shares of devices that rarely change (bulbs) and of devices that
+change on every report (cameras, thermostats heating or cooling).
+
+Run from the repository root:
+    python -m benchmarks.lazy_decode_benchmark
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+from models import Controller, Instrumentation
+from benchmarks.instrumentation_benchmark import make_packets
+from benchmarks.load_generator import make_fleet
+
+DEVICES = 5_000
+PACKETS = 50_000
+BATCH_SIZE = 64
+
+# name, relative weights of thermostats, bulbs and cameras
+MIXES = [
+    ("even", (1.0, 1.0, 1.0)),
+    ("mostly bulbs", (1.0, 8.0, 1.0)),
+    ("bulbs only", (0.0, 1.0, 0.0)),
+]
+
+
+async def make_controller(devices: list, path: str, codec: str, lazy: bool) -> Controller:
+    controller = Controller(
+        batch_size=BATCH_SIZE,
+        codecs=(codec,),
+        storage_options={"path": path},
+        instrumentation=Instrumentation(),
+        lazy_decoding=lazy,
+    )
+    for device in devices:
+        await device.connect(controller)
+    return controller
+
+
+def run(devices: list, packets: list, path: str, codec: str, lazy: bool) -> dict:
+    batches = [packets[i : i + BATCH_SIZE] for i in range(0, len(packets), BATCH_SIZE)]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        controller = asyncio.run(make_controller(devices, path, codec, lazy))
+        start = time.perf_counter()
+        for batch in batches:
+            controller._process_batch(batch)
+        seconds = time.perf_counter() - start
+        controller.end_storage_thread()
+
+    parse = controller.instrumentation.snapshot()["stages"]["parse"]
+    return {
+        "parse_us": parse["total_ms"] * 1000 / len(packets),
+        "batch_us": seconds * 1e6 / len(packets),
+        "heartbeats": controller.decoding_stats().get("heartbeat_ratio", 0.0),
+        "log_mb": os.path.getsize(path) / 2**20,
+    }
+
+
+def main():
+    print(
+        f"{'codec':>7} {'mix':>13} {'decoding':>9} {'parse (us/pkt)':>15} {'batch (us/pkt)':>15} "
+        f"{'heartbeats':>11} {'log (MB)':>9}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.log")
+        for codec in ("json", "binary"):
+            for name, mix in MIXES:
+                devices = make_fleet(DEVICES, mix)
+                # connect first, so packets are built with the negotiated codec
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    controller = asyncio.run(make_controller(devices, path, codec, False))
+                    controller.end_storage_thread()
+                os.remove(path)
+                packets = make_packets(devices, PACKETS)
+
+                for decoding, lazy in (("eager", False), ("lazy", True)):
+                    results = run(devices, packets, path, codec, lazy)
+                    os.remove(path)
+                    print(
+                        f"{codec:>7} {name:>13} {decoding:>9} {results['parse_us']:>15.2f} "
+                        f"{results['batch_us']:>15.2f} {results['heartbeats']:>10.0%} "
+                        f"{results['log_mb']:>9.1f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
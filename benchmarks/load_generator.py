@@ -0,0 +1,323 @@
+"""
+Load generator and throughput/latency benchmark for the controller.
+
+Creates a fleet of simulated SmartThermostat/SmartBulb/SmartCamera devices,
+connects them to a real Controller and sends their status at a configurable
+total rate. Reports packets/sec, end-to-end latency percentiles (from the device
+timestamp to processing by the controller), packet and storage queue depth and RSS,
+as JSON so runs can be compared between commits.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.load_generator --devices 100000 --rate 20000 --duration 10 \
+        --output results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from array import array
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+
+from models import Controller, DeviceLocation, Instrumentation, OverflowPolicy
+from models.devices import SmartThermostat, SmartBulb, SmartCamera
+
+# how often the producer sends the packets due since its last round
+TICK_SECONDS = 0.01
+
+
+@dataclass
+class LoadConfig:
+    devices: int = 10_000
+    # total packets per second, across all devices
+    rate: float = 5_000.0
+    duration: float = 10.0
+    # relative weights of thermostats, bulbs and cameras
+    mix: tuple[float, float, float] = (1.0, 1.0, 1.0)
+    batch_size: int = 1
+    batch_latency_ms: float = 0.0
+    codec: str = "json"
+    columnar_state: bool = False
+    # bound of the packet queue (0 for unbounded) and what happens when it is full
+    packet_queue_size: int = 0
+    packet_overflow: str = OverflowPolicy.BLOCK.value
+    # process pool decoding batches of at least offload_batch_size packets (0 for none)
+    decode_workers: int = 0
+    offload_batch_size: int = 256
+    # record per-stage latencies and include them in the results
+    instrumentation: bool = False
+    # seconds to wait for the controller to catch up once sending stops
+    drain_timeout: float = 30.0
+    storage_options: dict = field(default_factory=dict)
+
+
+def make_fleet(count: int, mix=(1.0, 1.0, 1.0)) -> list:
+    locations = list(DeviceLocation)
+    kinds = random.choices(range(3), weights=mix, k=count)
+    devices = []
+    for index, kind in enumerate(kinds):
+        location = random.choice(locations)
+        if kind == 0:
+            devices.append(
+                SmartThermostat(
+                    f"Thermostat {index}",
+                    location,
+                    random.uniform(15.0, 28.0),
+                    random.uniform(18.0, 24.0),
+                    random.uniform(20.0, 70.0),
+                )
+            )
+        elif kind == 1:
+            devices.append(SmartBulb(f"Bulb {index}", location, random.randint(0, 100)))
+        else:
+            devices.append(SmartCamera(f"Camera {index}", location, 100))
+    return devices
+
+
+class MeasuredController(Controller):
+    """
+    Controller recording the latency of every payload it processes.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies_ms = array("d")
+
+    def _process_batch(self, packets: list, rows: list[tuple] | None = None) -> list:
+        payloads = super()._process_batch(packets, rows)
+        now = datetime.now()
+        self.latencies_ms.extend(
+            (now - payload.timestamp).total_seconds() * 1000 for payload in payloads
+        )
+        return payloads
+
+
+def percentiles(values, points=(50, 90, 99, 99.9)) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {
+        f"p{point:g}": ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))]
+        for point in points
+    }
+    result["max"] = ordered[-1]
+    result["mean"] = sum(ordered) / len(ordered)
+    return result
+
+
+def rss_mb() -> dict:
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    current = None
+    with contextlib.suppress(OSError):
+        with open("/proc/self/statm") as file:
+            current = int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    return {"peak": peak, "current": current}
+
+
+def git_commit() -> str | None:
+    with contextlib.suppress(OSError, subprocess.CalledProcessError):
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+    return None
+
+
+async def produce(devices: list, rate: float, duration: float) -> tuple[int, int]:
+    """
+    Sends the status of the devices round-robin, at the given total rate.
+    Returns the number of packets and of bytes sent.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    sent = 0
+    sent_bytes = 0
+    cursor = 0
+
+    while (elapsed := loop.time() - start) < duration:
+        due = int(elapsed * rate) - sent
+        for _ in range(due):
+            device = devices[cursor]
+            cursor = (cursor + 1) % len(devices)
+            device.update_state()
+            packet = device.build_packet()
+            # JSON packets are ASCII
+            sent_bytes += len(packet)
+            try:
+                device._controller_queue.put_nowait(packet)
+            except asyncio.QueueFull:
+                # bounded queue with OverflowPolicy.BLOCK, wait for room like SmartDevice.run
+                await device._controller_queue.put(packet)
+        sent += due
+        await asyncio.sleep(TICK_SECONDS)
+
+    return sent, sent_bytes
+
+
+async def sample_queues(controller: Controller, samples: dict) -> None:
+    while True:
+        samples["packet_queue"].append(controller._packet_queue.qsize())
+        samples["storage_queue"].append(controller._storage_queue.qsize())
+        await asyncio.sleep(0.1)
+
+
+def discarded_packets(controller: Controller) -> int:
+    # packets dropped or coalesced by a full packet queue are never processed
+    stats = controller.queue_stats()["packet_queue"]
+    return stats["dropped"] + stats["coalesced"]
+
+
+async def run_load(config: LoadConfig, controller_class=MeasuredController) -> dict:
+    controller = controller_class(
+        batch_size=config.batch_size,
+        batch_latency_ms=config.batch_latency_ms,
+        codecs=(config.codec,),
+        columnar_state=config.columnar_state,
+        storage_options=config.storage_options,
+        instrumentation=Instrumentation() if config.instrumentation else None,
+        packet_queue_size=config.packet_queue_size,
+        packet_overflow=config.packet_overflow,
+        decode_workers=config.decode_workers,
+        offload_batch_size=config.offload_batch_size,
+    )
+
+    setup_start = time.perf_counter()
+    devices = make_fleet(config.devices, config.mix)
+    for device in devices:
+        await device.connect(controller)
+    setup_seconds = time.perf_counter() - setup_start
+
+    samples = {"packet_queue": [], "storage_queue": []}
+    consumer = asyncio.create_task(controller.consume())
+    sampler = asyncio.create_task(sample_queues(controller, samples))
+
+    start = time.perf_counter()
+    sent, sent_bytes = await produce(devices, config.rate, config.duration)
+    send_seconds = time.perf_counter() - start
+
+    # let the controller catch up with what was sent
+    deadline = time.perf_counter() + config.drain_timeout
+    while (
+        controller.processed_packets + discarded_packets(controller) < sent
+        and time.perf_counter() < deadline
+    ):
+        await asyncio.sleep(0.01)
+    total_seconds = time.perf_counter() - start
+
+    for task in (consumer, sampler):
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    controller.end_storage_thread()
+
+    processed = controller.processed_packets
+    results = {
+        "commit": git_commit(),
+        "config": asdict(config),
+        "setup_seconds": setup_seconds,
+        "packets_sent": sent,
+        "packets_processed": processed,
+        "bytes_per_packet": sent_bytes / sent if sent else 0.0,
+        "send_rate_pps": sent / send_seconds,
+        "throughput_pps": processed / total_seconds,
+        "latency_ms": percentiles(controller.latencies_ms),
+        "packet_queue_depth": percentiles(samples["packet_queue"]),
+        "storage_queue_depth": percentiles(samples["storage_queue"]),
+        "queues": controller.queue_stats(),
+        "commands": controller.command_stats(),
+        "storage": controller.storage_stats(),
+        "decoding": controller.decoding_stats(),
+        "rss_mb": rss_mb(),
+    }
+    if controller.instrumentation is not None:
+        results["instrumentation"] = controller.instrumentation.snapshot()
+    return results
+
+
+def parse_args() -> tuple[LoadConfig, str | None]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, default=LoadConfig.devices)
+    parser.add_argument("--rate", type=float, default=LoadConfig.rate, help="total packets per second")
+    parser.add_argument("--duration", type=float, default=LoadConfig.duration, help="seconds")
+    parser.add_argument(
+        "--mix",
+        default="1:1:1",
+        help="relative weights of thermostats:bulbs:cameras",
+    )
+    parser.add_argument("--batch-size", type=int, default=LoadConfig.batch_size)
+    parser.add_argument("--batch-latency-ms", type=float, default=LoadConfig.batch_latency_ms)
+    parser.add_argument(
+        "--codec", choices=("json", "binary", "json-delta", "binary-delta"), default=LoadConfig.codec
+    )
+    parser.add_argument("--columnar", action="store_true", help="keep device state in a columnar store")
+    parser.add_argument("--queue-size", type=int, default=0, help="packet queue bound, 0 for unbounded")
+    parser.add_argument(
+        "--overflow",
+        choices=[policy.value for policy in OverflowPolicy],
+        default=LoadConfig.packet_overflow,
+        help="what happens when the packet queue is full",
+    )
+    parser.add_argument(
+        "--decode-workers", type=int, default=0, help="process pool size for decoding large batches"
+    )
+    parser.add_argument(
+        "--offload-batch-size",
+        type=int,
+        default=LoadConfig.offload_batch_size,
+        help="smallest batch decoded in the process pool",
+    )
+    parser.add_argument(
+        "--index-block-size",
+        type=int,
+        default=0,
+        help="bytes of log per history index entry, 0 for no index",
+    )
+    parser.add_argument("--instrument", action="store_true", help="include per-stage latencies in the results")
+    parser.add_argument("--output", help="file to write the JSON results to")
+    args = parser.parse_args()
+
+    config = LoadConfig(
+        devices=args.devices,
+        rate=args.rate,
+        duration=args.duration,
+        mix=tuple(float(weight) for weight in args.mix.split(":")),
+        batch_size=args.batch_size,
+        batch_latency_ms=args.batch_latency_ms,
+        codec=args.codec,
+        columnar_state=args.columnar,
+        instrumentation=args.instrument,
+        packet_queue_size=args.queue_size,
+        packet_overflow=args.overflow,
+        decode_workers=args.decode_workers,
+        offload_batch_size=args.offload_batch_size,
+        storage_options={"index_block_size": args.index_block_size} if args.index_block_size else {},
+    )
+    return config, args.output
+
+
+def main():
+    config, output = parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.storage_options["path"] = os.path.join(directory, "history.log")
+        # the controller prints metrics for every batch, keep them out of the results
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = asyncio.run(run_load(config))
+
+    # the log location is temporary, so leave it out of the results
+    results["config"]["storage_options"].pop("path")
+    report = json.dumps(results, indent=2)
+    print(report)
+    if output:
+        with open(output, "w") as file:
+            file.write(report)
+
+
+if __name__ == "__main__":
+    main()
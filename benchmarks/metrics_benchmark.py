@@ -0,0 +1,75 @@
+"""
+Compares the per-update cost of the incremental MetricsAccumulator against
+a full AnalyticsEngine.get_metrics recompute, and checks after a run of
+random updates that both report the same metrics.
+
+Run from the repository root:
+    python -m benchmarks.metrics_benchmark
+"""
+import random
+import time
+
+from models import DeviceRegistry, MetricsAccumulator
+from models.AnalyticsEngine import AnalyticsEngine
+from models.devices import ThermostatPayload
+from benchmarks.registry_benchmark import make_device
+
+FLEET_SIZES = [10, 100, 1_000, 10_000, 100_000]
+UPDATES = 2_000
+
+
+def random_payload(device):
+    if device.device_type == "THERMOSTAT":
+        return ThermostatPayload(
+            device_id=str(device.id),
+            name=device.name,
+            location=device.location,
+            current_temp=random.uniform(10.0, 35.0),
+            target_temp=random.uniform(16.0, 24.0),
+            humidity=random.uniform(10.0, 90.0),
+        )
+    # non-thermostat payloads do not contribute to the metrics
+    return None
+
+
+def main():
+    print(f"{'devices':>10} {'incremental (us)':>18} {'full recompute (us)':>21} {'consistent':>11}")
+    for size in FLEET_SIZES:
+        registry = DeviceRegistry()
+        accumulator = MetricsAccumulator()
+        thermostats = []
+        for i in range(size):
+            device = make_device(i)
+            payload = random_payload(device)
+            registry.register(device, payload)
+            accumulator.add(payload)
+            if payload is not None:
+                thermostats.append(device)
+
+        updates = [random_payload(random.choice(thermostats)) for _ in range(UPDATES)]
+
+        start = time.perf_counter()
+        for payload in updates:
+            accumulator.update(registry.update(payload), payload)
+            accumulator.metrics()
+        incremental_us = (time.perf_counter() - start) / UPDATES * 1e6
+
+        # full recompute is too slow to run after every update on big fleets
+        samples = updates[: max(10, UPDATES * 10 // size)]
+        replaced = []
+        start = time.perf_counter()
+        for payload in samples:
+            replaced.append(registry.update(payload))
+            AnalyticsEngine.get_metrics(registry)
+        full_us = (time.perf_counter() - start) / len(samples) * 1e6
+
+        # apply the same updates to the accumulator before comparing
+        for old, new in zip(replaced, samples):
+            accumulator.update(old, new)
+        consistent = accumulator.is_consistent(registry)
+
+        print(f"{size:>10} {incremental_us:>18.2f} {full_us:>21.2f} {str(consistent):>11}")
+
+
+if __name__ == "__main__":
+    main()
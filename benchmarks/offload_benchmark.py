@@ -0,0 +1,107 @@
+"""
+Measures decoding and rule evaluation of packet batches in place (on the event loop
+thread) and in a DecodePool, for a range of batch sizes and worker counts. Reports
+wall time and event loop thread CPU time per packet: the crossover batch size is
+where the pool starts saving loop time, and wall time shows how it scales with
+workers (bounded by the CPU cores of the machine).
+
+Run from the repository root:
+    python -m benchmarks.offload_benchmark
+"""
+import asyncio
+import os
+import time
+
+from benchmarks.load_generator import make_fleet
+from models import DecodePool, RulesEngine
+from models.AnalyticsEngine import AnalyticsEngine
+from models.PacketCodec import CODECS
+
+DEVICES = 10_000
+# packets decoded for every row of the table
+PACKETS = 65_536
+BATCH_SIZES = [16, 64, 256, 1024, 4096]
+WORKERS = [1, 2, 4]
+
+
+def make_packets(codec: str) -> tuple[list, set[str]]:
+    devices = make_fleet(DEVICES)
+    for device in devices:
+        device.set_codec(CODECS[codec])
+    packets = []
+    while len(packets) < PACKETS:
+        for device in devices:
+            device.update_state()
+            packets.append(device.build_packet())
+    return packets[:PACKETS], {str(device.id) for device in devices}
+
+
+def decode_inline(batch: list, registry: set[str], rules: RulesEngine) -> int:
+    payloads = [
+        payload
+        for packet in batch
+        for payload in AnalyticsEngine.parse_payload(packet)
+        if payload.device_id in registry
+    ]
+    latest = {payload.device_id: payload for payload in payloads}
+    return len(rules.evaluate(latest.values()))
+
+
+async def decode_offloaded(pool: DecodePool, batch: list, registry: set[str], rules: RulesEngine) -> int:
+    rows = await pool.decode(batch, rules)
+    payloads, classified = pool.payloads(rows, registry)
+    latest = {payload.device_id: payload for payload in payloads}
+    return sum(1 for payload, _ in classified if latest[payload.device_id] is payload)
+
+
+async def measure(packets: list, registry: set[str], batch_size: int, pool: DecodePool | None) -> tuple[float, float]:
+    """
+    Returns wall and event loop thread CPU microseconds per packet.
+    """
+    rules = RulesEngine()
+    batches = [packets[start : start + batch_size] for start in range(0, len(packets), batch_size)]
+    if pool is not None:
+        # start the workers outside the measurement
+        await decode_offloaded(pool, batches[0], registry, rules)
+
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    for batch in batches:
+        if pool is None:
+            decode_inline(batch, registry, rules)
+        else:
+            await decode_offloaded(pool, batch, registry, rules)
+    cpu = time.thread_time() - cpu
+    wall = time.perf_counter() - wall
+    return wall * 1e6 / len(packets), cpu * 1e6 / len(packets)
+
+
+async def run():
+    print(f"{os.cpu_count()} CPU cores")
+    print(
+        f"{'codec':>7} {'batch':>6} {'workers':>8} {'wall (us/pkt)':>14} "
+        f"{'loop CPU (us/pkt)':>18} {'loop CPU vs inline':>19}"
+    )
+    for codec in ("json", "binary"):
+        packets, registry = make_packets(codec)
+        for batch_size in BATCH_SIZES:
+            inline_wall, inline_cpu = await measure(packets, registry, batch_size, None)
+            print(f"{codec:>7} {batch_size:>6} {'inline':>8} {inline_wall:>14.2f} {inline_cpu:>18.2f} {'':>19}")
+            for workers in WORKERS:
+                pool = DecodePool(workers, min_batch=1)
+                try:
+                    wall, cpu = await measure(packets, registry, batch_size, pool)
+                finally:
+                    pool.close()
+                print(
+                    f"{codec:>7} {batch_size:>6} {workers:>8} {wall:>14.2f} "
+                    f"{cpu:>18.2f} {cpu / inline_cpu:>18.0%}"
+                )
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
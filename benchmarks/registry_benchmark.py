@@ -0,0 +1,58 @@
+"""
+Compares device lookup cost of the DeviceRegistry against the linear scan
+the controller used before, for fleets from 10 to 100k devices.
+
+Run from the repository root:
+    python -m benchmarks.registry_benchmark
+"""
+import random
+import time
+
+from models.devices import SmartThermostat, SmartBulb, SmartCamera
+from models import DeviceLocation, DeviceRegistry
+
+FLEET_SIZES = [10, 100, 1_000, 10_000, 100_000]
+LOOKUPS = 10_000
+
+
+def make_device(index: int):
+    location = random.choice(list(DeviceLocation))
+    kind = index % 3
+    if kind == 0:
+        return SmartThermostat(f"Thermostat {index}", location, 21.0, 22.0, 40.0)
+    if kind == 1:
+        return SmartBulb(f"Bulb {index}", location, 100)
+    return SmartCamera(f"Camera {index}", location, 100)
+
+
+def linear_scan(devices, device_id):
+    return next(device for device in devices if str(device.id) == device_id)
+
+
+def time_per_lookup(lookup, keys) -> float:
+    start = time.perf_counter()
+    for key in keys:
+        lookup(key)
+    return (time.perf_counter() - start) / len(keys)
+
+
+def main():
+    print(f"{'devices':>10} {'registry (ns)':>15} {'linear scan (ns)':>18}")
+    for size in FLEET_SIZES:
+        devices = [make_device(i) for i in range(size)]
+        registry = DeviceRegistry()
+        for device in devices:
+            registry.register(device)
+
+        keys = [str(random.choice(devices).id) for _ in range(LOOKUPS)]
+        registry_ns = time_per_lookup(registry.lookup, keys) * 1e9
+
+        # the linear scan is far too slow for big fleets, so sample fewer keys
+        scan_keys = keys[: max(10, LOOKUPS // size)]
+        scan_ns = time_per_lookup(lambda key: linear_scan(devices, key), scan_keys) * 1e9
+
+        print(f"{size:>10} {registry_ns:>15.0f} {scan_ns:>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
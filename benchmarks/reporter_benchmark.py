@@ -0,0 +1,83 @@
+"""
+Measures how much console output costs the controller: processes the same
+packets (one per batch, as consume() does by default) printing the metrics after
+every packet, and with a Reporter writing text or JSON lines once a second.
+
+Output goes to a line-buffered pipe drained by another process, like a console
+or a log collector (one write per printed line), and to /dev/null for the cost
+of formatting alone.
+
+Run from the repository root:
+    python -m benchmarks.reporter_benchmark
+"""
+import asyncio
+import contextlib
+import os
+import subprocess
+import tempfile
+import time
+
+from models import Controller, Reporter, ReportFormat
+from benchmarks.instrumentation_benchmark import make_packets
+from benchmarks.load_generator import make_fleet
+
+DEVICES = 5_000
+PACKETS = 50_000
+
+
+async def make_controller(devices: list, path: str, reporter) -> Controller:
+    controller = Controller(storage_options={"path": path}, reporter=reporter)
+    for device in devices:
+        await device.connect(controller)
+    return controller
+
+
+def run(devices: list, packets: list, path: str, sink, report_format) -> tuple[float, dict]:
+    with contextlib.redirect_stdout(sink):
+        reporter = Reporter(report_format=report_format) if report_format is not None else None
+        controller = asyncio.run(make_controller(devices, path, reporter))
+        start = time.perf_counter()
+        for packet in packets:
+            controller._process_batch([packet])
+        seconds = time.perf_counter() - start
+        controller.end_storage_thread()
+        if reporter is not None:
+            reporter.close()
+    return len(packets) / seconds, reporter.stats() if reporter is not None else {}
+
+
+def main():
+    devices = make_fleet(DEVICES)
+    packets = make_packets(devices, PACKETS)
+
+    # drains the pipe, as a terminal would
+    drain = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    sinks = [
+        ("pipe", os.fdopen(os.dup(drain.stdin.fileno()), "w", buffering=1)),
+        ("/dev/null", open(os.devnull, "w")),
+    ]
+
+    print(f"{'output':>10} {'reporting':>17} {'throughput (pkt/s)':>19} {'speedup':>8} {'reports':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.log")
+        for sink_name, sink in sinks:
+            baseline = None
+            for name, report_format in (
+                ("every packet", None),
+                ("reporter, text", ReportFormat.TEXT),
+                ("reporter, json", ReportFormat.JSON),
+            ):
+                throughput, stats = run(devices, packets, path, sink, report_format)
+                baseline = baseline or throughput
+                print(
+                    f"{sink_name:>10} {name:>17} {throughput:>19.0f} "
+                    f"{throughput / baseline:>7.1f}x {stats.get('reports', '-'):>8}"
+                )
+            sink.close()
+
+    drain.stdin.close()
+    drain.wait()
+
+
+if __name__ == "__main__":
+    main()
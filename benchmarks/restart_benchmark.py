@@ -0,0 +1,96 @@
+"""
+Measures restart-to-ready time: how long a restarted controller takes until it
+knows the latest state of every device, when all devices reconnect at once (cold
+start), and when it restores its latest snapshot and replays the history log
+written after it (warm start). Also reports the snapshot size and the time the
+snapshot's copy of the state holds up the event loop.
+
+Run from the repository root:
+    python -m benchmarks.restart_benchmark
+"""
+import asyncio
+import contextlib
+import math
+import os
+import tempfile
+import time
+
+from models import Controller, LogFormat, WindowedAnalytics
+from benchmarks.load_generator import make_fleet
+
+FLEETS = [10_000, 100_000]
+BATCH_SIZE = 512
+# share of the devices reporting again between the snapshot and the restart
+TAIL = 0.1
+
+
+def make_controller(directory: str) -> Controller:
+    return Controller(
+        batch_size=BATCH_SIZE,
+        storage_options={"path": os.path.join(directory, "history.log"), "log_format": LogFormat.BINARY},
+        analytics=WindowedAnalytics(),
+        checkpoint_path=os.path.join(directory, "controller.snapshot"),
+    )
+
+
+def send(controller: Controller, devices: list) -> None:
+    packets = []
+    for device in devices:
+        device.update_state()
+        packets.append(device.build_packet())
+    for index in range(0, len(packets), BATCH_SIZE):
+        controller._process_batch(packets[index : index + BATCH_SIZE])
+
+
+async def connect_all(controller: Controller, devices: list) -> None:
+    for device in devices:
+        await device.connect(controller)
+
+
+async def before_restart(controller: Controller, devices: list) -> dict:
+    await connect_all(controller, devices)
+    send(controller, devices)
+    checkpoint = await controller.checkpoint()
+    send(controller, devices[: int(len(devices) * TAIL)])
+    return checkpoint
+
+
+def main():
+    print(
+        f"{'devices':>8} {'snapshot (MB)':>14} {'capture (ms)':>13} {'snapshot (ms)':>14} "
+        f"{'cold start (ms)':>16} {'warm start (ms)':>16} {'replayed':>9}"
+    )
+    for count in FLEETS:
+        devices = make_fleet(count)
+        with tempfile.TemporaryDirectory() as directory:
+            # devices print when they connect and the controller prints metrics
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                controller = make_controller(directory)
+                checkpoint = asyncio.run(before_restart(controller, devices))
+                expected = controller.get_metrics()
+                controller.end_storage_thread()
+
+                # every device reconnects with a full payload
+                os.mkdir(os.path.join(directory, "cold"))
+                cold = make_controller(os.path.join(directory, "cold"))
+                start = time.perf_counter()
+                asyncio.run(connect_all(cold, devices))
+                cold_seconds = time.perf_counter() - start
+                cold.end_storage_thread()
+
+                warm = make_controller(directory)
+                restored = warm.warm_start()
+                actual = warm.get_metrics()
+                warm.end_storage_thread()
+
+        assert restored["devices"] == count
+        assert all(math.isclose(actual[key], expected[key], rel_tol=1e-9) for key in expected)
+        print(
+            f"{count:>8} {checkpoint['bytes'] / 2**20:>14.1f} {checkpoint['capture_ms']:>13.1f} "
+            f"{checkpoint['seconds'] * 1000:>14.0f} {cold_seconds * 1000:>16.0f} "
+            f"{restored['seconds'] * 1000:>16.0f} {restored['replayed']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
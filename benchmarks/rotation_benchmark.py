@@ -0,0 +1,66 @@
+"""
+Measures log rotation and compression while the controller runs under sustained
+load: controller throughput, end-to-end latency, the storage worker's worst
+commit and its queue depth, without rotation and with segments sealed every
+ROTATE_BYTES, left as they are or compressed with gzip or lzma, in a process pool
+or in the writer thread.
+
+Run from the repository root:
+    python -m benchmarks.rotation_benchmark
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+
+from models.LogRotation import LogCompression
+from benchmarks.load_generator import LoadConfig, run_load
+
+DEVICES = 10_000
+RATE = 20_000.0
+DURATION = 10.0
+ROTATE_BYTES = 4 * 2**20
+
+SETUPS = [
+    ("no rotation", {}),
+    ("rotate", {"rotate_bytes": ROTATE_BYTES}),
+    ("gzip, pool", {"rotate_bytes": ROTATE_BYTES, "compression": LogCompression.GZIP}),
+    ("lzma, pool", {"rotate_bytes": ROTATE_BYTES, "compression": LogCompression.LZMA}),
+    (
+        "lzma, inline",
+        {"rotate_bytes": ROTATE_BYTES, "compression": LogCompression.LZMA, "compression_workers": 0},
+    ),
+]
+
+
+def main():
+    print(
+        f"{'setup':>13} {'throughput (pkt/s)':>19} {'latency p99 (ms)':>17} {'max commit (ms)':>16} "
+        f"{'storage queue p99.9':>20} "
+        f"{'segments':>9} {'compressed':>11} {'ratio':>6} {'compression (MB/s)':>19}"
+    )
+    for name, options in SETUPS:
+        with tempfile.TemporaryDirectory() as directory:
+            config = LoadConfig(
+                devices=DEVICES,
+                rate=RATE,
+                duration=DURATION,
+                batch_size=64,
+                storage_options={"path": os.path.join(directory, "history.log"), **options},
+            )
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results = asyncio.run(run_load(config))
+
+        storage = results["storage"]
+        compression = storage["compression"]
+        print(
+            f"{name:>13} {results['throughput_pps']:>19.0f} {results['latency_ms']['p99']:>17.1f} "
+            f"{storage['max_commit_latency_ms']:>16.1f} {results['storage_queue_depth']['p99.9']:>20.0f} "
+            f"{storage['rotations']:>9} "
+            f"{compression['segments']:>11} {compression['ratio']:>6.1f} "
+            f"{compression['throughput_mb_s']:>19.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares critical-event evaluation paths at 1k, 10k and 100k payloads:
+the previous filter_events (is_critical called twice per critical payload),
+the current filter_events, RulesEngine.evaluate over payload batches and
+RulesEngine.evaluate_store over ColumnarStore columns.
+
+Run from the repository root:
+    python -m benchmarks.rules_benchmark
+"""
+import random
+import time
+
+from models import ColumnarStore, DeviceLocation, RulesEngine
+from models.AnalyticsEngine import AnalyticsEngine, is_critical
+from models.devices import ThermostatPayload, BulbPayload, CameraPayload
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def previous_filter_events(stream):
+    critical_payloads = filter(lambda payload: is_critical(payload) is not None, stream)
+    for payload in critical_payloads:
+        yield (payload, is_critical(payload))
+
+
+def make_payloads(count: int) -> list:
+    payloads = []
+    for i in range(count):
+        common = dict(
+            device_id=f"device-{i}",
+            name=f"Device {i}",
+            location=random.choice(list(DeviceLocation)),
+        )
+        kind = i % 3
+        if kind == 0:
+            payloads.append(ThermostatPayload(
+                **common,
+                current_temp=random.uniform(10.0, 35.0),
+                target_temp=22.0,
+                humidity=random.uniform(10.0, 90.0),
+            ))
+        elif kind == 1:
+            payloads.append(BulbPayload(**common, is_on=True, brightness=100))
+        else:
+            payloads.append(CameraPayload(
+                **common,
+                motion_detected=random.random() < 0.2,
+                battery_level=random.uniform(0.0, 100.0),
+                last_snapshot=None,
+                is_on=True,
+            ))
+    return payloads
+
+
+def timed(function) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    engine = RulesEngine()
+    print(
+        f"{'payloads':>9} {'previous (ms)':>14} {'filter_events (ms)':>19} "
+        f"{'rules batch (ms)':>17} {'rules columns (ms)':>19}"
+    )
+    for size in SIZES:
+        payloads = make_payloads(size)
+        store = ColumnarStore()
+        for payload in payloads:
+            store.upsert(payload)
+
+        previous_ms, expected = timed(lambda: list(previous_filter_events(payloads)))
+        current_ms, current = timed(lambda: list(AnalyticsEngine.filter_events(payloads)))
+        batch_ms, batch = timed(lambda: engine.evaluate(payloads))
+        columns_ms, columns = timed(lambda: engine.evaluate_store(store))
+
+        # every path must find the same critical events
+        assert current == expected and batch == expected
+        assert sorted(columns, key=str) == sorted(
+            ((payload.device_id, event) for payload, event in expected), key=str
+        )
+
+        print(f"{size:>9} {previous_ms:>14.2f} {current_ms:>19.2f} {batch_ms:>17.2f} {columns_ms:>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compares one SmartDevice.run task per device with a single DeviceScheduler
+(hashed timing wheel) sending the status of the same fleet: memory per device
+of the tasks or wheel entries, event-loop lag seen by a probe task, CPU time
+and packets sent. Also runs the scheduler with a virtual clock, which
+simulates the same period without waiting.
+
+Run from the repository root:
+    python -m benchmarks.scheduler_benchmark
+"""
+import asyncio
+import contextlib
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from models import Controller, DeviceScheduler
+from benchmarks.load_generator import make_fleet, percentiles
+
+SIZES = [1_000, 10_000, 100_000]
+INTERVAL = 5.0
+DURATION = 10.0
+PROBE_INTERVAL = 0.01
+
+
+async def drain(packet_queue: asyncio.Queue) -> None:
+    # stands in for the controller, so only sending is measured
+    while True:
+        await packet_queue.get()
+        while not packet_queue.empty():
+            packet_queue.get_nowait()
+
+
+async def run_device(device, sent: list) -> None:
+    # the loop of SmartDevice.run (the device is already connected),
+    # starting at a random point of the first interval like the scheduler does
+    await asyncio.sleep(random.random() * INTERVAL)
+    while True:
+        await device.send_status()
+        sent[0] += 1
+        await asyncio.sleep(INTERVAL)
+
+
+async def probe(lags: list) -> None:
+    # how late the event loop wakes up a task sleeping PROBE_INTERVAL
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((loop.time() - start - PROBE_INTERVAL) * 1000)
+
+
+async def measure(devices: list, mode: str) -> dict:
+    controller = Controller(storage_options={"path": os.path.join(tempfile.gettempdir(), "scheduler.log")})
+    for device in devices:
+        await device.connect(controller)
+
+    lags = []
+    background = [
+        asyncio.create_task(drain(controller._packet_queue)),
+        asyncio.create_task(probe(lags)),
+    ]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    if mode == "tasks":
+        task_sent = [0]
+        senders = [asyncio.create_task(run_device(device, task_sent)) for device in devices]
+        scheduler = None
+    else:
+        scheduler = DeviceScheduler(virtual_clock=mode == "virtual clock")
+        for device in devices:
+            scheduler.add(device, INTERVAL)
+        senders = []
+    setup_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if scheduler is None:
+        await asyncio.sleep(DURATION)
+        sent = task_sent[0]
+    else:
+        await scheduler.run(DURATION)
+        sent = scheduler.sent_packets
+    cpu_seconds = time.process_time() - cpu_start
+    wall_seconds = time.perf_counter() - wall_start
+
+    for task in senders + background:
+        task.cancel()
+    await asyncio.gather(*senders, *background, return_exceptions=True)
+    controller.end_storage_thread()
+
+    return {
+        "bytes_per_device": setup_bytes / len(devices),
+        "lag_ms": percentiles(lags, (50, 99)),
+        "cpu_seconds": cpu_seconds,
+        "wall_seconds": wall_seconds,
+        "sent": sent,
+    }
+
+
+def main():
+    print(
+        f"{'devices':>8} {'mode':>14} {'bytes/device':>13} {'lag p50 (ms)':>13} "
+        f"{'lag p99 (ms)':>13} {'cpu (s)':>8} {'wall (s)':>9} {'sent':>8}"
+    )
+    for size in SIZES:
+        devices = make_fleet(size)
+        for mode in ("tasks", "timing wheel", "virtual clock"):
+            # devices print when they connect
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = asyncio.run(measure(devices, mode))
+            lag = result["lag_ms"]
+            print(
+                f"{size:>8} {mode:>14} {result['bytes_per_device']:>13.0f} "
+                f"{lag.get('p50', 0.0):>13.2f} {lag.get('p99', 0.0):>13.2f} "
+                f"{result['cpu_seconds']:>8.2f} {result['wall_seconds']:>9.2f} {result['sent']:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures ShardedController throughput with 1, 2, 4 and 8 shards,
+running the shards as asyncio tasks and as separate processes.
+
+Run from the repository root:
+    python -m benchmarks.shard_benchmark
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from models import ShardedController, ShardMode
+from benchmarks.registry_benchmark import make_device
+
+SHARD_COUNTS = [1, 2, 4, 8]
+DEVICES = 2_000
+PACKETS_PER_DEVICE = 25
+
+
+async def measure(mode: ShardMode, shards: int, log_path: str) -> float:
+    controller = ShardedController(
+        shards, mode, batch_size=256, storage_options={"path": log_path}
+    )
+    devices = [make_device(i) for i in range(DEVICES)]
+    for device in devices:
+        await device.connect(controller)
+
+    # packets are built up front, so only their processing is measured
+    timestamp = datetime.now().isoformat()
+    packets = []
+    for _ in range(PACKETS_PER_DEVICE):
+        for device in devices:
+            device.update_state()
+            packet = {
+                "device_id": str(device.id),
+                "timestamp": timestamp,
+                "payload": device.get_status(),
+            }
+            packets.append((device._controller_queue, json.dumps(packet)))
+
+    consumer = asyncio.create_task(controller.consume())
+    start = time.perf_counter()
+    for packet_queue, packet in packets:
+        packet_queue.put_nowait(packet)
+    while controller.processed_packets < len(packets):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    consumer.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await consumer
+    controller.end_storage_thread()
+    return len(packets) / elapsed
+
+
+def main():
+    print(f"{'mode':>8} {'shards':>7} {'packets/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "history.log")
+        for mode in ShardMode:
+            for shards in SHARD_COUNTS:
+                # metrics and critical events are printed for every batch, keep them out of the results
+                with contextlib.redirect_stdout(io.StringIO()):
+                    throughput = asyncio.run(measure(mode, shards, log_path))
+                print(f"{mode.value:>8} {shards:>7} {throughput:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
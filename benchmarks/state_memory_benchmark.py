@@ -0,0 +1,112 @@
+"""
+Reports memory per device of the latest device state when kept as
+payload dataclasses with a __dict__ (the previous layout), as __slots__ payloads,
+and in a ColumnarStore; and compares the cost of computing metrics over each.
+
+Run from the repository root:
+    python -m benchmarks.state_memory_benchmark
+"""
+import dataclasses
+import gc
+import random
+import time
+import tracemalloc
+from datetime import datetime
+
+from models import ColumnarStore, DeviceLocation
+from models.AnalyticsEngine import AnalyticsEngine
+from models.devices import ThermostatPayload, BulbPayload, CameraPayload
+
+DEVICES = 100_000
+
+
+def without_slots(payload_class):
+    # same fields as the payload class, but instances carry a __dict__
+    return dataclasses.make_dataclass(
+        payload_class.__name__,
+        [(field.name, field.type, field) for field in dataclasses.fields(payload_class)],
+    )
+
+
+def make_payload_fields(ids: list, names: list) -> list:
+    now = datetime.now()
+    rows = []
+    for i, (device_id, name) in enumerate(zip(ids, names)):
+        common = dict(
+            device_id=device_id,
+            name=name,
+            location=random.choice(list(DeviceLocation)),
+            timestamp=now,
+        )
+        kind = i % 3
+        if kind == 0:
+            rows.append((ThermostatPayload, dict(
+                common,
+                current_temp=random.uniform(15.0, 30.0),
+                target_temp=random.uniform(18.0, 24.0),
+                humidity=random.uniform(20.0, 70.0),
+            )))
+        elif kind == 1:
+            rows.append((BulbPayload, dict(common, is_on=True, brightness=random.randint(0, 100))))
+        else:
+            rows.append((CameraPayload, dict(
+                common,
+                motion_detected=False,
+                battery_level=random.uniform(0.0, 100.0),
+                last_snapshot=None,
+                is_on=True,
+            )))
+    return rows
+
+
+def measure(build) -> tuple[object, int]:
+    gc.collect()
+    tracemalloc.start()
+    state = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return state, size
+
+
+def main():
+    # ids and names are shared by all layouts, so they are created up front
+    ids = [f"00000000-0000-0000-0000-{i:012d}" for i in range(DEVICES)]
+    names = [f"Device {i}" for i in range(DEVICES)]
+    dict_classes = {cls: without_slots(cls) for cls in (ThermostatPayload, BulbPayload, CameraPayload)}
+
+    # field values are generated inside every measurement,
+    # since each payload object holds its own float objects
+    def build_dict_payloads():
+        rows = make_payload_fields(ids, names)
+        return {fields["device_id"]: dict_classes[cls](**fields) for cls, fields in rows}
+
+    def build_slots_payloads():
+        rows = make_payload_fields(ids, names)
+        return {fields["device_id"]: cls(**fields) for cls, fields in rows}
+
+    def build_columnar():
+        store = ColumnarStore()
+        for cls, fields in make_payload_fields(ids, names):
+            store.upsert(cls(**fields))
+        return store
+
+    print(f"{'layout':>16} {'bytes/device':>13} {'metrics (ms)':>13}")
+    for label, build in (
+        ("dict payloads", build_dict_payloads),
+        ("slots payloads", build_slots_payloads),
+        ("columnar", build_columnar),
+    ):
+        state, size = measure(build)
+        start = time.perf_counter()
+        if isinstance(state, ColumnarStore):
+            state.get_metrics()
+        else:
+            AnalyticsEngine.get_metrics(state)
+        metrics_ms = (time.perf_counter() - start) * 1000
+        print(f"{label:>16} {size / DEVICES:>13.1f} {metrics_ms:>13.2f}")
+        del state
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Measures StorageWorker throughput, batch sizes and commit latency
+for every durability policy, with and without fsync.
+
+Run from the repository root:
+    python -m benchmarks.storage_benchmark
+"""
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from models import DeviceLocation, DurabilityPolicy
+from models.StorageWorker import StorageWorker
+from models.devices import ThermostatPayload
+
+RECORDS = 100_000
+
+
+def run_worker(path: str, payloads: list, **options) -> tuple[float, dict]:
+    storage_queue = queue.Queue()
+    worker = StorageWorker(storage_queue, path=path, **options)
+    thread = threading.Thread(target=worker.run)
+
+    start = time.perf_counter()
+    thread.start()
+    for payload in payloads:
+        storage_queue.put(payload)
+    storage_queue.put(None)
+    thread.join()
+    return time.perf_counter() - start, worker.stats()
+
+
+def main():
+    payloads = [
+        ThermostatPayload(
+            device_id=f"device-{i % 1000}",
+            name=f"Thermostat {i % 1000}",
+            location=DeviceLocation.LIVING_ROOM,
+            current_temp=21.5,
+            target_temp=22.0,
+            humidity=40.0,
+        )
+        for i in range(RECORDS)
+    ]
+
+    print(
+        f"{'policy':>14} {'fsync':>6} {'records/s':>11} {'avg batch':>10} "
+        f"{'avg commit (ms)':>16} {'max commit (ms)':>16}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.log")
+        for durability in DurabilityPolicy:
+            for fsync in (False, True):
+                # fsync after every record takes minutes, so only a sample is used
+                records = payloads[:2_000] if fsync and durability == DurabilityPolicy.EVERY_RECORD else payloads
+                seconds, stats = run_worker(
+                    path, records, durability=durability, fsync=fsync, flush_interval_ms=100
+                )
+                print(
+                    f"{durability.value:>14} {str(fsync):>6} {len(records) / seconds:>11.0f} "
+                    f"{stats['average_batch_size']:>10.1f} {stats['average_commit_latency_ms']:>16.3f} "
+                    f"{stats['max_commit_latency_ms']:>16.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
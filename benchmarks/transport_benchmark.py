@@ -0,0 +1,107 @@
+"""
+Measures the network transport against the in-process packet queue: the same
+fleet sends at the same total rate, either straight to the controller's queue or
+over loopback TCP through a ConnectionPool of 1 to 64 connections (devices
+multiplexed on them), or over UDP. Devices and controller share one event loop,
+so the cost of both ends of the transport is counted.
+
+Reports throughput, end-to-end latency and the bytes sent per packet.
+
+Run from the repository root:
+    python -m benchmarks.transport_benchmark
+"""
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+from models import TransportServer, ConnectionPool
+from benchmarks.load_generator import MeasuredController, make_fleet, percentiles, produce
+
+DEVICES = 10_000
+RATE = 20_000.0
+DURATION = 5.0
+BATCH_SIZE = 64
+
+# name, connections (None for the in-process queue), largest UDP datagram (None for TCP)
+SETUPS = [
+    ("in-process", None, None),
+    ("tcp", 1, None),
+    ("tcp", 8, None),
+    ("tcp", 64, None),
+    ("udp", 1, 1400),
+    # loopback only, larger datagrams are fragmented on most networks
+    ("udp, 60k", 1, 60_000),
+]
+
+
+async def run(path: str, codec: str, connections: int | None, max_datagram: int | None) -> dict:
+    controller = MeasuredController(
+        batch_size=BATCH_SIZE, codecs=(codec,), storage_options={"path": path}
+    )
+    server = pool = None
+    target = controller
+    if connections is not None:
+        server = TransportServer(controller)
+        await server.start(udp_port=0 if max_datagram else None)
+        pool = ConnectionPool(server.address, connections, server.udp_address, max_datagram or 1400)
+        target = pool
+
+    devices = make_fleet(DEVICES)
+    for device in devices:
+        await device.connect(target)
+    consumer = asyncio.create_task(controller.consume())
+
+    start = time.perf_counter()
+    sent, _ = await produce(devices, RATE, DURATION)
+    # wait for the controller to catch up, or until packets stop arriving (lost over UDP)
+    processed, finished = 0, time.perf_counter()
+    while controller.processed_packets < sent and time.perf_counter() - finished < 1.0:
+        if controller.processed_packets > processed:
+            processed, finished = controller.processed_packets, time.perf_counter()
+        await asyncio.sleep(0.01)
+    if controller.processed_packets > processed:
+        finished = time.perf_counter()
+    seconds = finished - start
+
+    consumer.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await consumer
+    pool_stats = pool.stats() if pool is not None else {}
+    if pool is not None:
+        await pool.close()
+        await server.close()
+    controller.end_storage_thread()
+
+    return {
+        "connections": pool_stats.get("connections", 0),
+        "sent": sent,
+        "throughput": controller.processed_packets / seconds,
+        "lost": sent - controller.processed_packets,
+        "latency": percentiles(controller.latencies_ms),
+        # the connection handshakes included
+        "bytes_per_packet": pool_stats["bytes_sent"] / sent if pool_stats else 0.0,
+    }
+
+
+def main():
+    print(
+        f"{'codec':>7} {'transport':>11} {'connections':>12} {'throughput (pkt/s)':>19} "
+        f"{'lost':>6} {'latency p50 (ms)':>17} {'latency p99 (ms)':>17} {'bytes/packet':>13}"
+    )
+    for codec in ("json", "binary"):
+        for name, connections, max_datagram in SETUPS:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "history.log")
+                with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    results = asyncio.run(run(path, codec, connections, max_datagram))
+            print(
+                f"{codec:>7} {name:>11} {results['connections']:>12} {results['throughput']:>19.0f} "
+                f"{results['lost']:>6} {results['latency']['p50']:>17.1f} {results['latency']['p99']:>17.1f} "
+                f"{results['bytes_per_packet']:>13.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
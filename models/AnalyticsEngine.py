@@ -1,14 +1,27 @@
 import functools
-import json
-from datetime import datetime
-from models.devices import ThermostatPayload, BulbPayload, CameraPayload
+from models.devices import ThermostatPayload, CameraPayload
 from .CriticalEvent import CriticalEvent
 from .DeviceLocation import DeviceLocation
-
-
-# NOTE: if we eventually use a dashboard,
-#  whether an event is critical or not can be selected by the user
-#  and this function will parse that configuration
+from .PacketCodec import decode_packet
+
+
+# locations whose thermostats count towards the average house temperature
+INDOOR_LOCATIONS = frozenset(
+    {
+        DeviceLocation.LIVING_ROOM,
+        DeviceLocation.BEDROOM,
+        DeviceLocation.KITCHEN,
+        DeviceLocation.BATHROOM,
+        DeviceLocation.OFFICE,
+        DeviceLocation.HALLWAY,
+        DeviceLocation.DINING_ROOM,
+    }
+)
+
+
+# NOTE: the controller evaluates critical events with a RulesEngine,
+#  whose rules can be configured by the user (DEFAULT_RULES mirrors the checks below);
+#  this function remains the reference per-payload implementation
 def is_critical(payload) -> CriticalEvent | None:
     # if payload is from a thermostat
     if isinstance(payload, ThermostatPayload):
@@ -39,58 +52,30 @@ def is_critical(payload) -> CriticalEvent | None:
 class AnalyticsEngine:
     @staticmethod
     def parse_payload(packet):
-        packet_data = json.loads(packet)
-        timestamp = datetime.fromisoformat(packet_data["timestamp"])
-        device_type = packet_data["payload"]["device_type"]
-
-        if device_type == "THERMOSTAT":
-            yield ThermostatPayload(
-                device_id=packet_data["device_id"],
-                name=packet_data["payload"]["name"],
-                location=DeviceLocation(packet_data["payload"]["location"]),
-                current_temp=packet_data["payload"]["current_temp"],
-                target_temp=packet_data["payload"]["target_temp"],
-                humidity=packet_data["payload"]["humidity"],
-            )
-        elif device_type == "BULB":
-            yield BulbPayload(
-                device_id=packet_data["device_id"],
-                name=packet_data["payload"]["name"],
-                location=DeviceLocation(packet_data["payload"]["location"]),
-                is_on=packet_data["payload"]["is_on"],
-                brightness=packet_data["payload"]["brightness"],
-            )
-        elif device_type == "CAMERA":
-            yield CameraPayload(
-                device_id=packet_data["device_id"],
-                name=packet_data["payload"]["name"],
-                location=DeviceLocation(packet_data["payload"]["location"]),
-                motion_detected=packet_data["payload"]["motion_detected"],
-                battery_level=packet_data["payload"]["battery_level"],
-                last_snapshot=(
-                    datetime.fromisoformat(packet_data["payload"]["last_snapshot"])
-                    if packet_data["payload"]["last_snapshot"]
-                    else None
-                ),
-                is_on=packet_data["payload"]["is_on"],
-            )
-        else:
+        # the codec is recognized from the packet itself (see PacketCodec)
+        payload = decode_packet(packet)
+        if payload is None:
             # unknown device type
             return
+        yield payload
 
     @staticmethod
     def filter_events(stream):
         # filter payloads for critical events only
-        critical_payloads = filter(
-            lambda payload: is_critical(payload) is not None, stream
-        )
-
-        # attach critical event type to payload
-        for payload in critical_payloads:
-            yield (payload, is_critical(payload))
+        # and attach critical event type to payload
+        # (is_critical is evaluated once per payload)
+        for payload in stream:
+            critical_event = is_critical(payload)
+            if critical_event is not None:
+                yield (payload, critical_event)
 
     @staticmethod
     def get_metrics(connected_devices) -> dict:
+        """
+        Computes the metrics with a full pass over all connected devices.
+        The controller keeps these up to date incrementally with a
+        MetricsAccumulator; this full recompute serves as its consistency check.
+        """
         # average house temperature
         temperature_sum = functools.reduce(lambda sum_, payload: sum_ + AnalyticsEngine.get_temperature(payload),
                                    connected_devices.values(), 0.0)
@@ -116,15 +101,6 @@ class AnalyticsEngine:
         Given a payload, returns the temperature if the payload
         is from a thermostat device and from an indoor location.
         """
-        INDOOR_LOCATIONS = [
-            DeviceLocation.LIVING_ROOM,
-            DeviceLocation.BEDROOM,
-            DeviceLocation.KITCHEN,
-            DeviceLocation.BATHROOM,
-            DeviceLocation.OFFICE,
-            DeviceLocation.HALLWAY,
-            DeviceLocation.DINING_ROOM
-        ]
         if isinstance(payload, ThermostatPayload) and payload.location in INDOOR_LOCATIONS:
             return payload.current_temp
         return 0.0
@@ -0,0 +1,123 @@
+import asyncio
+import queue
+from collections import deque
+
+from .OverflowPolicy import OverflowPolicy
+
+
+class _OwnSlot:
+    # key of a coalescing queue's slot holding an item without a key
+    __slots__ = ()
+
+
+class OverflowQueueMixin:
+    """
+    Storage of a bounded queue applying an OverflowPolicy, shared by the asyncio
+    and the thread-safe queue below through the _init/_qsize/_put/_get hooks
+    both standard queues implement.
+
+    The standard queue only enforces maxsize (by blocking) for OverflowPolicy.BLOCK;
+    for the other policies it is unbounded, and the capacity is enforced here
+    by dropping or coalescing items instead. Items without a key (markers such as
+    a LogMarker, and the None shutdown sentinel) are never dropped, and dropped
+    counts only the items that were.
+    """
+
+    def _configure(self, maxsize: int, overflow: OverflowPolicy, key) -> int:
+        self._overflow = OverflowPolicy(overflow)
+        self._capacity = maxsize
+        # returns the device id of an item, or None for items never coalesced
+        self._key = key
+        self.dropped = 0
+        self.coalesced = 0
+        return maxsize if self._overflow == OverflowPolicy.BLOCK else 0
+
+    def _init(self, maxsize: int) -> None:
+        # queued items, or the keys of queued items when coalescing
+        self._queue = deque()
+        # key -> newest queued item, when coalescing
+        self._pending = {}
+
+    def _qsize(self) -> int:
+        return len(self._queue)
+
+    def _put(self, item) -> None:
+        if self._overflow != OverflowPolicy.COALESCE:
+            if self._capacity and len(self._queue) >= self._capacity:
+                # only reached when dropping, blocking queues never overfill
+                self._drop_oldest()
+            self._queue.append(item)
+            return
+
+        key = self._key(item) if item is not None else None
+        if key is not None and key in self._pending:
+            # replace the queued item of the device, keeping its place in the queue
+            self._pending[key] = item
+            self.coalesced += 1
+            return
+
+        if self._capacity and len(self._queue) >= self._capacity:
+            self._drop_oldest()
+
+        if key is None:
+            # a slot of its own
+            key = _OwnSlot()
+        self._pending[key] = item
+        self._queue.append(key)
+
+    def _droppable(self, queued) -> bool:
+        if self._overflow == OverflowPolicy.COALESCE:
+            return not isinstance(queued, _OwnSlot)
+        return queued is not None and (self._key is None or self._key(queued) is not None)
+
+    def _drop_oldest(self) -> None:
+        for index, queued in enumerate(self._queue):
+            if self._droppable(queued):
+                break
+        else:
+            # nothing but markers queued, let the queue overfill
+            return
+
+        if index == 0:
+            self._queue.popleft()
+        else:
+            del self._queue[index]
+        if self._overflow == OverflowPolicy.COALESCE:
+            del self._pending[queued]
+        self.dropped += 1
+
+    def _get(self):
+        if self._overflow != OverflowPolicy.COALESCE:
+            return self._queue.popleft()
+        return self._pending.pop(self._queue.popleft())
+
+    def stats(self) -> dict:
+        return {
+            "overflow": self._overflow.value,
+            "maxsize": self._capacity,
+            "depth": len(self._queue),
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class PacketQueue(OverflowQueueMixin, asyncio.Queue):
+    """
+    asyncio.Queue of device packets, bounded to maxsize packets (0 for unbounded).
+    When it is full, senders wait (OverflowPolicy.BLOCK), or the oldest packet is dropped,
+    or a new packet replaces the queued packet of the same device.
+    """
+
+    def __init__(self, maxsize: int = 0, overflow: OverflowPolicy = OverflowPolicy.BLOCK, key=None):
+        super().__init__(self._configure(maxsize, overflow, key))
+
+
+class StorageQueue(OverflowQueueMixin, queue.Queue):
+    """
+    Thread-safe queue of payloads to log, bounded like PacketQueue.
+    Coalescing keeps only the newest queued payload of every device,
+    so the history log skips intermediate states under overload.
+    """
+
+    def __init__(self, maxsize: int = 0, overflow: OverflowPolicy = OverflowPolicy.BLOCK, key=None):
+        super().__init__(self._configure(maxsize, overflow, key))
@@ -0,0 +1,161 @@
+import mmap
+import os
+import pickle
+import struct
+from dataclasses import dataclass
+
+from .HistoryLog import (
+    LogFormat,
+    BinaryLogEncoder,
+    FILE_HEADER,
+    read_records,
+    scan_records,
+    parse_text_record,
+)
+from .LogRotation import OPENERS, SUFFIXES, list_segments
+
+# snapshot layout (all little endian):
+#
+#   header:    magic "ECOS", u16 version, u8 log format, u8 has log position,
+#              f64 creation time (epoch seconds), u32 log segment, u64 log offset,
+#              u64 payloads length, u64 analytics length
+#   payloads:  the latest payload of every device, as a binary history log
+#   analytics: pickled WindowedAnalytics.state(), if any
+MAGIC = b"ECOS"
+VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHBBdIQQQ")
+
+FORMAT_CODES = {LogFormat.TEXT: 0, LogFormat.BINARY: 1}
+
+
+@dataclass(slots=True)
+class ControllerState:
+    """
+    What a controller needs to resume without its devices reconnecting.
+    """
+
+    # latest payload of every known device
+    payloads: list
+    # WindowedAnalytics.state(), if the controller has analytics
+    analytics: tuple | None
+    # history log position (segment number, offset) up to which the state is complete
+    log_position: tuple[int, int] | None
+    log_format: LogFormat
+    created: float
+
+
+def write_snapshot(path: str, state: ControllerState) -> int:
+    """
+    Writes the state to path (replacing it only once complete).
+    Returns the size of the snapshot.
+    """
+    encoder = BinaryLogEncoder()
+    payloads = encoder.header() + encoder.encode(state.payloads)
+    analytics = pickle.dumps(state.analytics) if state.analytics is not None else b""
+    segment, offset = state.log_position if state.log_position is not None else (0, 0)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(
+            SNAPSHOT_HEADER.pack(
+                MAGIC,
+                VERSION,
+                FORMAT_CODES[state.log_format],
+                state.log_position is not None,
+                state.created,
+                segment,
+                offset,
+                len(payloads),
+                len(analytics),
+            )
+        )
+        file.write(payloads)
+        file.write(analytics)
+    os.replace(temporary, path)
+    return SNAPSHOT_HEADER.size + len(payloads) + len(analytics)
+
+
+def read_snapshot(path: str) -> ControllerState:
+    with open(path, "rb") as file:
+        data = file.read()
+
+    (
+        magic,
+        version,
+        log_format,
+        has_position,
+        created,
+        segment,
+        offset,
+        payloads_length,
+        analytics_length,
+    ) = SNAPSHOT_HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a controller snapshot")
+
+    start = SNAPSHOT_HEADER.size + FILE_HEADER.size
+    end = SNAPSHOT_HEADER.size + payloads_length
+    payloads = list(read_records(data, start, end, [], []))
+    analytics = None
+    if analytics_length:
+        analytics = pickle.loads(data[end : end + analytics_length])
+
+    return ControllerState(
+        payloads=payloads,
+        analytics=analytics,
+        log_position=(segment, offset) if has_position else None,
+        log_format=next(key for key, code in FORMAT_CODES.items() if code == log_format),
+        created=created,
+    )
+
+
+def _read_log(buffer, log_format: LogFormat, offset: int):
+    if log_format == LogFormat.BINARY:
+        # the strings interned before offset
+        device_ids, names = [], []
+        offset = max(offset, FILE_HEADER.size)
+        scan_records(buffer, FILE_HEADER.size, offset, device_ids, names)
+        end = scan_records(buffer, offset, len(buffer), [], [])
+        yield from read_records(buffer, offset, end, device_ids, names)
+        return
+
+    # leave out a line still being written
+    end = buffer.rfind(b"\n") + 1
+    for line in buffer[offset:end].decode().splitlines():
+        if line.strip():
+            yield parse_text_record(line)
+
+
+def read_log_tail(path: str, log_format: LogFormat, position: tuple[int, int], active_segment: int):
+    """
+    Yields the payloads logged after position (segment number, offset): the rest of
+    that segment, then every later sealed segment (compressed or not), then the log
+    being written, which becomes segment active_segment when sealed.
+    Segments removed by retention are skipped.
+    """
+    segment, offset = position
+
+    sources = [
+        (number, segment_file)
+        for number, segment_file in list_segments(path)
+        if segment <= number < active_segment
+    ]
+    if os.path.exists(path):
+        sources.append((active_segment, path))
+
+    for number, source in sources:
+        start = offset if number == segment else 0
+        compression = next(
+            (compression for compression, suffix in SUFFIXES.items() if suffix and source.endswith(suffix)),
+            None,
+        )
+        if compression is not None:
+            with OPENERS[compression](source, "rb") as file:
+                yield from _read_log(file.read(), log_format, start)
+            continue
+
+        with open(source, "rb") as file:
+            if os.fstat(file.fileno()).st_size <= start:
+                continue
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                yield from _read_log(buffer, log_format, start)
@@ -0,0 +1,285 @@
+from array import array
+from itertools import compress
+
+from models.devices import DevicePayload
+from .AnalyticsEngine import INDOOR_LOCATIONS
+from .HistoryLog import LOCATIONS, LOCATION_INDEX, to_epoch_us, from_epoch_us
+from .PacketCodec import SCHEMAS, PayloadSchema
+
+# array typecode for every schema field format
+TYPECODES = {"d": "d", "?": "b", "i": "i", "T": "q"}
+
+INDOOR_FLAGS = [location in INDOOR_LOCATIONS for location in LOCATIONS]
+
+
+class DeviceTable:
+    """
+    Latest state of every device of one type, one typed array per field.
+    Removed rows are filled with the last row, so rows stay contiguous.
+    """
+
+    def __init__(self, schema: PayloadSchema):
+        self.schema = schema
+        self.device_ids: list[str] = []
+        self.names: list[str] = []
+
+        # columns every device type has
+        self.location = array("B")
+        self.indoor = array("b")
+        self.timestamp = array("q")
+
+        self.columns = {
+            name: array(TYPECODES[format_]) for name, format_ in schema.fields
+        }
+        self._timestamp_fields = frozenset(schema.timestamp_fields)
+
+    def _values(self, payload: DevicePayload):
+        for name in self.schema.field_names:
+            value = getattr(payload, name)
+            if name in self._timestamp_fields:
+                value = to_epoch_us(value)
+            yield name, value
+
+    def append(self, payload: DevicePayload) -> int:
+        """
+        Adds a row for a new device and returns its index.
+        """
+        location = LOCATION_INDEX[payload.location]
+        self.device_ids.append(payload.device_id)
+        self.names.append(payload.name)
+        self.location.append(location)
+        self.indoor.append(INDOOR_FLAGS[location])
+        self.timestamp.append(to_epoch_us(payload.timestamp))
+        for name, value in self._values(payload):
+            self.columns[name].append(value)
+        return len(self.device_ids) - 1
+
+    def set(self, row: int, payload: DevicePayload) -> None:
+        location = LOCATION_INDEX[payload.location]
+        self.names[row] = payload.name
+        self.location[row] = location
+        self.indoor[row] = INDOOR_FLAGS[location]
+        self.timestamp[row] = to_epoch_us(payload.timestamp)
+        for name, value in self._values(payload):
+            self.columns[name][row] = value
+
+    def remove(self, row: int) -> str | None:
+        """
+        Removes a row by moving the last row into it.
+        Returns the id of the device that moved, if any.
+        """
+        last = len(self.device_ids) - 1
+        columns = (
+            self.device_ids,
+            self.names,
+            self.location,
+            self.indoor,
+            self.timestamp,
+            *self.columns.values(),
+        )
+        for column in columns:
+            column[row] = column[last]
+            column.pop()
+
+        return self.device_ids[row] if row != last else None
+
+    def payload(self, row: int) -> DevicePayload:
+        fields = {name: column[row] for name, column in self.columns.items()}
+        for name in self._timestamp_fields:
+            fields[name] = from_epoch_us(fields[name])
+        for name, format_ in self.schema.fields:
+            if format_ == "?":
+                fields[name] = bool(fields[name])
+
+        return self.schema.payload_class(
+            device_id=self.device_ids[row],
+            name=self.names[row],
+            location=LOCATIONS[self.location[row]],
+            timestamp=from_epoch_us(self.timestamp[row]),
+            **fields,
+        )
+
+    def nbytes(self) -> int:
+        """
+        Size of the numeric columns (the device ids and names are shared with the devices).
+        """
+        columns = (self.location, self.indoor, self.timestamp, *self.columns.values())
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def __len__(self) -> int:
+        return len(self.device_ids)
+
+
+class ColumnarStore:
+    """
+    Latest payload of every device, stored column-wise in one DeviceTable per device type.
+
+    Compared to one payload object per device, this keeps a few bytes per field
+    instead of a Python object per field, and lets rules run over whole columns.
+    Running sums of the thermostat columns behind the metrics are kept up to date
+    on every upsert and remove, like MetricsAccumulator does.
+    """
+
+    def __init__(self):
+        self._tables = {device_type: DeviceTable(schema) for device_type, schema in SCHEMAS.items()}
+        self._table_list = list(self._tables.values())
+        self._table_numbers = {
+            table.schema.payload_class: number for number, table in enumerate(self._table_list)
+        }
+        # device id -> row * number of tables + table number,
+        # a single int per device rather than a (table, row) tuple
+        self._rows: dict[str, int] = {}
+
+        self._thermostats = self._tables["THERMOSTAT"]
+        # current temperature of indoor thermostats and humidity of all thermostats
+        self._temperature_sum = 0.0
+        self._humidity_sum = 0.0
+
+    def _apply_thermostat(self, row: int, sign: int) -> None:
+        thermostats = self._thermostats
+        if thermostats.indoor[row]:
+            self._temperature_sum += sign * thermostats.columns["current_temp"][row]
+        self._humidity_sum += sign * thermostats.columns["humidity"][row]
+
+    def _locate(self, device_id: str) -> tuple[DeviceTable, int] | None:
+        key = self._rows.get(device_id)
+        if key is None:
+            return None
+        row, number = divmod(key, len(self._table_list))
+        return self._table_list[number], row
+
+    def upsert(self, payload: DevicePayload) -> None:
+        number = self._table_numbers[type(payload)]
+        table = self._table_list[number]
+        key = self._rows.get(payload.device_id)
+
+        if key is None:
+            row = table.append(payload)
+            self._rows[payload.device_id] = row * len(self._table_list) + number
+        else:
+            row = key // len(self._table_list)
+            if table is self._thermostats:
+                self._apply_thermostat(row, -1)
+            table.set(row, payload)
+        if table is self._thermostats:
+            self._apply_thermostat(row, 1)
+
+    def remove(self, device_id: str) -> None:
+        location = self._locate(device_id)
+        if location is None:
+            return
+
+        table, row = location
+        if table is self._thermostats:
+            self._apply_thermostat(row, -1)
+        del self._rows[device_id]
+        moved = table.remove(row)
+        if moved is not None:
+            number = self._table_numbers[table.schema.payload_class]
+            self._rows[moved] = row * len(self._table_list) + number
+
+    def payload(self, device_id: str) -> DevicePayload | None:
+        """
+        Materializes the latest payload of a device, for code paths that need an object.
+        """
+        location = self._locate(device_id)
+        if location is None:
+            return None
+        table, row = location
+        return table.payload(row)
+
+    def payloads(self):
+        for table in self._table_list:
+            for row in range(len(table)):
+                yield table.payload(row)
+
+    def table(self, device_type: str) -> DeviceTable:
+        return self._tables[device_type]
+
+    def column(self, device_type: str, name: str) -> array:
+        return self._tables[device_type].columns[name]
+
+    def where(self, device_type: str, name: str, compare, threshold) -> list[str]:
+        """
+        Returns the ids of the devices whose field satisfies compare(value, threshold),
+        e.g. store.where("THERMOSTAT", "current_temp", operator.gt, 30.0).
+        """
+        table = self._tables[device_type]
+        column = table.columns[name]
+        return list(compress(table.device_ids, [compare(value, threshold) for value in column]))
+
+    def recompute_sums(self) -> None:
+        """
+        Rebuilds the running sums from the thermostat columns, discarding accumulated
+        floating point drift.
+        """
+        thermostats = self._thermostats
+        self._temperature_sum = sum(compress(thermostats.columns["current_temp"], thermostats.indoor))
+        self._humidity_sum = sum(thermostats.columns["humidity"])
+
+    def metric_sums(self) -> tuple[float, float, int]:
+        """
+        Returns the temperature and humidity sums and the number of thermostats.
+        """
+        return self._temperature_sum, self._humidity_sum, len(self._thermostats)
+
+    def get_metrics(self) -> dict:
+        """
+        Same metrics as AnalyticsEngine.get_metrics, from the running sums.
+        total_connected_devices counts devices that reported a payload.
+        """
+        temperature_sum, humidity_sum, total_thermostats = self.metric_sums()
+
+        return {
+            "average_temperature": (
+                temperature_sum / total_thermostats if total_thermostats > 0 else 0.0
+            ),
+            "average_humidity": (
+                humidity_sum / total_thermostats if total_thermostats > 0 else 0.0
+            ),
+            "total_connected_devices": len(self._rows),
+        }
+
+    def nbytes(self) -> int:
+        return sum(table.nbytes() for table in self._table_list)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class ColumnarMetrics:
+    """
+    Drop-in replacement of MetricsAccumulator for controllers keeping their state
+    in a ColumnarStore: the store keeps the running sums as payloads are stored,
+    so payload updates cost nothing here.
+    """
+
+    def __init__(self, store: ColumnarStore):
+        self._store = store
+        self._total_devices = 0
+
+    def add(self, payload) -> None:
+        self._total_devices += 1
+
+    def remove(self, payload) -> None:
+        self._total_devices -= 1
+
+    def update(self, old, new) -> None:
+        # the store is updated by the registry
+        pass
+
+    def recompute(self, connected_devices) -> None:
+        self._store.recompute_sums()
+        self._total_devices = len(connected_devices)
+
+    def metrics(self) -> dict:
+        metrics = self._store.get_metrics()
+        # devices that connected without a payload count as well
+        metrics["total_connected_devices"] = self._total_devices
+        return metrics
+
+    def state(self) -> tuple:
+        return (*self._store.metric_sums(), self._total_devices)
@@ -0,0 +1,153 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from time import perf_counter_ns
+
+from models.devices import SmartDevice, DeviceCommand
+from .Instrumentation import Instrumentation
+from .Reporter import Reporter
+
+
+@dataclass(slots=True)
+class CommandResult:
+    """
+    Acknowledgement of a command, sent back by the device.
+    """
+
+    device_id: str
+    command: DeviceCommand
+    # None if the device applied the command
+    error: str | None
+    # time from sending the command to its acknowledgement
+    latency_ms: float
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class CommandDispatcher:
+    """
+    Delivers commands to devices from a task of its own, so the consume loop
+    only queues them and never waits for device-side work.
+
+    Every device has its own queue of pending commands; the commands queued for
+    a device by the time the dispatcher gets to it are delivered together,
+    with a single receive_commands() call (one message, for remote devices).
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 64,
+        on_result=None,
+        instrumentation: Instrumentation | None = None,
+        reporter: Reporter | None = None,
+    ):
+        """
+        batch_size is the number of devices served before the dispatcher
+        lets other tasks run. on_result is called with every CommandResult.
+
+        A device raising while receiving its commands fails them, and the error is
+        reported through the reporter (printed if there is none); the dispatcher
+        keeps serving the other devices.
+        """
+        self._batch_size = batch_size
+        self._on_result = on_result
+        self._instruments = instrumentation
+        self._reporter = reporter
+
+        # device id -> commands waiting to be delivered, with the time they were sent
+        self._queues: dict[str, deque[tuple[DeviceCommand, int]]] = {}
+        # devices with pending commands, in the order their first command was sent
+        self._ready: asyncio.Queue[tuple[str, SmartDevice]] = asyncio.Queue()
+        self._pending = 0
+
+        self._acknowledged = 0
+        self._failed = 0
+        self._deliveries = 0
+        self._latency_ms = 0.0
+        self._max_latency_ms = 0.0
+
+    def send(self, device_id: str, device: SmartDevice, command: DeviceCommand) -> None:
+        """
+        Queues a command for a device without waiting.
+        """
+        commands = self._queues.get(device_id)
+        if commands is None:
+            commands = self._queues[device_id] = deque()
+            self._ready.put_nowait((device_id, device))
+        commands.append((command, perf_counter_ns()))
+        self._pending += 1
+
+    async def run(self) -> None:
+        while True:
+            served = 0
+            device_id, device = await self._ready.get()
+            while True:
+                await self._deliver(device_id, device)
+                served += 1
+                if served >= self._batch_size or self._ready.empty():
+                    break
+                device_id, device = self._ready.get_nowait()
+
+            # let the consume loop run between batches of devices
+            await asyncio.sleep(0)
+
+    async def _deliver(self, device_id: str, device: SmartDevice) -> None:
+        queued = self._queues.pop(device_id)
+        self._pending -= len(queued)
+        commands = [command for command, _ in queued]
+
+        try:
+            errors = await device.receive_commands(commands)
+        except OSError as error:
+            # the device could not be reached
+            errors = [str(error)] * len(commands)
+        except Exception as error:
+            # a faulty device must not stop deliveries to the others
+            errors = [repr(error)] * len(commands)
+            message = f"[ERROR]: delivering commands to device {device_id} failed: {error!r}"
+            if self._reporter is not None:
+                self._reporter.message(message)
+            else:
+                print(message)
+
+        acknowledged = perf_counter_ns()
+        self._deliveries += 1
+        for (command, sent), error in zip(queued, errors):
+            latency_ns = acknowledged - sent
+            result = CommandResult(device_id, command, error, latency_ns / 1e6)
+            self._record(result, latency_ns)
+            if self._on_result is not None:
+                self._on_result(result)
+
+    def _record(self, result: CommandResult, latency_ns: int) -> None:
+        if result.ok:
+            self._acknowledged += 1
+        else:
+            self._failed += 1
+        self._latency_ms += result.latency_ms
+        self._max_latency_ms = max(self._max_latency_ms, result.latency_ms)
+
+        if self._instruments is not None:
+            self._instruments.record("command_dispatch", latency_ns)
+            self._instruments.count("commands_acknowledged" if result.ok else "commands_failed")
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of commands waiting to be delivered.
+        """
+        return self._pending
+
+    def stats(self) -> dict:
+        results = self._acknowledged + self._failed
+        return {
+            "pending": self._pending,
+            "devices_waiting": len(self._queues),
+            "acknowledged": self._acknowledged,
+            "failed": self._failed,
+            "average_commands_per_delivery": results / self._deliveries if self._deliveries else 0.0,
+            "average_latency_ms": self._latency_ms / results if results else 0.0,
+            "max_latency_ms": self._max_latency_ms,
+        }
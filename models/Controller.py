@@ -1,22 +1,185 @@
 import asyncio
+import os
 import queue
 import threading
+import time
+from dataclasses import replace
+from operator import attrgetter
+from time import perf_counter_ns
 
 from models.AnalyticsEngine import AnalyticsEngine
-from models.devices import SmartDevice, DevicePayload
+from models.devices import SmartDevice, SetTargetTemp, TakeSnapshot, TurnOff, Resync
+from .BoundedQueue import PacketQueue, StorageQueue
+from .Checkpoint import ControllerState, write_snapshot, read_snapshot, read_log_tail
+from .ColumnarStore import ColumnarStore, ColumnarMetrics
+from .CommandDispatcher import CommandDispatcher
 from .CriticalEvent import CriticalEvent
-from .StorageWorker import StorageWorker
+from .DecodePool import DecodePool
+from .DeltaMerger import DeltaMerger
+from .DeviceRegistry import DeviceRegistry
+from .EventDeduplicator import EventDeduplicator
+from .Instrumentation import Instrumentation
+from .LazyDecoder import LazyDecoder
+from .MetricsAccumulator import MetricsAccumulator
+from .OverflowPolicy import OverflowPolicy
+from .PacketCodec import CODECS, negotiate_codec, packet_queue_key
+from .Reporter import Reporter
+from .RulesEngine import RulesEngine
+from .HistoryLog import LogFormat
+from .StorageWorker import StorageWorker, LogMarker
+from .WindowedAnalytics import WindowedAnalytics
 
 
 class Controller:
-    def __init__(self):
+    def __init__(
+        self,
+        batch_size: int = 1,
+        batch_latency_ms: float = 0.0,
+        storage_options: dict | None = None,
+        storage_queue: queue.Queue | None = None,
+        codecs: tuple[str, ...] = ("json",),
+        columnar_state: bool = False,
+        rules: RulesEngine | None = None,
+        instrumentation: Instrumentation | None = None,
+        packet_queue_size: int = 0,
+        packet_overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        storage_queue_size: int = 0,
+        storage_overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        deduplicator: EventDeduplicator | None = None,
+        dispatcher: CommandDispatcher | None = None,
+        analytics: WindowedAnalytics | None = None,
+        reporter: Reporter | None = None,
+        checkpoint_path: str | None = None,
+        checkpoint_interval: float = 60.0,
+        lazy_decoding: bool = False,
+        log_heartbeats: bool = True,
+        decode_workers: int = 0,
+        offload_batch_size: int = 256,
+    ):
+        """
+        batch_size and batch_latency_ms control micro-batching in consume():
+        up to batch_size packets are processed together, waiting at most
+        batch_latency_ms for a batch to fill up. The defaults process
+        every packet on its own, as soon as it arrives.
+
+        storage_options are passed on to the StorageWorker
+        (group commit batch size and latency, durability policy).
+        If a storage_queue is given, payloads are logged through it instead,
+        and no storage worker is started (the owner of the queue runs one).
+
+        codecs lists the packet codecs the controller accepts, in order of preference;
+        each device is assigned the first one it supports when it connects.
+        Devices assigned a delta codec ("json-delta", "binary-delta") send keyframes and
+        only their changed fields in between, merged back into payloads by a DeltaMerger;
+        a device whose packets were lost is sent a Resync command.
+
+        If columnar_state is set, the latest payloads are kept in a ColumnarStore
+        (typed arrays per device type) instead of one payload object per device.
+
+        rules decide which payloads are critical events (the default rules
+        if not given), and can be reloaded while the controller runs.
+
+        If instrumentation is given, the time spent in every stage of packet processing
+        is recorded in it, along with packet counters and queue depth gauges.
+        Without it, every stage costs a single extra check.
+
+        packet_queue_size and storage_queue_size bound the packet and storage queues
+        (0 for unbounded), and packet_overflow and storage_overflow select what happens
+        when they are full (see OverflowPolicy): senders wait, the oldest item is dropped,
+        or only the newest queued item of every device is kept. Delta packets are
+        never dropped or coalesced, only keyframes and full packets.
+
+        If a deduplicator is given, critical events and device commands pass through it,
+        so sustained alarms are not handled (and printed) on every payload.
+
+        Commands are delivered to devices by the dispatcher (a CommandDispatcher
+        with default settings if not given), which consume() runs alongside itself.
+
+        If analytics are given, every processed payload is recorded in them, for rolling
+        per location and per device type statistics.
+
+        If a reporter is given, metrics, critical events and the output of connected
+        devices are written by it, at its refresh rate; otherwise they are printed
+        as they happen, metrics after every batch.
+
+        If checkpoint_path is given, consume() snapshots the device registry and
+        the analytics there every checkpoint_interval seconds (see checkpoint), and
+        warm_start() restores the latest snapshot after a restart.
+
+        If lazy_decoding is set, packets are only decoded if their content changed
+        (see LazyDecoder); the others are heartbeats, refreshing the device's last
+        seen time (DeviceRegistry.last_seen) and counted in the analytics with the
+        device's latest payload. With a delta codec, packets are merged instead, and
+        deltas without changes are the heartbeats. Heartbeats are logged to storage as
+        the device's latest payload with the heartbeat's send time, so the history log
+        keeps every packet, unless log_heartbeats is unset.
+
+        With decode_workers, batches of at least offload_batch_size packets are decoded
+        and evaluated by the rules in a process pool of that many workers (see DecodePool),
+        while the event loop keeps taking in packets and delivering commands; smaller
+        batches are decoded in place. This cannot be combined with lazy decoding or
+        delta codecs, which decode against the latest state of every device.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
         # storing received packets
-        self._packet_queue = asyncio.Queue()
-        self._connected_devices: dict[SmartDevice, DevicePayload] = {}
+        self._packet_queue = PacketQueue(packet_queue_size, packet_overflow, packet_queue_key)
+        self._batch_size = batch_size
+        self._batch_latency_ms = batch_latency_ms
+        self._codecs = codecs
+        self._rules = rules if rules is not None else RulesEngine()
+        # connected devices and their latest payloads, indexed by device id
+        self._state_store = ColumnarStore() if columnar_state else None
+        self._connected_devices = DeviceRegistry(self._state_store)
+        if self._state_store is not None:
+            # metrics are computed over the store's columns
+            self._metrics = ColumnarMetrics(self._state_store)
+        else:
+            # running metrics, updated with every stored payload
+            self._metrics = MetricsAccumulator()
+        # number of packets processed so far
+        self._processed_packets = 0
+        self._instruments = instrumentation
+        self._deduplicator = deduplicator
+        self._analytics = analytics
+        self._reporter = reporter
+        self._checkpoint_path = checkpoint_path
+        self._checkpoint_interval = checkpoint_interval
+        self._decoder = LazyDecoder() if lazy_decoding else None
+        self._log_heartbeats = log_heartbeats
+        self._deltas = (
+            DeltaMerger(self._request_resync)
+            if any(name in CODECS and CODECS[name].delta for name in codecs)
+            else None
+        )
+        if decode_workers and (self._decoder is not None or self._deltas is not None):
+            raise ValueError("decode_workers cannot be combined with lazy decoding or delta codecs")
+        self._offload = DecodePool(decode_workers, offload_batch_size) if decode_workers else None
+        self._dispatcher = (
+            dispatcher
+            if dispatcher is not None
+            else CommandDispatcher(instrumentation=instrumentation, reporter=reporter)
+        )
+
+        if storage_queue is not None:
+            # storage is handled by the owner of the queue
+            self._storage_queue = storage_queue
+            self._storage_worker = None
+            self._storage_worker_thread = None
+            self._register_gauges()
+            return
 
         # initialize storage queue and storage worker
-        self._storage_queue = queue.Queue()
-        self._storage_worker = StorageWorker(self._storage_queue)
+        self._storage_queue = StorageQueue(
+            storage_queue_size, storage_overflow, attrgetter("device_id")
+        )
+        self._storage_worker = StorageWorker(
+            self._storage_queue,
+            **(storage_options or {}),
+            instrumentation=instrumentation,
+        )
+        self._register_gauges()
 
         # start storage worker in a separate thread
         self._storage_worker_thread = threading.Thread(
@@ -25,54 +188,87 @@ class Controller:
         )
         self._storage_worker_thread.start()
 
-    async def connect(self, device: SmartDevice, payload: str) -> asyncio.Queue:
+    def _register_gauges(self) -> None:
+        if self._instruments is None:
+            return
+        self._instruments.register_gauge("packet_queue_depth", self._queued_packets)
+        self._instruments.register_gauge("storage_queue_depth", self._storage_queue.qsize)
+        self._instruments.register_gauge("queues", self.queue_stats)
+        self._instruments.register_gauge("command_queue_depth", lambda: self._dispatcher.pending)
+
+    def _queued_packets(self) -> int:
+        return self._packet_queue.qsize()
+
+    async def connect(
+        self, device: SmartDevice, payload: str, codecs: tuple[str, ...] = ()
+    ) -> asyncio.Queue:
         """
         Adds the device to the list of connected devices
         and returns the packet queue to be used by the device to send packets.
+        codecs are the packet codecs the device offers.
         """
+        self._negotiate_codec(device, codecs)
+        device.set_reporter(self._reporter)
+
         # parse payload into DevicePayload object
-        device_payload = AnalyticsEngine.parse_payload(payload)
-        self._connected_devices[device] = device_payload
+        device_payload = next(AnalyticsEngine.parse_payload(payload), None)
+        device_id = str(device.id)
+        if device_id in self._connected_devices:
+            # device reconnected, drop its previous state from the metrics
+            self._metrics.remove(self._connected_devices.get_payload(device_id))
+
+        self._connected_devices.register(device, device_payload)
+        self._metrics.add(device_payload)
+        if self._decoder is not None:
+            self._decoder.forget(device_id)
+        if self._deltas is not None:
+            self._deltas.forget(device_id)
         return self._packet_queue
 
+    def _negotiate_codec(self, device: SmartDevice, codecs: tuple[str, ...]) -> None:
+        device.set_codec(negotiate_codec(codecs, self._codecs))
+
+    def _request_resync(self, device_id: str) -> None:
+        # devices known only from a checkpoint are resynced by their next keyframe
+        device = self._connected_devices.lookup(device_id)
+        if device is not None:
+            self._dispatcher.send(device_id, device, Resync())
+
     def handle_critical_event(self, payload, critical_event):
         # get device object using device id given in payload
-        device = next(
-            (
-                device
-                for device in self._connected_devices
-                if str(device.id) == payload.device_id
-            )
-        )
+        device = self._connected_devices.lookup(payload.device_id)
+        if device is None:
+            return
 
+        command = None
         if critical_event == CriticalEvent.LOW_TEMPERATURE:
             # set to a safe temperature if not set to one
             if payload.target_temp < 20.0:
-                device.execute_command("set_target_temp 20.0")
-                print(
+                command = SetTargetTemp(20.0)
+                message = (
                     f"[CRITICAL]: {device.name} temperature too low! Adjusting target temperature."
                 )
         elif critical_event == CriticalEvent.HIGH_TEMPERATURE:
             # set to a safe, non-freezing temperature if not set to one
             if payload.target_temp > 18.0:
-                device.execute_command("set_target_temp 18.0")
-                print(
+                command = SetTargetTemp(18.0)
+                message = (
                     f"[CRITICAL]: {device.name} temperature too high! Adjusting target temperature."
                 )
         elif critical_event == CriticalEvent.LOW_HUMIDITY:
             # increase humidity by adjusting target temperature
             # if not already set to a high temp
             if payload.target_temp < 22.0:
-                device.execute_command("set_target_temp 22.0")
-                print(
+                command = SetTargetTemp(22.0)
+                message = (
                     f"[CRITICAL]: {device.name} humidity too low! Adjusting target temperature to increase "
                     f"humidity."
                 )
         elif critical_event == CriticalEvent.HIGH_HUMIDITY:
             # decrease humidity by adjusting target temperature
             if payload.target_temp > 18.0:
-                device.execute_command("set_target_temp 18.0")
-                print(
+                command = SetTargetTemp(18.0)
+                message = (
                     f"[CRITICAL]: {device.name} humidity too high! Adjusting target temperature to decrease "
                     f"humidity."
                 )
@@ -80,57 +276,384 @@ class Controller:
         elif critical_event == CriticalEvent.MOTION_DETECTED:
             # take a snapshot (if camera is on)
             if payload.is_on:
-                device.execute_command("take_snapshot")
-                print(
+                command = TakeSnapshot()
+                message = (
                     f"[CRITICAL]: Motion detected by {device.name}! Attempting to take a snapshot."
                 )
         elif critical_event == CriticalEvent.LOW_BATTERY:
             # turn off camera to save power
             # if camera is on
             if payload.is_on:
-                device.execute_command("turn_off")
-                print(
+                command = TurnOff()
+                message = (
                     f"[CRITICAL]: {device.name} battery low! Turning off camera to save power."
                 )
 
+        if command is None:
+            return
+        if self._deduplicator is not None and not self._deduplicator.admit_command(payload, command):
+            # the device has not reported since it received the same command
+            return
+
+        # delivered by the dispatcher, without waiting for the device
+        self._dispatcher.send(payload.device_id, device, command)
+        if self._reporter is not None:
+            self._reporter.message(message)
+        else:
+            print(message)
+
     async def consume(self):
-        while True:
-            # wait for packets from devices
-            # this does not block, meaning device objects can still send packets
-            packets = await self._packet_queue.get()
-
-            # parse payloads from packets
-            payloads = list(AnalyticsEngine.parse_payload(packets))
-
-            # update connected device payloads
-            for payload in payloads:
-                # get device object using device id given in payload
-                device = next(
-                    (
-                        device
-                        for device in self._connected_devices
-                        if str(device.id) == payload.device_id
-                    )
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._dispatcher.run())
+            if self._checkpoint_path is not None:
+                tg.create_task(self._checkpoint_periodically())
+
+            try:
+                while True:
+                    # wait for packets from devices
+                    # this does not block, meaning device objects can still send packets
+                    packets = await self._next_batch()
+                    rows = None
+                    if self._offload is not None and self._offload.offloads(packets):
+                        rows = await self._decode_offloaded(packets)
+                    self._process_batch(packets, rows)
+
+                    if self._dispatcher.pending:
+                        # the packet queue may never run empty under load,
+                        # let the dispatcher deliver the commands of this batch
+                        await asyncio.sleep(0)
+            finally:
+                if self._offload is not None:
+                    self._offload.close()
+
+    async def _decode_offloaded(self, packets: list) -> list[tuple]:
+        instruments = self._instruments
+        if instruments is None:
+            return await self._offload.decode(packets, self._rules)
+        start = perf_counter_ns()
+        rows = await self._offload.decode(packets, self._rules)
+        instruments.record("offload", perf_counter_ns() - start)
+        return rows
+
+    async def _next_batch(self, packet_queue: asyncio.Queue | None = None) -> list:
+        """
+        Waits for the next packet, then keeps draining the packet queue until
+        either batch_size packets were collected or batch_latency_ms has passed
+        since the first one arrived.
+        """
+        if packet_queue is None:
+            packet_queue = self._packet_queue
+
+        packets = [await packet_queue.get()]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._batch_latency_ms / 1000
+        while len(packets) < self._batch_size:
+            try:
+                # take whatever is already queued without suspending
+                packets.append(packet_queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                packets.append(
+                    await asyncio.wait_for(packet_queue.get(), remaining)
                 )
-                # update stored payload
-                self._connected_devices[device] = payload
+            except TimeoutError:
+                break
+
+        return packets
+
+    def _process_batch(self, packets: list, rows: list[tuple] | None = None) -> list:
+        """
+        Processes a batch of packets and returns the payloads parsed from them.
+        rows are the packets as decoded and classified by the DecodePool, if they were.
+        """
+        instruments = self._instruments
+        if instruments is not None:
+            start = perf_counter_ns()
 
-            # filter and handle critical events
-            for payload, critical_event in AnalyticsEngine.filter_events(payloads):
-                self.handle_critical_event(payload, critical_event)
+        # parse payloads from packets
+        # (payloads from devices that never connected are ignored)
+        if rows is not None:
+            payloads, classified = self._offload.payloads(rows, self._connected_devices)
+            heartbeats = ()
+        elif self._deltas is not None:
+            payloads, heartbeats = self._deltas.decode(packets, self._connected_devices)
+        elif self._decoder is not None:
+            payloads, heartbeats = self._decoder.decode(packets, self._connected_devices)
+        else:
+            payloads = [
+                payload
+                for packet in packets
+                for payload in AnalyticsEngine.parse_payload(packet)
+                if payload.device_id in self._connected_devices
+            ]
+            heartbeats = ()
+        if instruments is not None:
+            parsed = perf_counter_ns()
+            instruments.record("parse", parsed - start)
 
-            metrics = AnalyticsEngine.get_metrics(self._connected_devices)
-            print(f"""
+        # only the latest payload of each device in the batch is applied
+        latest = {payload.device_id: payload for payload in payloads}
+
+        # update stored payloads of connected devices
+        for payload in latest.values():
+            previous = self._connected_devices.update(payload)
+            self._metrics.update(previous, payload)
+        for device_id, timestamp in heartbeats:
+            self._connected_devices.touch(device_id, timestamp)
+        if instruments is not None:
+            updated = perf_counter_ns()
+            instruments.record("registry_update", updated - parsed)
+
+        if self._analytics is not None:
+            # every payload of the batch, not only the latest ones
+            self._analytics.record(payloads)
+            if heartbeats:
+                get_payload = self._connected_devices.get_payload
+                self._analytics.record([get_payload(device_id) for device_id, _ in heartbeats])
+            if instruments is not None:
+                analyzed = perf_counter_ns()
+                instruments.record("analytics", analyzed - updated)
+                updated = analyzed
+
+        # filter and handle critical events, once per batch
+        if rows is not None:
+            # classified by the workers, only the latest payloads count
+            critical_events = [
+                (payload, event)
+                for payload, event in classified
+                if latest[payload.device_id] is payload
+            ]
+        else:
+            critical_events = self._rules.evaluate(latest.values())
+        if self._decoder is not None:
+            self._decoder.evaluated(latest.values(), critical_events)
+        if self._deduplicator is not None:
+            found = len(critical_events)
+            critical_events = self._deduplicator.filter(latest.keys(), critical_events)
+            if instruments is not None:
+                instruments.count("suppressed_events", found - len(critical_events))
+        if instruments is not None:
+            filtered = perf_counter_ns()
+            instruments.record("filter_events", filtered - updated)
+
+        for payload, critical_event in critical_events:
+            self.handle_critical_event(payload, critical_event)
+        if instruments is not None:
+            handled = perf_counter_ns()
+            instruments.record("handle_critical_event", handled - filtered)
+
+        self._processed_packets += len(packets)
+        self._report_metrics()
+        if instruments is not None:
+            reported = perf_counter_ns()
+
+        # send every payload (not only the latest ones) to storage queue
+        for payload in payloads:
+            self._storage_queue.put(payload)
+        if heartbeats and self._log_heartbeats:
+            # the latest payload, sent again at the heartbeat's time
+            get_payload = self._connected_devices.get_payload
+            for device_id, timestamp in heartbeats:
+                payload = get_payload(device_id)
+                if payload is not None:
+                    self._storage_queue.put(replace(payload, timestamp=timestamp))
+
+        if instruments is not None:
+            enqueued = perf_counter_ns()
+            instruments.record("storage_enqueue", enqueued - reported)
+            instruments.record("batch", enqueued - start)
+            instruments.count("batches")
+            instruments.count("packets", len(packets))
+            instruments.count("payloads", len(payloads))
+            instruments.count("heartbeats", len(heartbeats))
+            instruments.count("critical_events", len(critical_events))
+
+        return payloads
+
+    async def _checkpoint_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._checkpoint_interval)
+            await self.checkpoint()
+
+    async def checkpoint(self, path: str | None = None, timeout: float = 30.0) -> dict:
+        """
+        Snapshots the latest payload of every device and the analytics to path
+        (checkpoint_path if not given), along with the history log position up to which
+        they are complete. Only the copy of the state is taken on the event loop;
+        encoding and writing the snapshot happen in another thread.
+
+        Returns the number of devices, the size of the snapshot and the time spent,
+        or None if the storage worker did not reach the position within timeout.
+        """
+        if path is None:
+            path = self._checkpoint_path
+
+        start = perf_counter_ns()
+        state = ControllerState(
+            payloads=list(self._connected_devices.values()),
+            analytics=self._analytics.state() if self._analytics is not None else None,
+            log_position=None,
+            log_format=self._storage_worker.log_format if self._storage_worker is not None else LogFormat.TEXT,
+            created=time.time(),
+        )
+        # payloads processed so far are queued for storage before the marker
+        marker = LogMarker()
+        self._storage_queue.put(marker)
+        captured = perf_counter_ns()
+        if self._instruments is not None:
+            self._instruments.record("checkpoint_capture", captured - start)
+
+        state.log_position = await asyncio.to_thread(marker.wait, timeout)
+        if state.log_position is None:
+            return None
+        size = await asyncio.to_thread(write_snapshot, path, state)
+
+        return {
+            "devices": len(state.payloads),
+            "bytes": size,
+            "capture_ms": (captured - start) / 1e6,
+            "seconds": (perf_counter_ns() - start) / 1e9,
+        }
+
+    def warm_start(self, path: str | None = None) -> dict | None:
+        """
+        Restores the snapshot at path (checkpoint_path if not given) before consume()
+        starts, then replays the history log written after it, so metrics and analytics
+        cover every known device before any of them reconnects.
+        Devices known this way receive no commands until they connect.
+
+        The log is only replayed from a storage worker of this controller,
+        which must append to the log (the default).
+        Returns the number of devices restored and payloads replayed and the time
+        spent, or None if there is no snapshot.
+        """
+        if path is None:
+            path = self._checkpoint_path
+        if path is None or not os.path.exists(path):
+            return None
+
+        start = time.perf_counter()
+        state = read_snapshot(path)
+        for payload in state.payloads:
+            self._connected_devices.restore(payload)
+        if self._analytics is not None and state.analytics is not None:
+            self._analytics.restore(state.analytics)
+
+        replayed = 0
+        worker = self._storage_worker
+        if worker is not None and state.log_position is not None and state.log_format == worker.log_format:
+            # the worker cuts off a record left partially written before appending
+            worker.ready.wait()
+            for payload in read_log_tail(worker.path, worker.log_format, state.log_position, worker.active_segment):
+                self._connected_devices.restore(payload)
+                if self._analytics is not None and payload.timestamp is not None:
+                    # received about when it was sent
+                    self._analytics.record((payload,), now=payload.timestamp.timestamp())
+                replayed += 1
+
+        self._metrics.recompute(self._connected_devices)
+        return {
+            "devices": len(self._connected_devices),
+            "replayed": replayed,
+            "seconds": time.perf_counter() - start,
+        }
+
+    def _report_metrics(self) -> None:
+        if self._reporter is not None:
+            # metrics are only computed when the reporter will write them
+            if self._reporter.due():
+                self._reporter.metrics(self.get_metrics())
+            return
+
+        metrics = self.get_metrics()
+        print(f"""
             AVERAGE HOUSE TEMPERATURE: {metrics["average_temperature"]:.2f} °C
             AVERAGE HOUSE HUMIDITY: {metrics["average_humidity"]:.2f} %
             TOTAL CONNECTED DEVICES: {metrics["total_connected_devices"]}
             """)
 
-            # send payloads to storage queue
-            for payload in payloads:
-                self._storage_queue.put(payload)
+    def get_metrics(self, recompute: bool = False) -> dict:
+        """
+        Returns the current metrics.
+        If recompute is set, the running sums are rebuilt from all connected devices first.
+        """
+        instruments = self._instruments
+        if instruments is not None:
+            start = perf_counter_ns()
+
+        if recompute:
+            self._metrics.recompute(self._connected_devices)
+        metrics = self._metrics.metrics()
+
+        if instruments is not None:
+            instruments.record("get_metrics", perf_counter_ns() - start)
+        return metrics
+
+    @property
+    def analytics(self) -> WindowedAnalytics | None:
+        return self._analytics
+
+    @property
+    def reporter(self) -> Reporter | None:
+        return self._reporter
+
+    @property
+    def rules(self) -> RulesEngine:
+        return self._rules
+
+    @property
+    def instrumentation(self) -> Instrumentation | None:
+        return self._instruments
+
+    @property
+    def processed_packets(self) -> int:
+        return self._processed_packets
+
+    def queue_stats(self) -> dict:
+        """
+        Returns the depth of the packet and storage queues,
+        and how many items were dropped or coalesced because they were full.
+        """
+        return {
+            "packet_queue": self._packet_queue.stats(),
+            "storage_queue": self._storage_queue_stats(),
+        }
+
+    def _storage_queue_stats(self) -> dict:
+        stats = getattr(self._storage_queue, "stats", None)
+        if stats is None:
+            # a plain queue.Queue given by the caller, which never drops or coalesces
+            return {"depth": self._storage_queue.qsize()}
+        return stats()
+
+    def command_stats(self) -> dict:
+        return self._dispatcher.stats()
+
+    def decoding_stats(self) -> dict:
+        stats = self._decoder.stats() if self._decoder is not None else {}
+        if self._deltas is not None:
+            stats["delta"] = self._deltas.stats()
+        if self._offload is not None:
+            stats["offload"] = self._offload.stats()
+        return stats
+
+    def storage_stats(self) -> dict:
+        if self._storage_worker is None:
+            return {}
+        return self._storage_worker.stats()
 
     def end_storage_thread(self):
+        if self._storage_worker_thread is None:
+            # storage worker is owned by someone else
+            return
+
         # send None to storage queue to signal worker to stop
         self._storage_queue.put(None)
         self._storage_worker_thread.join()
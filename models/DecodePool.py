@@ -0,0 +1,115 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from models.devices import DevicePayload
+from .CriticalEvent import CriticalEvent
+from .HistoryLog import LOCATIONS, LOCATION_INDEX
+from .PacketCodec import SCHEMAS_BY_CLASS, SCHEMAS_BY_TAG, decode_packet
+from .RulesEngine import RulesEngine
+
+# row layout: schema tag, device id, name, location index, send time,
+# critical event value (0 for none), then the payload's fields in schema order
+FIELDS_START = 6
+
+
+def decode_rows(packets: list, rules: RulesEngine) -> list[tuple]:
+    """
+    Runs in a worker process: decodes packets and classifies their payloads,
+    returning a row of plain values per payload (see FIELDS_START), which pickle
+    far more cheaply than payload objects.
+    """
+    rows = []
+    for packet in packets:
+        payload = decode_packet(packet)
+        if payload is None:
+            continue
+        schema = SCHEMAS_BY_CLASS[type(payload)]
+        event = rules.classify(payload)
+        rows.append(
+            (
+                schema.tag,
+                payload.device_id,
+                payload.name,
+                LOCATION_INDEX[payload.location],
+                payload.timestamp,
+                event.value if event is not None else 0,
+            )
+            + schema.values(payload)
+        )
+    return rows
+
+
+class DecodePool:
+    """
+    Decodes batches of packets and evaluates the rules on them in a process pool,
+    off the event loop thread. Batches smaller than min_batch are not worth
+    shipping to another process and should be decoded in place.
+
+    A batch is split evenly between the workers; the pool is started on first use.
+    """
+
+    def __init__(self, workers: int = 2, min_batch: int = 256):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self._workers = workers
+        self.min_batch = min_batch
+        self._executor: ProcessPoolExecutor | None = None
+
+        self.batches = 0
+        self.packets = 0
+
+    def offloads(self, packets: list) -> bool:
+        return len(packets) >= self.min_batch
+
+    async def decode(self, packets: list, rules: RulesEngine) -> list[tuple]:
+        """
+        Returns the rows decoded from the packets (see decode_rows), in packet order.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        loop = asyncio.get_running_loop()
+
+        size = -(-len(packets) // self._workers)
+        chunks = await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, decode_rows, packets[start : start + size], rules)
+                for start in range(0, len(packets), size)
+            )
+        )
+        self.batches += 1
+        self.packets += len(packets)
+        return [row for chunk in chunks for row in chunk]
+
+    def payloads(
+        self, rows: list[tuple], registry
+    ) -> tuple[list[DevicePayload], list[tuple[DevicePayload, CriticalEvent]]]:
+        """
+        Turns rows back into the payloads of registered devices. Returns them, and
+        the (payload, critical event) pairs of those the workers found critical.
+        """
+        payloads = []
+        critical_events = []
+        for row in rows:
+            device_id = row[1]
+            if device_id not in registry:
+                continue
+            payload = SCHEMAS_BY_TAG[row[0]].payload_class(
+                device_id, row[2], LOCATIONS[row[3]], *row[FIELDS_START:], timestamp=row[4]
+            )
+            payloads.append(payload)
+            if row[5]:
+                critical_events.append((payload, CriticalEvent(row[5])))
+        return payloads, critical_events
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "min_batch": self.min_batch,
+            "batches": self.batches,
+            "packets": self.packets,
+        }
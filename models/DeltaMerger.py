@@ -0,0 +1,103 @@
+from datetime import datetime
+
+from models.devices import DevicePayload
+from .PacketCodec import decode_report, merge_delta
+
+
+class DeltaMerger:
+    """
+    Turns the packets of devices sending deltas (see DeltaReport) back into payloads,
+    merging every delta into the device's latest payload.
+
+    A delta is only merged if it follows the latest packet of its device: after a
+    gap (a lost or dropped packet, or a device the controller has no sequence number
+    for, e.g. after a restart), deltas of the device are dropped and on_gap is called
+    with its device id, once, until its next keyframe arrives.
+    Deltas without changes are heartbeats. Packets of codecs without deltas are
+    decoded as they are.
+    """
+
+    def __init__(self, on_gap=None):
+        self._on_gap = on_gap
+        # device id -> sequence number of the latest packet merged
+        self._sequences: dict[str, int] = {}
+        # devices waiting for a keyframe
+        self._resyncing: set[str] = set()
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.heartbeats = 0
+        self.gaps = 0
+        self.dropped = 0
+
+    def decode(self, packets, registry) -> tuple[list[DevicePayload], list[tuple[str, datetime]]]:
+        """
+        Returns the payloads of the packets of registered devices, and the
+        (device id, send time) of the heartbeats.
+        """
+        payloads = []
+        heartbeats = []
+        sequences = self._sequences
+        # device id -> payload merged in this batch, not in the registry yet
+        merged: dict[str, DevicePayload] = {}
+
+        for packet in packets:
+            report = decode_report(packet)
+            if report is None or report.device_id not in registry:
+                continue
+            device_id = report.device_id
+
+            if report.payload is not None:
+                if report.sequence is not None:
+                    sequences[device_id] = report.sequence
+                    self._resyncing.discard(device_id)
+                    self.keyframes += 1
+                merged[device_id] = report.payload
+                payloads.append(report.payload)
+                continue
+
+            expected = sequences.get(device_id)
+            if expected is None or report.sequence != expected + 1:
+                self._gap(device_id)
+                continue
+            sequences[device_id] = report.sequence
+            if not report.changes:
+                heartbeats.append((device_id, report.timestamp))
+                self.heartbeats += 1
+                continue
+
+            previous = merged.get(device_id) or registry.get_payload(device_id)
+            if previous is None:
+                self._gap(device_id)
+                continue
+            payload = merged[device_id] = merge_delta(previous, report)
+            payloads.append(payload)
+            self.deltas += 1
+
+        return payloads, heartbeats
+
+    def _gap(self, device_id: str) -> None:
+        self.dropped += 1
+        self._sequences.pop(device_id, None)
+        if device_id in self._resyncing:
+            return
+        self._resyncing.add(device_id)
+        self.gaps += 1
+        if self._on_gap is not None:
+            self._on_gap(device_id)
+
+    def forget(self, device_id: str) -> None:
+        """
+        Waits for a keyframe from the device, e.g. after it reconnected.
+        """
+        self._sequences.pop(device_id, None)
+        self._resyncing.discard(device_id)
+
+    def stats(self) -> dict:
+        return {
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+            "heartbeats": self.heartbeats,
+            "gaps": self.gaps,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,177 @@
+from datetime import datetime
+
+from models.devices import SmartDevice, DevicePayload
+from .DeviceLocation import DeviceLocation
+from .PacketCodec import SCHEMAS
+
+# payload class -> device type
+PAYLOAD_TYPES = {schema.payload_class: schema.device_type for schema in SCHEMAS.values()}
+
+
+class DeviceRegistry:
+    """
+    Index of connected devices keyed by device id.
+
+    Stores the device object together with its latest payload, and keeps
+    secondary indexes by device type and location so lookups never
+    scan the whole fleet.
+
+    If a store (e.g. a ColumnarStore) is given, payloads are kept in it instead of
+    as objects, and are only materialized when asked for.
+
+    Devices restored from a checkpoint or the history log (see restore) are known
+    by their payload only, until they connect again and register.
+    """
+
+    def __init__(self, store=None):
+        # device id -> (device object, None until it connects, latest payload)
+        self._devices: dict[str, tuple[SmartDevice | None, DevicePayload | None]] = {}
+        self._store = store
+
+        # device id -> send time of the latest heartbeat (see touch)
+        self._heartbeats: dict[str, datetime] = {}
+
+        # secondary indexes, holding device ids
+        self._by_type: dict[str, set[str]] = {}
+        self._by_location: dict[DeviceLocation, set[str]] = {}
+
+    def register(self, device: SmartDevice, payload: DevicePayload | None = None) -> str:
+        """
+        Adds the device (and its first payload, if any) to the registry.
+        Returns the device id the device is indexed by.
+        """
+        # device id is converted to a string only once, on registration
+        device_id = str(device.id)
+
+        if device_id in self._devices:
+            # re-registering replaces the previous entry
+            self.unregister(device_id)
+
+        if self._store is not None:
+            if payload is not None:
+                self._store.upsert(payload)
+            payload = None
+
+        self._devices[device_id] = (device, payload)
+        self._by_type.setdefault(device.device_type, set()).add(device_id)
+        self._by_location.setdefault(device.location, set()).add(device_id)
+        return device_id
+
+    def unregister(self, device_id: str) -> SmartDevice | None:
+        """
+        Removes the device from the registry and all indexes.
+        Returns the removed device, or None if it was not registered.
+        """
+        entry = self._devices.pop(device_id, None)
+        if entry is None:
+            return None
+
+        device, _ = entry
+        self._heartbeats.pop(device_id, None)
+        if self._store is not None:
+            self._store.remove(device_id)
+        if device is None:
+            # restored, indexed under the type and location of its payload
+            for device_ids in (*self._by_type.values(), *self._by_location.values()):
+                device_ids.discard(device_id)
+            return None
+        self._by_type[device.device_type].discard(device_id)
+        self._by_location[device.location].discard(device_id)
+        return device
+
+    def restore(self, payload: DevicePayload) -> DevicePayload | None:
+        """
+        Stores the latest payload of a device known from a checkpoint or the history log,
+        registering it without a device object if it is not registered yet.
+        Returns the previously stored payload (always None when payloads are kept in a store).
+        """
+        if payload.device_id in self._devices:
+            return self.update(payload)
+
+        self._devices[payload.device_id] = (None, payload if self._store is None else None)
+        if self._store is not None:
+            self._store.upsert(payload)
+        self._by_type.setdefault(PAYLOAD_TYPES[type(payload)], set()).add(payload.device_id)
+        self._by_location.setdefault(payload.location, set()).add(payload.device_id)
+        return None
+
+    def lookup(self, device_id: str) -> SmartDevice | None:
+        """
+        Returns the device object registered under the given id
+        (None for restored devices that did not connect yet).
+        """
+        entry = self._devices.get(device_id)
+        return entry[0] if entry is not None else None
+
+    def get_payload(self, device_id: str) -> DevicePayload | None:
+        """
+        Returns the latest payload stored for the given device id.
+        """
+        if self._store is not None:
+            return self._store.payload(device_id)
+
+        entry = self._devices.get(device_id)
+        return entry[1] if entry is not None else None
+
+    def update(self, payload: DevicePayload) -> DevicePayload | None:
+        """
+        Stores the payload as the latest one of its device.
+        Returns the previously stored payload
+        (always None when payloads are kept in a store, to avoid materializing it).
+
+        Raises KeyError if the device is not registered.
+        """
+        if self._store is not None:
+            if payload.device_id not in self._devices:
+                raise KeyError(payload.device_id)
+            self._store.upsert(payload)
+            return None
+
+        device, previous = self._devices[payload.device_id]
+        self._devices[payload.device_id] = (device, payload)
+        return previous
+
+    def touch(self, device_id: str, timestamp: datetime) -> None:
+        """
+        Records a packet that only repeated the device's latest payload, without
+        replacing the payload.
+        """
+        self._heartbeats[device_id] = timestamp
+
+    def last_seen(self, device_id: str) -> datetime | None:
+        """
+        Returns when the device last sent a packet (a payload or a heartbeat).
+        """
+        payload = self.get_payload(device_id)
+        heartbeat = self._heartbeats.get(device_id)
+        if payload is None or payload.timestamp is None:
+            return heartbeat
+        if heartbeat is None:
+            return payload.timestamp
+        return max(payload.timestamp, heartbeat)
+
+    def by_type(self, device_type: str) -> list[SmartDevice]:
+        devices = (self._devices[device_id][0] for device_id in self._by_type.get(device_type, ()))
+        return [device for device in devices if device is not None]
+
+    def by_location(self, location: DeviceLocation) -> list[SmartDevice]:
+        devices = (self._devices[device_id][0] for device_id in self._by_location.get(location, ()))
+        return [device for device in devices if device is not None]
+
+    def devices(self):
+        return (device for device, _ in self._devices.values() if device is not None)
+
+    def values(self):
+        """
+        Returns the latest stored payloads, mirroring dict.values()
+        so the registry can be passed where a device -> payload mapping was used.
+        """
+        if self._store is not None:
+            return self._store.payloads()
+        return (payload for _, payload in self._devices.values() if payload is not None)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._devices
+
+    def __len__(self) -> int:
+        return len(self._devices)
@@ -0,0 +1,133 @@
+import asyncio
+import random
+
+from models.devices import SmartDevice
+
+
+class DeviceScheduler:
+    """
+    Sends the status of many connected devices from a single task, instead of
+    one SmartDevice.run task (and timer) per device.
+
+    Devices are kept in a hashed timing wheel: a ring of slots, one per tick,
+    where every device waits in the slot of the tick it is due at. Each tick only
+    visits the devices in one slot, whatever the number of devices.
+
+    Every device has its own interval, stretched or shortened by up to
+    jitter * interval each time so devices added together drift apart.
+    With virtual_clock set, ticks follow each other without waiting,
+    so long simulations run as fast as the controller keeps up
+    (packet timestamps still come from the wall clock).
+    """
+
+    def __init__(
+        self,
+        tick_ms: float = 100.0,
+        slots: int = 512,
+        jitter: float = 0.1,
+        virtual_clock: bool = False,
+    ):
+        if tick_ms <= 0:
+            raise ValueError("tick_ms must be positive")
+        if not 0.0 <= jitter < 1.0:
+            raise ValueError("jitter must be between 0 and 1")
+
+        self._tick_seconds = tick_ms / 1000
+        self._wheel: list[list[tuple[int, SmartDevice]]] = [[] for _ in range(slots)]
+        self._jitter = jitter
+        self._virtual_clock = virtual_clock
+        self._tick = 0
+
+        # device -> (interval in ticks, tick the device is due at)
+        # entries in the wheel not matching the due tick here are stale and skipped
+        self._devices: dict[SmartDevice, tuple[float, int]] = {}
+        self._sent = 0
+
+    def add(self, device: SmartDevice, interval: float = 5.0) -> None:
+        """
+        Schedules a connected device to send its status every interval seconds.
+        The first status is sent at a random point within the first interval.
+        """
+        ticks = interval / self._tick_seconds
+        self._schedule(device, ticks, self._tick + 1 + int(random.random() * ticks))
+
+    def remove(self, device: SmartDevice) -> None:
+        # the wheel entry is skipped once its slot comes up
+        self._devices.pop(device, None)
+
+    def _schedule(self, device: SmartDevice, ticks: float, due: int) -> None:
+        self._devices[device] = (ticks, due)
+        self._wheel[due % len(self._wheel)].append((due, device))
+
+    def _next_due(self, ticks: float) -> int:
+        if self._jitter:
+            ticks *= random.uniform(1.0 - self._jitter, 1.0 + self._jitter)
+        # at least one tick later
+        return self._tick + max(1, round(ticks))
+
+    async def _advance(self) -> None:
+        """
+        Sends the status of every device due at the current tick.
+        """
+        slot = self._wheel[self._tick % len(self._wheel)]
+        if slot:
+            waiting = []
+            due_now = []
+            for entry in slot:
+                due, device = entry
+                if due > self._tick:
+                    # due after one or more turns of the wheel
+                    waiting.append(entry)
+                elif self._devices.get(device, (None, None))[1] == due:
+                    due_now.append(entry)
+            slot[:] = waiting
+
+            for due, device in due_now:
+                if self._devices.get(device, (None, None))[1] != due:
+                    # removed, or added again, while an earlier device was sending
+                    continue
+                await device.send_status()
+                self._sent += 1
+                scheduled = self._devices.get(device)
+                if scheduled is None or scheduled[1] != due:
+                    # removed, or added again, while sending
+                    continue
+                ticks = scheduled[0]
+                self._schedule(device, ticks, self._next_due(ticks))
+
+        self._tick += 1
+
+    async def run(self, duration: float | None = None) -> None:
+        """
+        Ticks the wheel until duration seconds (of the scheduler's clock) have passed,
+        or forever.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time() - self._tick * self._tick_seconds
+        end_tick = None if duration is None else self._tick + round(duration / self._tick_seconds)
+
+        while end_tick is None or self._tick < end_tick:
+            if self._virtual_clock:
+                # let the controller run between ticks
+                await asyncio.sleep(0)
+            else:
+                delay = start + self._tick * self._tick_seconds - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # when running behind, ticks are caught up without waiting
+
+            await self._advance()
+
+    @property
+    def now(self) -> float:
+        """
+        Seconds elapsed on the scheduler's clock.
+        """
+        return self._tick * self._tick_seconds
+
+    @property
+    def sent_packets(self) -> int:
+        return self._sent
+
+    def __len__(self) -> int:
+        return len(self._devices)
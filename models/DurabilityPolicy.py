@@ -0,0 +1,12 @@
+from enum import Enum
+
+
+class DurabilityPolicy(Enum):
+    # flush after every single record
+    EVERY_RECORD = "every-record"
+    # flush once per written batch of records
+    EVERY_BATCH = "every-batch"
+    # flush at most once every flush interval
+    INTERVAL_MS = "interval-ms"
+    # never flush explicitly, leave it to the file buffer and the OS
+    OS_DEFAULT = "os-default"
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime
+from enum import Enum
+
+from models.devices import DevicePayload, DeviceCommand
+from .CriticalEvent import CriticalEvent
+
+
+class TriggerMode(Enum):
+    # handle an event when a device enters the critical state,
+    # not again until the device reported a payload without it
+    EDGE = "edge"
+    # handle an event on every payload that has it, at most once per cooldown
+    LEVEL = "level"
+
+
+class EventDeduplicator:
+    """
+    Decides which critical events the controller handles, and which commands it sends.
+
+    Events are suppressed while their (device, event) cooldown runs, and in edge mode
+    also while the device stays in the same critical state. Commands are suppressed
+    if the same command was already sent to the device and the device has not
+    reported since, so its payload does not reflect the command yet.
+    """
+
+    def __init__(
+        self,
+        cooldown: float = 60.0,
+        mode: TriggerMode = TriggerMode.LEVEL,
+        cooldowns: dict[CriticalEvent, float] | None = None,
+        modes: dict[CriticalEvent, TriggerMode] | None = None,
+        clock=time.monotonic,
+    ):
+        """
+        cooldown is in seconds; cooldowns and modes override cooldown and mode
+        for single events. clock returns the current time in seconds.
+        """
+        self._cooldowns = {event: (cooldowns or {}).get(event, cooldown) for event in CriticalEvent}
+        self._modes = {
+            event: TriggerMode((modes or {}).get(event, mode)) for event in CriticalEvent
+        }
+        self._clock = clock
+
+        # (device id, event) -> time the event was last handled
+        self._handled: dict[tuple[str, CriticalEvent], float] = {}
+        # device id -> event the device reported in its latest payload, if any
+        self._active: dict[str, CriticalEvent] = {}
+        # device id -> (last command sent, time it was sent)
+        self._commands: dict[str, tuple[DeviceCommand, datetime]] = {}
+
+        self._suppressed_events = 0
+        self._suppressed_commands = 0
+
+    def filter(
+        self, device_ids, events: list[tuple[DevicePayload, CriticalEvent]]
+    ) -> list[tuple[DevicePayload, CriticalEvent]]:
+        """
+        Returns the events to handle out of those found in a batch.
+        device_ids are the devices whose latest payload was evaluated (the ones
+        without events left their critical state), or None if not known,
+        in which case edge-triggered events are only held back by their cooldown.
+        """
+        now = self._clock()
+        current = {payload.device_id: event for payload, event in events}
+        if device_ids is not None:
+            for device_id in device_ids:
+                if device_id not in current:
+                    self._active.pop(device_id, None)
+
+        admitted = []
+        for payload, event in events:
+            device_id = payload.device_id
+            previous = self._active.get(device_id)
+            self._active[device_id] = event
+
+            if (
+                self._modes[event] == TriggerMode.EDGE
+                and previous == event
+                and device_ids is not None
+            ):
+                # still in the state that was already handled
+                self._suppressed_events += 1
+                continue
+
+            key = (device_id, event)
+            handled = self._handled.get(key)
+            if handled is not None and now - handled < self._cooldowns[event]:
+                self._suppressed_events += 1
+                continue
+
+            self._handled[key] = now
+            admitted.append((payload, event))
+
+        return admitted
+
+    def admit_command(self, payload: DevicePayload, command: DeviceCommand) -> bool:
+        """
+        Returns whether the command should be sent to the device that sent the payload,
+        and remembers it if so.
+        """
+        sent = self._commands.get(payload.device_id)
+        if (
+            sent is not None
+            and sent[0] == command
+            and payload.timestamp is not None
+            and payload.timestamp <= sent[1]
+        ):
+            # the payload predates the same command, which is still taking effect
+            self._suppressed_commands += 1
+            return False
+
+        self._commands[payload.device_id] = (command, datetime.now())
+        return True
+
+    def forget(self, device_id: str) -> None:
+        """
+        Drops the state kept for a device (e.g. when it disconnects).
+        """
+        self._active.pop(device_id, None)
+        self._commands.pop(device_id, None)
+        for event in CriticalEvent:
+            self._handled.pop((device_id, event), None)
+
+    def stats(self) -> dict:
+        return {
+            "suppressed_events": self._suppressed_events,
+            "suppressed_commands": self._suppressed_commands,
+            "active_events": len(self._active),
+        }
@@ -0,0 +1,484 @@
+import mmap
+import os
+import struct
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from .HistoryLog import (
+    LogFormat,
+    MAGIC as LOG_MAGIC,
+    VERSION as LOG_VERSION,
+    FILE_HEADER,
+    TAG_DEVICE_ID,
+    TAG_NAME,
+    NO_TIMESTAMP,
+    to_epoch_us,
+    read_records,
+    scan_records,
+    parse_text_record,
+)
+
+# index layout (all little endian), kept next to the log in "<log path>.idx":
+#
+#   file header:   magic "ECOI", u16 version, u8 log format (0 text, 1 binary), u8 reserved
+#   device record: u8 tag, u16 length, utf-8 bytes
+#                  (every device id gets the next number of the index's device table)
+#   string record: u8 tag, u8 log string tag, u16 length, utf-8 bytes
+#                  (binary logs only: the strings interned in the log, in the order they
+#                   were written, so records can be decoded from the middle of the log)
+#   block record:  u8 tag, u64 offset, u32 length, i64 min timestamp, i64 max timestamp,
+#                  u32 device count, followed by a u32 device number per device
+#
+# a block covers consecutive commits of the storage worker, and lists the devices
+# with records in it and the range of their timestamps (epoch microseconds)
+MAGIC = b"ECOI"
+VERSION = 1
+INDEX_HEADER = struct.Struct("<4sHBx")
+
+TAG_DEVICE = 0x01
+TAG_LOG_STRING = 0x02
+TAG_BLOCK = 0x03
+
+DEVICE_HEADER = struct.Struct("<BH")
+LOG_STRING_HEADER = struct.Struct("<BBH")
+BLOCK_HEADER = struct.Struct("<BQIqqI")
+
+FORMAT_CODES = {LogFormat.TEXT: 0, LogFormat.BINARY: 1}
+
+
+def index_path(path: str) -> str:
+    return f"{path}.idx"
+
+
+class HistoryIndexWriter:
+    """
+    Builds the sparse index of a history log while the storage worker writes it.
+    Commits are grouped into blocks of about block_size bytes of log, so the index
+    stays a small fraction of the log.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        log_format: LogFormat,
+        encoder,
+        block_size: int = 64 * 1024,
+        existing: "HistoryIndex | None" = None,
+    ):
+        """
+        path is the log's path, encoder the one writing it (binary logs only,
+        to persist its interned strings).
+        If existing is given, the index it read is continued instead of replaced
+        (see resume_log).
+        """
+        self._log_format = LogFormat(log_format)
+        self._encoder = encoder if self._log_format == LogFormat.BINARY else None
+        self._block_size = block_size
+
+        # device id -> number
+        self._devices: dict[str, int] = {}
+        # log strings already persisted in the index
+        self._strings = 0
+
+        if existing is not None and existing.index_size:
+            self._file = open(index_path(path), "r+b")
+            # drop a record left partially written
+            self._file.truncate(existing.index_size)
+            self._file.seek(existing.index_size)
+            self._devices = {device_id: number for number, device_id in enumerate(existing._devices)}
+            self._strings = sum(existing._indexed_strings)
+        else:
+            self._file = open(index_path(path), "wb")
+            self._file.write(INDEX_HEADER.pack(MAGIC, VERSION, FORMAT_CODES[self._log_format]))
+
+        # the block being accumulated
+        self._offset = 0
+        self._length = 0
+        self._min_ts = None
+        self._max_ts = None
+        self._block_devices: set[int] = set()
+
+    def add(self, offset: int, length: int, payloads) -> None:
+        """
+        Indexes a commit: payloads written to the log at offset, taking length bytes.
+        """
+        if not self._length:
+            self._offset = offset
+        self._length = offset + length - self._offset
+
+        devices = self._devices
+        block_devices = self._block_devices
+        chunks = []
+        min_ts = max_ts = None
+        for payload in payloads:
+            number = devices.get(payload.device_id)
+            if number is None:
+                number = devices[payload.device_id] = len(devices)
+                encoded = payload.device_id.encode()
+                chunks.append(DEVICE_HEADER.pack(TAG_DEVICE, len(encoded)))
+                chunks.append(encoded)
+            block_devices.add(number)
+
+            timestamp = payload.timestamp
+            if timestamp is not None:
+                if min_ts is None or timestamp < min_ts:
+                    min_ts = timestamp
+                if max_ts is None or timestamp > max_ts:
+                    max_ts = timestamp
+        if chunks:
+            self._file.write(b"".join(chunks))
+
+        if min_ts is not None:
+            min_ts, max_ts = to_epoch_us(min_ts), to_epoch_us(max_ts)
+            if self._min_ts is None or min_ts < self._min_ts:
+                self._min_ts = min_ts
+            if self._max_ts is None or max_ts > self._max_ts:
+                self._max_ts = max_ts
+
+        if self._length >= self._block_size:
+            self._write_block()
+
+    def _write_block(self) -> None:
+        if not self._length:
+            return
+
+        chunks = []
+        if self._encoder is not None:
+            # strings interned up to the end of the block
+            strings = self._encoder.strings
+            for tag, value in strings[self._strings :]:
+                encoded = value.encode()
+                chunks.append(LOG_STRING_HEADER.pack(TAG_LOG_STRING, tag, len(encoded)))
+                chunks.append(encoded)
+            self._strings = len(strings)
+
+        devices = sorted(self._block_devices)
+        chunks.append(
+            BLOCK_HEADER.pack(
+                TAG_BLOCK,
+                self._offset,
+                self._length,
+                # a block without timestamps never matches a time range
+                NO_TIMESTAMP if self._min_ts is None else self._min_ts,
+                NO_TIMESTAMP if self._max_ts is None else self._max_ts,
+                len(devices),
+            )
+        )
+        chunks.append(struct.pack(f"<{len(devices)}I", *devices))
+        self._file.write(b"".join(chunks))
+
+        self._length = 0
+        self._min_ts = None
+        self._max_ts = None
+        self._block_devices = set()
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._write_block()
+        self._file.close()
+
+
+class HistoryIndex:
+    """
+    Queries a history log through its index: only the blocks that can hold records
+    of the requested device and time range are read. The part of the log written
+    after the last indexed block (the block still being filled) is always scanned.
+
+    Works on a log that is still being written: the index and the log are read as
+    far as they were flushed when the HistoryIndex was opened.
+    """
+
+    def __init__(self, path: str, log_format: LogFormat = LogFormat.TEXT):
+        self._log_format = LogFormat(log_format)
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # an empty file can not be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        # index device table, and block number list per device id
+        self._devices: list[str] = []
+        self._postings: dict[str, list[int]] = {}
+        # log string tables (binary logs), and how many of them were read from the index
+        # (the others are interned by the records after the last block)
+        self._log_device_ids: list[str] = []
+        self._log_names: list[str] = []
+        # position of every device id in its string table, filled once the tables are complete
+        self._log_device_index: dict[str, int] = {}
+        self._indexed_strings = (0, 0)
+        # bytes of the index up to its last block
+        self.index_size = 0
+        # per block: offset, length, min timestamp, max timestamp
+        self._blocks: list[tuple[int, int, int, int]] = []
+        # running maximum of the blocks' max timestamps, for bisecting time ranges,
+        # and how far below it the min timestamp of a block can be
+        self._max_ts: list[int] = []
+        self._skew = 0
+
+        header = 0
+        if self._log_format == LogFormat.BINARY:
+            header = FILE_HEADER.size
+            if len(self._map) < header or FILE_HEADER.unpack_from(self._map, 0)[:2] != (LOG_MAGIC, LOG_VERSION):
+                self.close()
+                raise ValueError(f"{path} is not a binary history log")
+        elif self._map[: len(LOG_MAGIC)] == LOG_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a text history log")
+
+        self._load_index(index_path(path))
+
+        # start of the records after the last block, and end of the last complete record
+        # (leaving out a record still being written)
+        self._tail = self._blocks[-1][0] + self._blocks[-1][1] if self._blocks else header
+        if self._log_format == LogFormat.BINARY:
+            self._end = scan_records(self._map, self._tail, len(self._map), self._log_device_ids, self._log_names)
+            self._log_device_index = {device_id: index for index, device_id in enumerate(self._log_device_ids)}
+        else:
+            self._end = max(self._tail, self._map.rfind(b"\n") + 1)
+
+    def _load_index(self, path: str) -> None:
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            # not indexed, queries scan the whole log
+            return
+
+        magic, version, log_format = INDEX_HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a history log index")
+        if log_format != FORMAT_CODES[self._log_format]:
+            raise ValueError(f"{path} does not index a {self._log_format.value} log")
+        self.index_size = INDEX_HEADER.size
+        indexed_devices = 0
+
+        # a truncated record at the end is still being written, and is ignored
+        offset = INDEX_HEADER.size
+        size = len(data)
+        while offset < size:
+            tag = data[offset]
+
+            if tag == TAG_DEVICE:
+                if offset + DEVICE_HEADER.size > size:
+                    break
+                _, length = DEVICE_HEADER.unpack_from(data, offset)
+                start = offset + DEVICE_HEADER.size
+                if start + length > size:
+                    break
+                self._devices.append(data[start : start + length].decode())
+                offset = start + length
+
+            elif tag == TAG_LOG_STRING:
+                if offset + LOG_STRING_HEADER.size > size:
+                    break
+                _, string_tag, length = LOG_STRING_HEADER.unpack_from(data, offset)
+                start = offset + LOG_STRING_HEADER.size
+                if start + length > size:
+                    break
+                value = data[start : start + length].decode()
+                (self._log_device_ids if string_tag == TAG_DEVICE_ID else self._log_names).append(value)
+                offset = start + length
+
+            elif tag == TAG_BLOCK:
+                if offset + BLOCK_HEADER.size > size:
+                    break
+                _, block_offset, length, min_ts, max_ts, count = BLOCK_HEADER.unpack_from(data, offset)
+                start = offset + BLOCK_HEADER.size
+                if start + count * 4 > size:
+                    break
+                if block_offset + length > len(self._map):
+                    # the log was not flushed that far yet
+                    break
+                number = len(self._blocks)
+                for device in struct.unpack_from(f"<{count}I", data, start):
+                    self._postings.setdefault(self._devices[device], []).append(number)
+                self._add_block(block_offset, length, min_ts, max_ts)
+                offset = start + count * 4
+                self.index_size = offset
+                self._indexed_strings = (len(self._log_device_ids), len(self._log_names))
+                indexed_devices = len(self._devices)
+
+            else:
+                raise ValueError(f"Unknown index record tag {tag:#x} at offset {offset}")
+
+        # strings after the last block are read back from the log, with its other records
+        del self._devices[indexed_devices:]
+        del self._log_device_ids[self._indexed_strings[0] :]
+        del self._log_names[self._indexed_strings[1] :]
+
+    def _add_block(self, offset: int, length: int, min_ts: int, max_ts: int) -> None:
+        self._blocks.append((offset, length, min_ts, max_ts))
+        running_max = max(max_ts, self._max_ts[-1]) if self._max_ts else max_ts
+        self._max_ts.append(running_max)
+        if min_ts != NO_TIMESTAMP:
+            self._skew = max(self._skew, running_max - min_ts)
+
+    def candidate_blocks(
+        self,
+        device_id: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[int]:
+        """
+        Returns the numbers of the blocks that can hold records of the device
+        with timestamps from start to end (inclusive).
+        """
+        if start is None and end is None:
+            if device_id is None:
+                return list(range(len(self._blocks)))
+            return self._postings.get(device_id, [])
+
+        start_us = to_epoch_us(start) if start is not None else NO_TIMESTAMP + 1
+        end_us = to_epoch_us(end) if end is not None else None
+
+        # blocks before first only have timestamps older than start; no block after
+        # stop can have a min timestamp up to end (the running max minus skew exceeds it)
+        first = bisect_left(self._max_ts, start_us)
+        stop = len(self._blocks) if end_us is None else bisect_right(self._max_ts, end_us + self._skew)
+        if device_id is not None:
+            postings = self._postings.get(device_id, [])
+            numbers = postings[bisect_left(postings, first) : bisect_left(postings, stop)]
+        else:
+            numbers = range(first, stop)
+
+        blocks = self._blocks
+        return [
+            number
+            for number in numbers
+            if blocks[number][3] >= start_us and (end_us is None or blocks[number][2] <= end_us)
+        ]
+
+    def query(
+        self,
+        device_id: str | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ):
+        """
+        Yields the payloads of a device (all devices if not given) with timestamps from
+        start to end (inclusive, unbounded if not given), in the order they were logged.
+        Payloads without a timestamp only match queries without a time range.
+        """
+        ranges = [
+            (self._blocks[number][0], self._blocks[number][0] + self._blocks[number][1])
+            for number in self.candidate_blocks(device_id, start, end)
+        ]
+
+        if self._log_format == LogFormat.BINARY:
+            yield from self._query_binary(ranges, device_id, start, end)
+        else:
+            yield from self._query_text(ranges, device_id, start, end)
+
+    def _query_binary(self, ranges, device_id, start, end):
+        start_us = to_epoch_us(start) if start is not None else None
+        end_us = to_epoch_us(end) if end is not None else None
+        if start_us is None and end_us is not None:
+            # leave out records without a timestamp
+            start_us = NO_TIMESTAMP + 1
+
+        device_index = None
+        if device_id is not None:
+            device_index = self._log_device_index.get(device_id)
+            if device_index is None:
+                # never logged
+                return
+
+        # the string tables are complete, including the strings of the tail
+        for offset, end_offset in [*ranges, (self._tail, self._end)]:
+            yield from read_records(
+                self._map,
+                offset,
+                end_offset,
+                self._log_device_ids,
+                self._log_names,
+                False,
+                device_index,
+                start_us,
+                end_us,
+            )
+
+    def _query_text(self, ranges, device_id, start, end):
+        # text records start with the device id, so other devices' lines are skipped unparsed
+        marker = f"(device_id={device_id!r}," if device_id is not None else None
+        for offset, end_offset in [*ranges, (self._tail, self._end)]:
+            for line in self._map[offset:end_offset].decode().splitlines():
+                if not line.strip() or (marker is not None and marker not in line):
+                    continue
+                payload = parse_text_record(line)
+                timestamp = payload.timestamp
+                if start is not None or end is not None:
+                    if timestamp is None:
+                        continue
+                    if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                        continue
+                yield payload
+
+    def tail(self):
+        """
+        Yields the payloads logged after the last indexed block.
+        """
+        if self._log_format == LogFormat.BINARY:
+            yield from read_records(
+                self._map, self._tail, self._end, self._log_device_ids, self._log_names, False
+            )
+        else:
+            yield from self._query_text([], None, None, None)
+
+    @property
+    def tail_offset(self) -> int:
+        return self._tail
+
+    @property
+    def size(self) -> int:
+        """
+        Size of the log's complete records.
+        """
+        return self._end
+
+    def stats(self) -> dict:
+        return {
+            "blocks": len(self._blocks),
+            "devices": len(self._devices),
+            "indexed_bytes": self._tail,
+            "unindexed_bytes": self._end - self._tail,
+        }
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def resume_log(path: str, log_format: LogFormat, encoder, index_block_size: int | None = 64 * 1024):
+    """
+    Prepares an existing log to be appended to, e.g. after a restart: the encoder of a
+    binary log gets back the strings interned in it, and its index (unless index_block_size
+    is None) is reopened, indexing the records it did not cover yet.
+    Returns the size of the log's complete records, where writing continues
+    (a record left partially written is overwritten), and the index writer.
+    """
+    with HistoryIndex(path, log_format) as existing:
+        if log_format == LogFormat.BINARY:
+            indexed_ids, indexed_names = existing._indexed_strings
+            device_ids, names = existing._log_device_ids, existing._log_names
+            # strings already persisted in the index first, as the index writer expects
+            encoder.restore(
+                [(TAG_DEVICE_ID, value) for value in device_ids[:indexed_ids]]
+                + [(TAG_NAME, value) for value in names[:indexed_names]]
+                + [(TAG_DEVICE_ID, value) for value in device_ids[indexed_ids:]]
+                + [(TAG_NAME, value) for value in names[indexed_names:]]
+            )
+
+        index = None
+        if index_block_size is not None:
+            index = HistoryIndexWriter(path, log_format, encoder, index_block_size, existing)
+            if existing.size > existing.tail_offset:
+                index.add(existing.tail_offset, existing.size - existing.tail_offset, existing.tail())
+        return existing.size, index
@@ -0,0 +1,404 @@
+import ast
+import mmap
+import re
+import struct
+from datetime import datetime, timedelta
+from enum import Enum
+
+from models.devices import ThermostatPayload, BulbPayload, CameraPayload
+from .DeviceLocation import DeviceLocation
+
+
+class LogFormat(Enum):
+    # one repr() line per payload
+    TEXT = "text"
+    # schema-aware binary records (see BinaryLogEncoder)
+    BINARY = "binary"
+
+
+# binary log layout (all little endian):
+#
+#   file header:   magic "ECOL", u16 version, u16 reserved
+#   string record: u8 tag, u16 length, utf-8 bytes
+#                  (device ids and names are interned: each one is written once,
+#                   and gets the next index of its table)
+#   payload record: u8 tag, u32 device id index, u32 name index, u8 location index,
+#                   i64 timestamp, followed by the packed fields of the device type
+#
+# timestamps are stored as wall clock microseconds since 1970-01-01
+MAGIC = b"ECOL"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sHH")
+
+TAG_DEVICE_ID = 0x01
+TAG_NAME = 0x02
+TAG_THERMOSTAT = 0x10
+TAG_BULB = 0x11
+TAG_CAMERA = 0x12
+
+STRING_HEADER = struct.Struct("<BH")
+# current_temp, target_temp, humidity
+THERMOSTAT_RECORD = struct.Struct("<BIIBqddd")
+# is_on, brightness
+BULB_RECORD = struct.Struct("<BIIBq?i")
+# flags, battery_level, last_snapshot
+CAMERA_RECORD = struct.Struct("<BIIBqBdq")
+
+CAMERA_MOTION_DETECTED = 0x01
+CAMERA_IS_ON = 0x02
+CAMERA_HAS_SNAPSHOT = 0x04
+
+RECORDS = {
+    TAG_THERMOSTAT: THERMOSTAT_RECORD,
+    TAG_BULB: BULB_RECORD,
+    TAG_CAMERA: CAMERA_RECORD,
+}
+# device id index and timestamp, right after the tag of every payload record
+RECORD_KEY = struct.Struct("<I5xq")
+
+# marks a missing timestamp
+NO_TIMESTAMP = -(2**63)
+
+LOCATIONS = list(DeviceLocation)
+LOCATION_INDEX = {location: index for index, location in enumerate(LOCATIONS)}
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch_us(value: datetime | None) -> int:
+    if value is None:
+        return NO_TIMESTAMP
+    return (value.replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+
+
+def from_epoch_us(value: int) -> datetime | None:
+    if value == NO_TIMESTAMP:
+        return None
+    return _EPOCH + timedelta(microseconds=value)
+
+
+class TextLogEncoder:
+    """
+    Encodes payloads as repr() lines, the original history.log format.
+    """
+
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, payloads) -> bytes:
+        return "".join(f"{payload}\n" for payload in payloads).encode()
+
+
+class BinaryLogEncoder:
+    """
+    Encodes payloads as binary log records.
+    One encoder must be used per file, since it tracks the strings already interned in it.
+    """
+
+    def __init__(self):
+        self._device_ids: dict[str, int] = {}
+        self._names: dict[str, int] = {}
+        # (tag, value) of every interned string, in the order they were written
+        self.strings: list[tuple[int, str]] = []
+
+    def header(self) -> bytes:
+        return FILE_HEADER.pack(MAGIC, VERSION, 0)
+
+    def encode(self, payloads) -> bytes:
+        chunks = []
+        for payload in payloads:
+            device_index = self._intern(self._device_ids, TAG_DEVICE_ID, payload.device_id, chunks)
+            name_index = self._intern(self._names, TAG_NAME, payload.name, chunks)
+            common = (
+                device_index,
+                name_index,
+                LOCATION_INDEX[payload.location],
+                to_epoch_us(payload.timestamp),
+            )
+
+            if isinstance(payload, ThermostatPayload):
+                chunks.append(
+                    THERMOSTAT_RECORD.pack(
+                        TAG_THERMOSTAT,
+                        *common,
+                        payload.current_temp,
+                        payload.target_temp,
+                        payload.humidity,
+                    )
+                )
+            elif isinstance(payload, BulbPayload):
+                chunks.append(
+                    BULB_RECORD.pack(TAG_BULB, *common, payload.is_on, payload.brightness)
+                )
+            elif isinstance(payload, CameraPayload):
+                flags = (
+                    (CAMERA_MOTION_DETECTED if payload.motion_detected else 0)
+                    | (CAMERA_IS_ON if payload.is_on else 0)
+                    | (CAMERA_HAS_SNAPSHOT if payload.last_snapshot else 0)
+                )
+                chunks.append(
+                    CAMERA_RECORD.pack(
+                        TAG_CAMERA,
+                        *common,
+                        flags,
+                        payload.battery_level,
+                        to_epoch_us(payload.last_snapshot),
+                    )
+                )
+        return b"".join(chunks)
+
+    def restore(self, strings: list[tuple[int, str]]) -> None:
+        """
+        Continues a log written by another encoder (e.g. before a restart),
+        given the (tag, value) strings already interned in it.
+        """
+        for tag, value in strings:
+            table = self._device_ids if tag == TAG_DEVICE_ID else self._names
+            table[value] = len(table)
+        self.strings.extend(strings)
+
+    def _intern(self, table: dict[str, int], tag: int, value: str, chunks: list) -> int:
+        index = table.get(value)
+        if index is None:
+            # first occurrence, write the string to the log
+            index = table[value] = len(table)
+            self.strings.append((tag, value))
+            encoded = value.encode()
+            chunks.append(STRING_HEADER.pack(tag, len(encoded)))
+            chunks.append(encoded)
+        return index
+
+
+class BinaryLogReader:
+    """
+    Memory maps a binary log and iterates over its payloads.
+    Records are unpacked straight from the mapped file, without reading it into memory
+    or copying it into intermediate buffers.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _ = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a binary history log")
+
+    def __iter__(self):
+        return read_records(self._map, FILE_HEADER.size, len(self._map), [], [])
+
+    @property
+    def buffer(self) -> mmap.mmap:
+        return self._map
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_records(
+    buffer,
+    offset: int,
+    end: int,
+    device_ids: list[str],
+    names: list[str],
+    intern: bool = True,
+    device_index: int | None = None,
+    start_us: int | None = None,
+    end_us: int | None = None,
+):
+    """
+    Yields the payloads of the binary log records in buffer[offset:end].
+
+    device_ids and names are the interned strings written before offset; string records
+    in the range are appended to them, unless intern is false (the tables are already
+    complete). Records can be filtered by device id index and timestamp range
+    (epoch microseconds, inclusive), which skips the others without building their payloads.
+    """
+    filtered = device_index is not None or start_us is not None or end_us is not None
+    while offset < end:
+        tag = buffer[offset]
+
+        if tag == TAG_DEVICE_ID or tag == TAG_NAME:
+            _, length = STRING_HEADER.unpack_from(buffer, offset)
+            offset += STRING_HEADER.size
+            if intern:
+                value = buffer[offset : offset + length].decode()
+                (device_ids if tag == TAG_DEVICE_ID else names).append(value)
+            offset += length
+            continue
+
+        record = RECORDS.get(tag)
+        if record is None:
+            raise ValueError(f"Unknown record tag {tag:#x} at offset {offset}")
+        if filtered:
+            device, timestamp = RECORD_KEY.unpack_from(buffer, offset + 1)
+            if (
+                (device_index is not None and device != device_index)
+                or (start_us is not None and timestamp < start_us)
+                or (end_us is not None and timestamp > end_us)
+            ):
+                offset += record.size
+                continue
+
+        if tag == TAG_THERMOSTAT:
+            _, device, name, location, timestamp, current_temp, target_temp, humidity = (
+                THERMOSTAT_RECORD.unpack_from(buffer, offset)
+            )
+            offset += THERMOSTAT_RECORD.size
+            yield ThermostatPayload(
+                device_id=device_ids[device],
+                name=names[name],
+                location=LOCATIONS[location],
+                current_temp=current_temp,
+                target_temp=target_temp,
+                humidity=humidity,
+                timestamp=from_epoch_us(timestamp),
+            )
+
+        elif tag == TAG_BULB:
+            _, device, name, location, timestamp, is_on, brightness = (
+                BULB_RECORD.unpack_from(buffer, offset)
+            )
+            offset += BULB_RECORD.size
+            yield BulbPayload(
+                device_id=device_ids[device],
+                name=names[name],
+                location=LOCATIONS[location],
+                is_on=is_on,
+                brightness=brightness,
+                timestamp=from_epoch_us(timestamp),
+            )
+
+        elif tag == TAG_CAMERA:
+            _, device, name, location, timestamp, flags, battery_level, last_snapshot = (
+                CAMERA_RECORD.unpack_from(buffer, offset)
+            )
+            offset += CAMERA_RECORD.size
+            yield CameraPayload(
+                device_id=device_ids[device],
+                name=names[name],
+                location=LOCATIONS[location],
+                motion_detected=bool(flags & CAMERA_MOTION_DETECTED),
+                battery_level=battery_level,
+                last_snapshot=(
+                    from_epoch_us(last_snapshot)
+                    if flags & CAMERA_HAS_SNAPSHOT
+                    else None
+                ),
+                is_on=bool(flags & CAMERA_IS_ON),
+                timestamp=from_epoch_us(timestamp),
+            )
+
+
+def scan_records(buffer, offset: int, end: int, device_ids: list[str], names: list[str]) -> int:
+    """
+    Interns the strings of the binary log records in buffer[offset:end], skipping
+    the payload records without decoding them. Returns the offset after the last
+    complete record: end, unless the log ends with a partially written record.
+    """
+    while offset < end:
+        tag = buffer[offset]
+
+        if tag == TAG_DEVICE_ID or tag == TAG_NAME:
+            if offset + STRING_HEADER.size > end:
+                break
+            _, length = STRING_HEADER.unpack_from(buffer, offset)
+            start = offset + STRING_HEADER.size
+            if start + length > end:
+                break
+            value = buffer[start : start + length].decode()
+            (device_ids if tag == TAG_DEVICE_ID else names).append(value)
+            offset = start + length
+            continue
+
+        record = RECORDS.get(tag)
+        if record is None:
+            raise ValueError(f"Unknown record tag {tag:#x} at offset {offset}")
+        if offset + record.size > end:
+            break
+        offset += record.size
+    return offset
+
+
+PAYLOAD_CLASSES = {
+    "ThermostatPayload": ThermostatPayload,
+    "BulbPayload": BulbPayload,
+    "CameraPayload": CameraPayload,
+}
+
+# repr() of an enum member is not valid python, e.g. <DeviceLocation.GARAGE: 'garage'>
+_LOCATION_REPR = re.compile(r"<DeviceLocation\.(\w+): '[^']*'>")
+
+
+def _evaluate(node):
+    """
+    Evaluates the value of a field in a payload repr().
+    Only literals, DeviceLocation members and datetime.datetime(...) calls are accepted.
+    """
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+        if node.value.id == "DeviceLocation":
+            return DeviceLocation[node.attr]
+
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "datetime"
+    ):
+        return datetime(*(ast.literal_eval(arg) for arg in node.args))
+
+    return ast.literal_eval(node)
+
+
+def parse_text_record(line: str):
+    """
+    Parses a line of the text log back into a payload.
+    """
+    expression = ast.parse(_LOCATION_REPR.sub(r"DeviceLocation.\1", line.strip()), mode="eval")
+    call = expression.body
+    if not isinstance(call, ast.Call) or call.func.id not in PAYLOAD_CLASSES:
+        raise ValueError(f"Not a payload record: {line!r}")
+
+    fields = {keyword.arg: _evaluate(keyword.value) for keyword in call.keywords}
+    return PAYLOAD_CLASSES[call.func.id](**fields)
+
+
+def read_text_log(path: str):
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield parse_text_record(line)
+
+
+def text_to_binary(source: str, destination: str, chunk_size: int = 4096) -> None:
+    """
+    Converts a text history log into a binary one.
+    """
+    encoder = BinaryLogEncoder()
+    with open(destination, "wb") as file:
+        file.write(encoder.header())
+        chunk = []
+        for payload in read_text_log(source):
+            chunk.append(payload)
+            if len(chunk) >= chunk_size:
+                file.write(encoder.encode(chunk))
+                chunk.clear()
+        file.write(encoder.encode(chunk))
+
+
+def binary_to_text(source: str, destination: str) -> None:
+    """
+    Converts a binary history log into a text one.
+    """
+    encoder = TextLogEncoder()
+    with BinaryLogReader(source) as reader, open(destination, "wb") as file:
+        for payload in reader:
+            file.write(encoder.encode((payload,)))
@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+
+# histogram buckets: values below 8 get a bucket each, then every power of two
+# is split into 8 sub-buckets, so a bucket is at most 12.5% wide
+SUB_BUCKETS = 8
+BUCKETS = SUB_BUCKETS * 64
+
+
+def bucket_of(value: int) -> int:
+    length = value.bit_length()
+    if length <= 3:
+        return value
+    return (length - 3) * SUB_BUCKETS + ((value >> (length - 4)) & (SUB_BUCKETS - 1))
+
+
+def bucket_floor(bucket: int) -> int:
+    if bucket < SUB_BUCKETS:
+        return bucket
+    length, sub = divmod(bucket, SUB_BUCKETS)
+    return (SUB_BUCKETS + sub) << (length - 1)
+
+
+class Histogram:
+    """
+    Latency histogram of nanosecond values with log-linear buckets.
+    Recording a value is a few integer operations and a list increment.
+    """
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, nanoseconds: int) -> None:
+        self.counts[bucket_of(nanoseconds)] += 1
+        self.count += 1
+        self.total += nanoseconds
+        if self.min is None or nanoseconds < self.min:
+            self.min = nanoseconds
+        if nanoseconds > self.max:
+            self.max = nanoseconds
+
+    def percentile(self, point: float) -> int:
+        """
+        Returns the lower bound of the bucket holding the given percentile.
+        """
+        rank = self.count * point / 100
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bucket_floor(bucket)
+        return self.max
+
+    def snapshot(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "total_ms": self.total / 1e6,
+            "mean_us": self.total / self.count / 1e3,
+            "min_us": self.min / 1e3,
+            "p50_us": self.percentile(50) / 1e3,
+            "p90_us": self.percentile(90) / 1e3,
+            "p99_us": self.percentile(99) / 1e3,
+            "max_us": self.max / 1e3,
+        }
+
+
+class Instrumentation:
+    """
+    Per-stage latency histograms, counters and gauges of the packet pipeline.
+
+    Components take an Instrumentation object (or None, when instrumentation is disabled)
+    and only time their stages if they were given one, so disabled instrumentation
+    costs a single check per stage.
+    """
+
+    def __init__(self):
+        self._histograms: dict[str, Histogram] = {}
+        self._counters: dict[str, int] = {}
+        self._gauges: dict[str, callable] = {}
+        self._dump_thread: threading.Thread | None = None
+        self._dump_stop = threading.Event()
+
+    def record(self, stage: str, nanoseconds: int) -> None:
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms[stage] = Histogram()
+        histogram.record(nanoseconds)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def register_gauge(self, gauge: str, read) -> None:
+        """
+        Registers a function returning the current value of a gauge (e.g. a queue depth).
+        """
+        self._gauges[gauge] = read
+
+    def snapshot(self) -> dict:
+        return {
+            "timestamp": time.time(),
+            "stages": {
+                stage: histogram.snapshot()
+                for stage, histogram in list(self._histograms.items())
+            },
+            "counters": dict(self._counters),
+            "gauges": {gauge: read() for gauge, read in list(self._gauges.items())},
+        }
+
+    def dump(self, path: str) -> None:
+        # write to a temporary file first, so readers never see a partial dump
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        os.replace(temporary, path)
+
+    def start_periodic_dump(self, path: str, interval: float = 10.0) -> None:
+        """
+        Dumps a snapshot as JSON to the given file every interval seconds,
+        from a background thread.
+        """
+        self.stop_periodic_dump()
+        self._dump_stop.clear()
+
+        def run():
+            # runs in a separate thread
+            while not self._dump_stop.wait(interval):
+                self.dump(path)
+
+        self._dump_thread = threading.Thread(target=run, daemon=True)
+        self._dump_thread.start()
+
+    def stop_periodic_dump(self) -> None:
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
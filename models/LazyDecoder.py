@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from models.devices import DevicePayload
+from .AnalyticsEngine import AnalyticsEngine
+from .PacketCodec import decode_packet, packet_header, packet_time
+
+
+class LazyDecoder:
+    """
+    Decodes a packet only if its content changed since the last packet decoded for
+    its device: packets repeating the device's latest payload (but for their send
+    time) become heartbeats, which only refresh the device's liveness.
+
+    Packets of devices whose latest payload raised a critical event are always
+    decoded, so rules keep firing on them as they would on every packet.
+    Packets of unknown devices are dropped without being decoded.
+    """
+
+    def __init__(self):
+        # device id -> content fingerprint of the latest packet decoded
+        self._fingerprints: dict[str, int] = {}
+        # devices whose latest payload raised a critical event
+        self._critical: set[str] = set()
+
+        self.decoded = 0
+        self.heartbeats = 0
+
+    def decode(self, packets, registry) -> tuple[list[DevicePayload], list[tuple[str, datetime]]]:
+        """
+        Returns the payloads decoded from the packets of registered devices, and the
+        (device id, send time) of the heartbeats.
+        """
+        payloads = []
+        heartbeats = []
+        fingerprints = self._fingerprints
+        critical = self._critical
+
+        for packet in packets:
+            header = packet_header(packet)
+            if header is None:
+                # not laid out as the codec writes it
+                payloads.extend(
+                    payload
+                    for payload in AnalyticsEngine.parse_payload(packet)
+                    if payload.device_id in registry
+                )
+                continue
+
+            device_id, fingerprint, sent = header
+            if device_id not in registry:
+                continue
+            if fingerprints.get(device_id) == fingerprint and device_id not in critical:
+                heartbeats.append((device_id, packet_time(sent)))
+                continue
+
+            payload = decode_packet(packet)
+            if payload is not None:
+                fingerprints[device_id] = fingerprint
+                payloads.append(payload)
+
+        self.decoded += len(payloads)
+        self.heartbeats += len(heartbeats)
+        return payloads, heartbeats
+
+    def evaluated(self, payloads, critical_events) -> None:
+        """
+        Called with the payloads the rules were evaluated on and the critical events found.
+        """
+        for payload in payloads:
+            self._critical.discard(payload.device_id)
+        self._critical.update(payload.device_id for payload, _ in critical_events)
+
+    def forget(self, device_id: str) -> None:
+        """
+        Decodes the device's next packet, e.g. after it reconnected with a new payload.
+        """
+        self._fingerprints.pop(device_id, None)
+        self._critical.discard(device_id)
+
+    def stats(self) -> dict:
+        packets = self.decoded + self.heartbeats
+        return {
+            "decoded": self.decoded,
+            "heartbeats": self.heartbeats,
+            "heartbeat_ratio": self.heartbeats / packets if packets else 0.0,
+        }
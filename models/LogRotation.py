@@ -0,0 +1,87 @@
+import gzip
+import lzma
+import os
+import re
+import shutil
+import time
+from enum import Enum
+
+from .HistoryIndex import index_path
+
+
+class LogCompression(Enum):
+    # sealed segments are kept as they are
+    NONE = "none"
+    # fast, moderate ratio
+    GZIP = "gzip"
+    # slow, best ratio
+    LZMA = "lzma"
+
+
+SUFFIXES = {
+    LogCompression.NONE: "",
+    LogCompression.GZIP: ".gz",
+    LogCompression.LZMA: ".xz",
+}
+OPENERS = {
+    LogCompression.GZIP: gzip.open,
+    LogCompression.LZMA: lzma.open,
+}
+
+
+def segment_path(path: str, number: int) -> str:
+    """
+    Path of the number-th sealed segment of the log at path (before compression).
+    """
+    return f"{path}.{number:06d}"
+
+
+def list_segments(path: str) -> list[tuple[int, str]]:
+    """
+    Returns the (number, path) of every sealed segment of the log at path, oldest first.
+    """
+    directory = os.path.dirname(path)
+    pattern = re.compile(
+        re.escape(os.path.basename(path))
+        + r"\.(\d{6})("
+        + "|".join(re.escape(suffix) for suffix in SUFFIXES.values() if suffix)
+        + r")?$"
+    )
+
+    segments = []
+    for name in os.listdir(directory or "."):
+        match = pattern.match(name)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+def remove_segment(segment: str) -> None:
+    """
+    Removes a sealed segment (compressed or not) and the index of its records.
+    """
+    os.remove(segment)
+    for suffix in SUFFIXES.values():
+        if suffix and segment.endswith(suffix):
+            segment = segment[: -len(suffix)]
+    if os.path.exists(index_path(segment)):
+        os.remove(index_path(segment))
+
+
+def compress_segment(path: str, compression: LogCompression) -> tuple[int, int, float]:
+    """
+    Compresses a sealed segment next to it (adding the codec's suffix), then removes it.
+    Runs in a worker process; returns the uncompressed and compressed sizes
+    and the seconds taken.
+    """
+    start = time.perf_counter()
+    destination = path + SUFFIXES[compression]
+    temporary = destination + ".tmp"
+    with open(path, "rb") as source, OPENERS[compression](temporary, "wb") as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    # a reader never sees a partially compressed segment
+    os.replace(temporary, destination)
+
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size, os.path.getsize(destination), time.perf_counter() - start
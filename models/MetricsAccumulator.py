@@ -0,0 +1,118 @@
+import math
+
+from models.devices import ThermostatPayload, DevicePayload
+from .AnalyticsEngine import AnalyticsEngine
+
+
+class MetricsAccumulator:
+    """
+    Keeps running sums and counts behind the metrics reported by
+    AnalyticsEngine.get_metrics, so every payload update costs O(1)
+    instead of a pass over all connected devices.
+    """
+
+    def __init__(self):
+        self._temperature_sum = 0.0
+        self._humidity_sum = 0.0
+        self._total_thermostats = 0
+        self._total_devices = 0
+
+    def add(self, payload: DevicePayload | None) -> None:
+        """
+        Accounts for a newly connected device and its first payload.
+        """
+        self._total_devices += 1
+        self._apply(payload, 1)
+
+    def remove(self, payload: DevicePayload | None) -> None:
+        """
+        Removes a disconnected device and its last payload.
+        """
+        self._total_devices -= 1
+        self._apply(payload, -1)
+
+    def update(self, old: DevicePayload | None, new: DevicePayload) -> None:
+        """
+        Replaces the contribution of a device's previous payload with its new one.
+        """
+        self._apply(old, -1)
+        self._apply(new, 1)
+
+    def _apply(self, payload: DevicePayload | None, sign: int) -> None:
+        if not isinstance(payload, ThermostatPayload):
+            # only thermostats contribute to temperature and humidity
+            return
+
+        self._temperature_sum += sign * AnalyticsEngine.get_temperature(payload)
+        self._humidity_sum += sign * payload.humidity
+        self._total_thermostats += sign
+
+    def metrics(self) -> dict:
+        total_thermostats = self._total_thermostats
+        return {
+            "average_temperature": (
+                self._temperature_sum / total_thermostats if total_thermostats > 0 else 0.0
+            ),
+            "average_humidity": (
+                self._humidity_sum / total_thermostats if total_thermostats > 0 else 0.0
+            ),
+            "total_connected_devices": self._total_devices,
+        }
+
+    def state(self) -> tuple:
+        """
+        Returns the running sums and counts as a plain (picklable) tuple.
+        """
+        return (
+            self._temperature_sum,
+            self._humidity_sum,
+            self._total_thermostats,
+            self._total_devices,
+        )
+
+    @classmethod
+    def from_state(cls, state: tuple) -> "MetricsAccumulator":
+        accumulator = cls()
+        (
+            accumulator._temperature_sum,
+            accumulator._humidity_sum,
+            accumulator._total_thermostats,
+            accumulator._total_devices,
+        ) = state
+        return accumulator
+
+    @classmethod
+    def merge(cls, partials) -> "MetricsAccumulator":
+        """
+        Combines partial accumulators (e.g. one per controller shard)
+        into one covering all of their devices.
+        """
+        merged = cls()
+        for partial in partials:
+            temperature_sum, humidity_sum, total_thermostats, total_devices = partial.state()
+            merged._temperature_sum += temperature_sum
+            merged._humidity_sum += humidity_sum
+            merged._total_thermostats += total_thermostats
+            merged._total_devices += total_devices
+        return merged
+
+    def recompute(self, connected_devices) -> None:
+        """
+        Rebuilds the running sums from scratch, discarding accumulated
+        floating point drift.
+        """
+        self.__init__()
+        for payload in connected_devices.values():
+            self._apply(payload, 1)
+        self._total_devices = len(connected_devices)
+
+    def is_consistent(self, connected_devices, rel_tol: float = 1e-9) -> bool:
+        """
+        Compares the running metrics with a full recompute over the connected devices.
+        """
+        expected = AnalyticsEngine.get_metrics(connected_devices)
+        actual = self.metrics()
+        return all(
+            math.isclose(actual[key], expected[key], rel_tol=rel_tol, abs_tol=1e-9)
+            for key in expected
+        )
@@ -0,0 +1,11 @@
+from enum import Enum
+
+
+class OverflowPolicy(Enum):
+    # make the sender wait until there is room in the queue
+    BLOCK = "block"
+    # drop the oldest queued item to make room for the new one
+    DROP_OLDEST = "drop-oldest"
+    # keep only the newest queued item of every device,
+    # dropping the oldest item if the queue is still full
+    COALESCE = "coalesce"
@@ -0,0 +1,586 @@
+import json
+import struct
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import cached_property
+from datetime import datetime
+
+from models.devices import ThermostatPayload, BulbPayload, CameraPayload, DevicePayload
+from .HistoryLog import LOCATIONS, to_epoch_us, from_epoch_us
+
+
+@dataclass(frozen=True)
+class PayloadSchema:
+    """
+    Describes the fields a device type reports, in a fixed order.
+    Field formats are struct format characters, plus "T" for timestamps
+    (sent as epoch microseconds).
+    """
+
+    device_type: str
+    tag: int
+    payload_class: type
+    fields: tuple[tuple[str, str], ...]
+
+    @cached_property
+    def field_names(self) -> tuple[str, ...]:
+        return tuple(name for name, _ in self.fields)
+
+    @cached_property
+    def timestamp_fields(self) -> tuple[str, ...]:
+        return tuple(name for name, format_ in self.fields if format_ == "T")
+
+    @cached_property
+    def delta_layouts(self) -> tuple[tuple[struct.Struct, tuple[str, ...]], ...]:
+        """
+        Bitmask of changed fields -> packer and names of those fields, in schema order.
+        """
+        layouts = []
+        for changed in range(1 << len(self.fields)):
+            fields = [field for index, field in enumerate(self.fields) if changed & (1 << index)]
+            layouts.append(
+                (
+                    struct.Struct("<" + "".join("q" if format_ == "T" else format_ for _, format_ in fields)),
+                    tuple(name for name, _ in fields),
+                )
+            )
+        return tuple(layouts)
+
+    def values(self, payload) -> tuple:
+        """
+        Returns the fields of a payload, in schema order.
+        """
+        return tuple(map(payload.__getattribute__, self.field_names))
+
+    @cached_property
+    def packer(self) -> struct.Struct:
+        return struct.Struct(
+            "<" + "".join("q" if format_ == "T" else format_ for _, format_ in self.fields)
+        )
+
+
+# device type -> schema, binary type tag -> schema and payload class -> schema
+SCHEMAS: dict[str, PayloadSchema] = {}
+SCHEMAS_BY_TAG: dict[int, PayloadSchema] = {}
+SCHEMAS_BY_CLASS: dict[type, PayloadSchema] = {}
+
+
+def register_schema(schema: PayloadSchema) -> None:
+    SCHEMAS[schema.device_type] = schema
+    SCHEMAS_BY_TAG[schema.tag] = schema
+    SCHEMAS_BY_CLASS[schema.payload_class] = schema
+
+
+register_schema(
+    PayloadSchema(
+        "THERMOSTAT",
+        0x01,
+        ThermostatPayload,
+        (("current_temp", "d"), ("target_temp", "d"), ("humidity", "d")),
+    )
+)
+register_schema(
+    PayloadSchema(
+        "BULB",
+        0x02,
+        BulbPayload,
+        (("is_on", "?"), ("brightness", "i")),
+    )
+)
+register_schema(
+    PayloadSchema(
+        "CAMERA",
+        0x03,
+        CameraPayload,
+        (("motion_detected", "?"), ("battery_level", "d"), ("last_snapshot", "T"), ("is_on", "?")),
+    )
+)
+
+LOCATION_INDEX_BY_VALUE = {location.value: index for index, location in enumerate(LOCATIONS)}
+LOCATION_BY_VALUE = {location.value: location for location in LOCATIONS}
+
+
+def _to_datetime(value) -> datetime | None:
+    # devices report timestamps as ISO strings in their status
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+class PacketCodec(ABC):
+    """
+    Turns device status into packets and packets back into payloads.
+    """
+
+    name: str
+    # whether devices send keyframes and deltas with it (see DeltaReport)
+    delta = False
+
+    @abstractmethod
+    def encode(self, device_id: str, timestamp: datetime, status: dict):
+        pass
+
+    @abstractmethod
+    def decode(self, packet) -> DevicePayload | None:
+        pass
+
+    @abstractmethod
+    def device_id(self, packet) -> str | None:
+        """
+        Reads only the id of the device that sent the packet.
+        """
+        pass
+
+    def header(self, packet) -> tuple[str, int, str | int] | None:
+        """
+        Reads only the device id, a fingerprint of the content (everything but the
+        send time, so equal fingerprints mean an unchanged status) and the send time,
+        undecoded (see packet_time).
+        Returns None if the packet has to be fully decoded instead.
+        """
+        return None
+
+
+class JsonCodec(PacketCodec):
+    """
+    The original packet format: a JSON object with device_id, an ISO timestamp
+    and the device status under "payload".
+    """
+
+    name = "json"
+
+    # encode() writes the device id first, then the timestamp
+    ID_PREFIX = '{"device_id": "'
+    TIMESTAMP_PREFIX = '", "timestamp": "'
+
+    def encode(self, device_id: str, timestamp: datetime, status: dict) -> str:
+        return json.dumps(
+            {
+                "device_id": device_id,
+                "timestamp": timestamp.isoformat(),
+                "payload": status,
+            }
+        )
+
+    def decode(self, packet) -> DevicePayload | None:
+        return self._payload(json.loads(packet))
+
+    @staticmethod
+    def _payload(packet_data: dict) -> DevicePayload | None:
+        status = packet_data["payload"]
+
+        schema = SCHEMAS.get(status["device_type"])
+        if schema is None:
+            # unknown device type
+            return None
+
+        fields = {name: status[name] for name in schema.field_names}
+        for field in schema.timestamp_fields:
+            fields[field] = datetime.fromisoformat(fields[field]) if fields[field] else None
+
+        return schema.payload_class(
+            device_id=packet_data["device_id"],
+            name=status["name"],
+            location=LOCATION_BY_VALUE[status["location"]],
+            timestamp=datetime.fromisoformat(packet_data["timestamp"]),
+            **fields,
+        )
+
+    def device_id(self, packet) -> str | None:
+        if packet.startswith(self.ID_PREFIX):
+            end = packet.find('"', len(self.ID_PREFIX))
+            if end != -1:
+                return packet[len(self.ID_PREFIX) : end]
+        # not written by encode(), parse the whole packet
+        return json.loads(packet).get("device_id")
+
+    def header(self, packet) -> tuple[str, int, str] | None:
+        if not packet.startswith(self.ID_PREFIX):
+            return None
+        end = packet.find(self.TIMESTAMP_PREFIX, len(self.ID_PREFIX))
+        if end == -1:
+            return None
+        timestamp_start = end + len(self.TIMESTAMP_PREFIX)
+        timestamp_end = packet.find('"', timestamp_start)
+        if timestamp_end == -1:
+            return None
+        return (
+            packet[len(self.ID_PREFIX) : end],
+            # the status follows the timestamp
+            hash(packet[timestamp_end:]),
+            packet[timestamp_start:timestamp_end],
+        )
+
+
+class BinaryCodec(PacketCodec):
+    """
+    Compact binary packets, laid out as (little endian):
+
+        u8 magic, u8 type tag, i64 timestamp, u8 location index,
+        u8 device id length, device id, u16 name length, name,
+        followed by the fields of the device type schema
+    """
+
+    name = "binary"
+
+    MAGIC = 0xEC
+    HEADER = struct.Struct("<BBqBB")
+    # end of the magic, type tag and timestamp
+    TIMESTAMP_END = 10
+    NAME_LENGTH = struct.Struct("<H")
+
+    def encode(self, device_id: str, timestamp: datetime, status: dict) -> bytes:
+        schema = SCHEMAS[status["device_type"]]
+        encoded_id = device_id.encode()
+        encoded_name = status["name"].encode()
+
+        fields = {name: status[name] for name in schema.field_names}
+        for field in schema.timestamp_fields:
+            fields[field] = to_epoch_us(_to_datetime(fields[field]))
+
+        return b"".join(
+            (
+                self.HEADER.pack(
+                    self.MAGIC,
+                    schema.tag,
+                    to_epoch_us(timestamp),
+                    LOCATION_INDEX_BY_VALUE[status["location"]],
+                    len(encoded_id),
+                ),
+                encoded_id,
+                self.NAME_LENGTH.pack(len(encoded_name)),
+                encoded_name,
+                schema.packer.pack(*fields.values()),
+            )
+        )
+
+    def decode(self, packet) -> DevicePayload | None:
+        if packet[0] != self.MAGIC:
+            return None
+        return self._payload(packet)[0]
+
+    def _payload(self, packet) -> tuple[DevicePayload | None, int]:
+        """
+        Decodes a full packet, whatever its magic.
+        Returns the payload and the offset of its end.
+        """
+        _, tag, timestamp, location, id_length = self.HEADER.unpack_from(packet, 0)
+        schema = SCHEMAS_BY_TAG.get(tag)
+        if schema is None:
+            return None, len(packet)
+
+        offset = self.HEADER.size
+        device_id = bytes(packet[offset : offset + id_length]).decode()
+        offset += id_length
+        (name_length,) = self.NAME_LENGTH.unpack_from(packet, offset)
+        offset += self.NAME_LENGTH.size
+        name = bytes(packet[offset : offset + name_length]).decode()
+        offset += name_length
+
+        fields = dict(zip(schema.field_names, schema.packer.unpack_from(packet, offset)))
+        for field in schema.timestamp_fields:
+            fields[field] = from_epoch_us(fields[field])
+
+        payload = schema.payload_class(
+            device_id=device_id,
+            name=name,
+            location=LOCATIONS[location],
+            timestamp=from_epoch_us(timestamp),
+            **fields,
+        )
+        return payload, offset + schema.packer.size
+
+    def device_id(self, packet) -> str | None:
+        magic, _, _, _, id_length = self.HEADER.unpack_from(packet, 0)
+        if magic != self.MAGIC:
+            return None
+        offset = self.HEADER.size
+        return bytes(packet[offset : offset + id_length]).decode()
+
+    def header(self, packet) -> tuple[str, int, int] | None:
+        magic, _, timestamp, _, id_length = self.HEADER.unpack_from(packet, 0)
+        if magic != self.MAGIC:
+            return None
+        offset = self.HEADER.size
+        return (
+            bytes(packet[offset : offset + id_length]).decode(),
+            # the device id implies the type tag
+            hash(bytes(packet[self.TIMESTAMP_END :])),
+            timestamp,
+        )
+
+
+@dataclass(slots=True)
+class DeltaReport:
+    """
+    A packet read by a delta codec: a keyframe (or a packet of a codec without
+    deltas) carries the full payload, a delta only the fields that changed since
+    the device's previous packet. Keyframes and deltas are numbered, one after
+    the other, by the device.
+    """
+
+    device_id: str
+    # None for packets of codecs without deltas
+    sequence: int | None
+    timestamp: datetime | None
+    # full payload, None for deltas
+    payload: DevicePayload | None = None
+    # changed schema fields, None for keyframes
+    changes: dict | None = None
+
+
+def _changed_fields(status: dict, previous: dict) -> tuple[PayloadSchema, dict]:
+    schema = SCHEMAS[status["device_type"]]
+    return schema, {
+        name: status[name] for name in schema.field_names if status[name] != previous.get(name)
+    }
+
+
+class JsonDeltaCodec(JsonCodec):
+    """
+    JSON keyframes (a JSON packet with a "seq" number) and deltas:
+
+        {"device_id": ..., "timestamp": ..., "seq": ..., "delta": {changed fields}}
+    """
+
+    name = "json-delta"
+    delta = True
+
+    # only deltas have it, and json.dumps escapes it inside strings
+    DELTA_KEY = '"delta": '
+
+    def encode(self, device_id: str, timestamp: datetime, status: dict, sequence: int = 0) -> str:
+        return json.dumps(
+            {
+                "device_id": device_id,
+                "timestamp": timestamp.isoformat(),
+                "payload": status,
+                "seq": sequence,
+            }
+        )
+
+    def encode_delta(
+        self, device_id: str, timestamp: datetime, sequence: int, status: dict, previous: dict
+    ) -> str:
+        _, changes = _changed_fields(status, previous)
+        return json.dumps(
+            {
+                "device_id": device_id,
+                "timestamp": timestamp.isoformat(),
+                "seq": sequence,
+                "delta": changes,
+            }
+        )
+
+    def decode(self, packet) -> DevicePayload | None:
+        # deltas only mean something merged into a payload (see decode_report)
+        packet_data = json.loads(packet)
+        if "delta" in packet_data:
+            return None
+        return self._payload(packet_data)
+
+    def decode_report(self, packet) -> DeltaReport | None:
+        packet_data = json.loads(packet)
+        timestamp = datetime.fromisoformat(packet_data["timestamp"])
+        if "delta" in packet_data:
+            return DeltaReport(
+                packet_data["device_id"], packet_data["seq"], timestamp, changes=packet_data["delta"]
+            )
+        payload = self._payload(packet_data)
+        if payload is None:
+            return None
+        return DeltaReport(payload.device_id, packet_data.get("seq"), timestamp, payload)
+
+
+class BinaryDeltaCodec(BinaryCodec):
+    """
+    Binary keyframes: a binary packet with its own magic and a u32 sequence number
+    at the end; and deltas, laid out as (little endian):
+
+        u8 magic, u8 type tag, i64 timestamp, u32 sequence number,
+        u8 device id length, device id, u8 bitmask of the changed schema fields,
+        followed by the changed fields, in schema order
+    """
+
+    name = "binary-delta"
+    delta = True
+
+    KEYFRAME_MAGIC = 0xEE
+    DELTA_MAGIC = 0xED
+    DELTA_HEADER = struct.Struct("<BBqIB")
+    SEQUENCE = struct.Struct("<I")
+    CHANGED = struct.Struct("<B")
+
+    def encode(self, device_id: str, timestamp: datetime, status: dict, sequence: int = 0) -> bytes:
+        packet = bytearray(super().encode(device_id, timestamp, status))
+        packet[0] = self.KEYFRAME_MAGIC
+        return bytes(packet) + self.SEQUENCE.pack(sequence)
+
+    def encode_delta(
+        self, device_id: str, timestamp: datetime, sequence: int, status: dict, previous: dict
+    ) -> bytes:
+        schema, changes = _changed_fields(status, previous)
+        encoded_id = device_id.encode()
+        changed = 0
+        for index, name in enumerate(schema.field_names):
+            if name in changes:
+                changed |= 1 << index
+        for field in schema.timestamp_fields:
+            if field in changes:
+                changes[field] = to_epoch_us(_to_datetime(changes[field]))
+        packer, _ = schema.delta_layouts[changed]
+
+        return b"".join(
+            (
+                self.DELTA_HEADER.pack(
+                    self.DELTA_MAGIC, schema.tag, to_epoch_us(timestamp), sequence, len(encoded_id)
+                ),
+                encoded_id,
+                self.CHANGED.pack(changed),
+                packer.pack(*changes.values()),
+            )
+        )
+
+    def decode(self, packet) -> DevicePayload | None:
+        if packet[0] == self.KEYFRAME_MAGIC:
+            return self._payload(packet)[0]
+        return super().decode(packet)
+
+    def device_id(self, packet) -> str | None:
+        magic = packet[0]
+        if magic == self.DELTA_MAGIC:
+            *_, id_length = self.DELTA_HEADER.unpack_from(packet, 0)
+            offset = self.DELTA_HEADER.size
+        elif magic == self.KEYFRAME_MAGIC:
+            # a keyframe starts like a binary packet
+            *_, id_length = self.HEADER.unpack_from(packet, 0)
+            offset = self.HEADER.size
+        else:
+            return super().device_id(packet)
+        return bytes(packet[offset : offset + id_length]).decode()
+
+    def decode_report(self, packet) -> DeltaReport | None:
+        magic = packet[0]
+        if magic == self.MAGIC or magic == self.KEYFRAME_MAGIC:
+            payload, end = self._payload(packet)
+            if payload is None:
+                return None
+            sequence = None
+            if magic == self.KEYFRAME_MAGIC:
+                (sequence,) = self.SEQUENCE.unpack_from(packet, end)
+            return DeltaReport(payload.device_id, sequence, payload.timestamp, payload)
+
+        if magic != self.DELTA_MAGIC:
+            return None
+        _, tag, timestamp, sequence, id_length = self.DELTA_HEADER.unpack_from(packet, 0)
+        schema = SCHEMAS_BY_TAG.get(tag)
+        if schema is None:
+            return None
+        offset = self.DELTA_HEADER.size
+        device_id = bytes(packet[offset : offset + id_length]).decode()
+        offset += id_length
+        (changed,) = self.CHANGED.unpack_from(packet, offset)
+        packer, names = schema.delta_layouts[changed]
+
+        changes = dict(zip(names, packer.unpack_from(packet, offset + self.CHANGED.size)))
+        for field in schema.timestamp_fields:
+            if field in changes:
+                changes[field] = from_epoch_us(changes[field])
+        return DeltaReport(device_id, sequence, from_epoch_us(timestamp), changes=changes)
+
+
+CODECS: dict[str, PacketCodec] = {
+    codec.name: codec for codec in (JsonCodec(), BinaryCodec(), JsonDeltaCodec(), BinaryDeltaCodec())
+}
+
+
+def negotiate_codec(offered, preferred) -> PacketCodec:
+    """
+    Picks the first of the preferred codecs that the device offered,
+    falling back to JSON, which every device understands.
+    """
+    for name in preferred:
+        if name in offered and name in CODECS:
+            return CODECS[name]
+    return CODECS[JsonCodec.name]
+
+
+def decode_report(packet) -> DeltaReport | None:
+    """
+    Reads a packet of any codec, with or without deltas.
+    """
+    if isinstance(packet, str):
+        return CODECS[JsonDeltaCodec.name].decode_report(packet)
+    return CODECS[BinaryDeltaCodec.name].decode_report(packet)
+
+
+def merge_delta(payload: DevicePayload, report: DeltaReport) -> DevicePayload:
+    """
+    Returns a copy of the payload with the changes of a delta applied.
+    """
+    schema = SCHEMAS_BY_CLASS[type(payload)]
+    fields = dict(zip(schema.field_names, schema.values(payload)))
+    for name, value in report.changes.items():
+        if name in fields:
+            fields[name] = value
+    for field in schema.timestamp_fields:
+        # JSON deltas carry ISO strings
+        fields[field] = _to_datetime(fields[field])
+    return schema.payload_class(
+        device_id=payload.device_id,
+        name=payload.name,
+        location=payload.location,
+        timestamp=report.timestamp,
+        **fields,
+    )
+
+
+def decode_packet(packet) -> DevicePayload | None:
+    """
+    Decodes a packet of any codec: binary packets are bytes, JSON packets are strings.
+    """
+    if isinstance(packet, str):
+        return CODECS[JsonCodec.name].decode(packet)
+    return CODECS[BinaryCodec.name].decode(packet)
+
+
+def packet_device_id(packet) -> str | None:
+    """
+    Reads the device id of a packet of any codec, keyframes and deltas included,
+    without decoding the rest of it.
+    """
+    if isinstance(packet, str):
+        return CODECS[JsonDeltaCodec.name].device_id(packet)
+    return CODECS[BinaryDeltaCodec.name].device_id(packet)
+
+
+def packet_queue_key(packet) -> str | None:
+    """
+    Key of a packet in a bounded packet queue (see OverflowQueueMixin): its device id,
+    or None for deltas, which are never dropped or coalesced, since losing one
+    leaves a sequence gap that makes the device resync.
+    """
+    if isinstance(packet, str):
+        if JsonDeltaCodec.DELTA_KEY in packet:
+            return None
+    elif packet[0] == BinaryDeltaCodec.DELTA_MAGIC:
+        return None
+    return packet_device_id(packet)
+
+
+def packet_header(packet) -> tuple[str, int, str | int] | None:
+    """
+    Reads the header of a packet of any codec (see PacketCodec.header).
+    """
+    if isinstance(packet, str):
+        return CODECS[JsonCodec.name].header(packet)
+    return CODECS[BinaryCodec.name].header(packet)
+
+
+def packet_time(sent: str | int) -> datetime | None:
+    """
+    Decodes the send time read by packet_header: an ISO string or epoch microseconds.
+    """
+    if isinstance(sent, str):
+        return datetime.fromisoformat(sent)
+    return from_epoch_us(sent)
@@ -0,0 +1,155 @@
+import json
+import sys
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+
+
+class ReportFormat(Enum):
+    # the metrics block and messages, as printed by the controller
+    TEXT = "text"
+    # one JSON object per line, for log collectors
+    JSON = "json"
+
+
+class Reporter:
+    """
+    Writes the controller's metrics and messages (critical events, device output)
+    from a background thread, at most once every refresh_seconds, so neither
+    the consume loop nor the devices ever wait for the console.
+
+    Only the latest metrics are written at every refresh; messages are aggregated
+    between refreshes, each distinct message written once with the number of times
+    it was reported, and at most max_messages of them per refresh.
+    """
+
+    def __init__(
+        self,
+        refresh_seconds: float = 1.0,
+        report_format: ReportFormat = ReportFormat.TEXT,
+        stream=None,
+        max_messages: int = 20,
+    ):
+        """
+        stream is where reports are written (sys.stdout if not given).
+        """
+        if refresh_seconds <= 0:
+            raise ValueError("refresh_seconds must be positive")
+
+        self._refresh_seconds = refresh_seconds
+        self._format = ReportFormat(report_format)
+        self._stream = stream
+        self._max_messages = max_messages
+
+        # next time metrics are wanted, checked by the controller after every batch
+        self._due = 0.0
+        # reported since the last refresh, swapped out by the writer thread
+        self._lock = threading.Lock()
+        self._metrics: dict | None = None
+        self._messages: dict[str, int] = {}
+
+        self._reports = 0
+        self._written_messages = 0
+        self._aggregated_messages = 0
+        self._skipped_messages = 0
+
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def due(self) -> bool:
+        """
+        Returns whether the metrics should be handed over, i.e. whether the next
+        refresh does not have them yet.
+        """
+        return time.monotonic() >= self._due
+
+    def metrics(self, metrics: dict) -> None:
+        """
+        Hands over the current metrics, written at the next refresh.
+        """
+        self._due = time.monotonic() + self._refresh_seconds
+        with self._lock:
+            self._metrics = metrics
+
+    def message(self, message: str) -> None:
+        with self._lock:
+            self._messages[message] = self._messages.get(message, 0) + 1
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self._refresh_seconds):
+            self.flush()
+        # report what came in since the last refresh
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes what was reported since the last refresh.
+        """
+        with self._lock:
+            metrics, self._metrics = self._metrics, None
+            messages, self._messages = self._messages, {}
+        if metrics is None and not messages:
+            return
+
+        written = list(messages.items())[: self._max_messages]
+        skipped = sum(messages.values()) - sum(count for _, count in written)
+        self._reports += 1
+        self._written_messages += len(written)
+        self._aggregated_messages += sum(count - 1 for _, count in written)
+        self._skipped_messages += skipped
+
+        if self._format == ReportFormat.JSON:
+            report = self._format_json(metrics, written, skipped)
+        else:
+            report = self._format_text(metrics, written, skipped)
+
+        stream = self._stream if self._stream is not None else sys.stdout
+        # a single write per refresh
+        stream.write(report)
+        stream.flush()
+
+    @staticmethod
+    def _format_text(metrics: dict | None, messages: list[tuple[str, int]], skipped: int) -> str:
+        lines = [
+            message if count == 1 else f"{message} (x{count})"
+            for message, count in messages
+        ]
+        if skipped:
+            lines.append(f"... and {skipped} more messages")
+        if metrics is not None:
+            lines.append(f"""
+            AVERAGE HOUSE TEMPERATURE: {metrics["average_temperature"]:.2f} °C
+            AVERAGE HOUSE HUMIDITY: {metrics["average_humidity"]:.2f} %
+            TOTAL CONNECTED DEVICES: {metrics["total_connected_devices"]}
+            """)
+        return "".join(f"{line}\n" for line in lines)
+
+    @staticmethod
+    def _format_json(metrics: dict | None, messages: list[tuple[str, int]], skipped: int) -> str:
+        now = datetime.now().isoformat()
+        records = [
+            {"time": now, "type": "message", "message": message, "count": count}
+            for message, count in messages
+        ]
+        if skipped:
+            records.append({"time": now, "type": "skipped_messages", "count": skipped})
+        if metrics is not None:
+            records.append({"time": now, "type": "metrics", **metrics})
+        return "".join(f"{json.dumps(record)}\n" for record in records)
+
+    def close(self) -> None:
+        """
+        Stops the writer thread, after writing what is left.
+        """
+        self._stopped.set()
+        self._thread.join()
+
+    def stats(self) -> dict:
+        return {
+            "reports": self._reports,
+            "messages_written": self._written_messages,
+            "messages_aggregated": self._aggregated_messages,
+            "messages_skipped": self._skipped_messages,
+        }
@@ -0,0 +1,159 @@
+import json
+import operator
+from operator import attrgetter
+from itertools import compress, repeat
+
+from models.devices import DevicePayload
+from .CriticalEvent import CriticalEvent
+from .PacketCodec import SCHEMAS
+
+OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# the thresholds is_critical() checks, as data
+# rules of a device type are checked in order, the first matching one wins
+DEFAULT_RULES = [
+    {"device_type": "THERMOSTAT", "field": "current_temp", "op": "<", "threshold": 15.0, "event": "LOW_TEMPERATURE"},
+    {"device_type": "THERMOSTAT", "field": "current_temp", "op": ">", "threshold": 30.0, "event": "HIGH_TEMPERATURE"},
+    {"device_type": "THERMOSTAT", "field": "humidity", "op": "<", "threshold": 15.0, "event": "LOW_HUMIDITY"},
+    {"device_type": "THERMOSTAT", "field": "humidity", "op": ">", "threshold": 80.0, "event": "HIGH_HUMIDITY"},
+    {"device_type": "CAMERA", "field": "motion_detected", "op": "==", "threshold": True, "event": "MOTION_DETECTED"},
+    {"device_type": "CAMERA", "field": "battery_level", "op": "<", "threshold": 15.0, "event": "LOW_BATTERY"},
+]
+
+
+def compile_rules(rules: list[dict]) -> dict[type, list[tuple]]:
+    """
+    Validates rule definitions and compiles them into
+    payload class -> [(field, compare, threshold, critical event), ...]
+    """
+    compiled = {}
+    for rule in rules:
+        schema = SCHEMAS.get(rule["device_type"])
+        if schema is None:
+            raise ValueError(f"Unknown device type in rule: {rule}")
+        if rule["field"] not in schema.field_names:
+            raise ValueError(f"Unknown field in rule: {rule}")
+        if rule["op"] not in OPERATORS:
+            raise ValueError(f"Unknown operator in rule: {rule}")
+
+        compiled.setdefault(schema.payload_class, []).append(
+            (
+                rule["field"],
+                OPERATORS[rule["op"]],
+                rule["threshold"],
+                CriticalEvent[rule["event"]],
+            )
+        )
+    return compiled
+
+
+def compile_checks(compiled: dict[type, list[tuple]]) -> dict[type, tuple[tuple, ...]]:
+    """
+    Turns compiled rules into payload class -> ((field getter, compare, threshold, critical event), ...),
+    for evaluating one payload at a time.
+    """
+    return {
+        payload_class: tuple(
+            (attrgetter(field), compare, threshold, event)
+            for field, compare, threshold, event in rules
+        )
+        for payload_class, rules in compiled.items()
+    }
+
+
+class RulesEngine:
+    """
+    Decides which payloads are critical events, from rules declared as data.
+
+    Rules can be loaded from a JSON file (a list of rules shaped like DEFAULT_RULES)
+    and reloaded while the controller runs. Payload batches are evaluated one payload
+    at a time; the latest state in a ColumnarStore one rule at a time over whole columns.
+    """
+
+    def __init__(self, rules: list[dict] | None = None, path: str | None = None):
+        self._path = path
+        if path is not None:
+            rules = self._read(path)
+        self._set(compile_rules(DEFAULT_RULES if rules is None else rules))
+
+    def _set(self, compiled: dict[type, list[tuple]]) -> None:
+        self._rules = compiled
+        self._checks = compile_checks(compiled)
+
+    @staticmethod
+    def _read(path: str) -> list[dict]:
+        with open(path) as file:
+            return json.load(file)
+
+    def load(self, rules: list[dict]) -> None:
+        """
+        Replaces the rules. Batches being evaluated keep using the previous ones.
+        """
+        # compile first, so invalid rules leave the current ones in place
+        self._set(compile_rules(rules))
+
+    def reload(self, path: str | None = None) -> None:
+        """
+        Re-reads the rules file (or reads a new one).
+        """
+        if path is not None:
+            self._path = path
+        if self._path is None:
+            raise ValueError("No rules file to reload")
+        self.load(self._read(self._path))
+
+    def classify(self, payload: DevicePayload) -> CriticalEvent | None:
+        """
+        Evaluates a single payload, like is_critical().
+        """
+        for getter, compare, threshold, event in self._checks.get(type(payload), ()):
+            if compare(getter(payload), threshold):
+                return event
+        return None
+
+    def evaluate(self, payloads) -> list[tuple[DevicePayload, CriticalEvent]]:
+        """
+        Evaluates a batch of payloads and returns (payload, critical event) pairs,
+        in the order of the payloads.
+        """
+        results = []
+        checks = self._checks.get
+        for payload in payloads:
+            for getter, compare, threshold, event in checks(type(payload), ()):
+                if compare(getter(payload), threshold):
+                    results.append((payload, event))
+                    break
+        return results
+
+    def evaluate_store(self, store) -> list[tuple[str, CriticalEvent]]:
+        """
+        Evaluates the latest state of every device in a ColumnarStore
+        and returns (device id, critical event) pairs.
+        """
+        results = []
+        for device_type, schema in SCHEMAS.items():
+            rules = self._rules.get(schema.payload_class)
+            if not rules:
+                continue
+
+            table = store.table(device_type)
+            events: list[CriticalEvent | None] = [None] * len(table)
+            rows = range(len(table))
+            for field, compare, threshold, event in rules:
+                for row in compress(rows, map(compare, table.columns[field], repeat(threshold))):
+                    if events[row] is None:
+                        events[row] = event
+
+            results.extend(
+                (device_id, event)
+                for device_id, event in zip(table.device_ids, events)
+                if event is not None
+            )
+        return results
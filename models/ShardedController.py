@@ -0,0 +1,352 @@
+import asyncio
+import multiprocessing
+import queue
+import threading
+import zlib
+from enum import Enum
+
+from models.AnalyticsEngine import AnalyticsEngine
+from models.devices import SmartDevice
+from .BoundedQueue import PacketQueue
+from .Controller import Controller
+from .EventDeduplicator import EventDeduplicator
+from .Instrumentation import Instrumentation
+from .MetricsAccumulator import MetricsAccumulator
+from .OverflowPolicy import OverflowPolicy
+from .PacketCodec import CODECS, packet_queue_key
+from .Reporter import Reporter
+from .RulesEngine import RulesEngine
+from .StorageWorker import StorageWorker
+from .WindowedAnalytics import WindowedAnalytics
+
+
+class ShardMode(Enum):
+    # shards are asyncio tasks on the controller's event loop
+    TASK = "task"
+    # shards are separate processes, fed through multiprocessing queues
+    PROCESS = "process"
+
+
+class ControllerShard(Controller):
+    """
+    A controller responsible for a subset of the devices.
+    Logs to the storage queue of its coordinator and lets it report
+    the house-wide metrics.
+    """
+
+    def __init__(self, coordinator: "ShardedController", **kwargs):
+        super().__init__(**kwargs)
+        self._coordinator = coordinator
+
+    def _report_metrics(self) -> None:
+        self._coordinator._report_metrics()
+
+    def _register_gauges(self) -> None:
+        # the coordinator's gauges cover the queues of every shard
+        pass
+
+
+def run_process_shard(index, inbox, results, storage_options, rules) -> None:
+    """
+    Entry point of a shard process.
+
+    Receives ("connect", packet) and ("packets", [packet, ...]) messages,
+    keeps the latest payload of its devices and its partial metrics, and reports
+    critical events and metrics back to the coordinator after every batch.
+    Payloads are logged by a storage worker of the shard itself.
+    """
+    # device id -> latest payload of the devices owned by this shard
+    connected_devices = {}
+    metrics = MetricsAccumulator()
+
+    storage_options = dict(storage_options or {})
+    storage_options["path"] = f"{storage_options.get('path', 'history.log')}.{index}"
+    storage_queue = queue.Queue()
+    storage_worker = StorageWorker(storage_queue, **storage_options)
+    storage_thread = threading.Thread(target=storage_worker.run)
+    storage_thread.start()
+
+    while True:
+        message = inbox.get()
+        if message is None:
+            break
+
+        kind, data = message
+        if kind == "connect":
+            payload = next(AnalyticsEngine.parse_payload(data), None)
+            if payload is None:
+                continue
+            if payload.device_id in connected_devices:
+                metrics.remove(connected_devices[payload.device_id])
+            connected_devices[payload.device_id] = payload
+            metrics.add(payload)
+            results.put((index, [], metrics.state(), 0))
+            continue
+
+        payloads = [
+            payload
+            for packet in data
+            for payload in AnalyticsEngine.parse_payload(packet)
+            if payload.device_id in connected_devices
+        ]
+        latest = {payload.device_id: payload for payload in payloads}
+        for device_id, payload in latest.items():
+            metrics.update(connected_devices[device_id], payload)
+            connected_devices[device_id] = payload
+
+        events = rules.evaluate(latest.values())
+        results.put((index, events, metrics.state(), len(data)))
+
+        for payload in payloads:
+            storage_queue.put(payload)
+
+    storage_queue.put(None)
+    storage_thread.join()
+    # unblock the coordinator waiting for results
+    results.put(None)
+
+
+class ShardedController(Controller):
+    """
+    Controller that partitions devices across shards by a hash of their device id.
+
+    Each shard owns the registry and partial metrics of its devices; the coordinator
+    (this class) merges the partial metrics into the house-wide ones.
+    Shards are either asyncio tasks (ShardMode.TASK) or separate processes
+    (ShardMode.PROCESS), which lets packet processing use more than one core.
+    In process mode every shard logs to its own file, "<path>.<shard index>"
+    (the coordinator logs nothing, and starts no storage worker), and evaluates
+    a copy of the rules taken when the shard process started. Shard processes
+    are spawned rather than forked, since the coordinator may already run threads
+    (e.g. a Reporter's).
+    Instrumentation covers task shards; process shards are not instrumented,
+    apart from the depth of the coordinator's queues.
+    """
+
+    def __init__(
+        self,
+        shards: int = 4,
+        mode: ShardMode = ShardMode.TASK,
+        batch_size: int = 64,
+        batch_latency_ms: float = 1.0,
+        storage_options: dict | None = None,
+        codecs: tuple[str, ...] = ("json",),
+        columnar_state: bool = False,
+        rules: RulesEngine | None = None,
+        instrumentation: Instrumentation | None = None,
+        packet_queue_size: int = 0,
+        packet_overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        storage_queue_size: int = 0,
+        storage_overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        deduplicator: EventDeduplicator | None = None,
+        analytics: WindowedAnalytics | None = None,
+        reporter: Reporter | None = None,
+        lazy_decoding: bool = False,
+        log_heartbeats: bool = True,
+    ):
+        """
+        packet_queue_size bounds the packet queue of every shard.
+        analytics are fed, and packets decoded lazily, by task shards only.
+        Delta codecs are only accepted with task shards, since process shards
+        do not merge deltas.
+        """
+        if ShardMode(mode) == ShardMode.PROCESS and any(
+            name in CODECS and CODECS[name].delta for name in codecs
+        ):
+            raise ValueError("delta codecs cannot be used with process shards")
+        super().__init__(
+            batch_size,
+            batch_latency_ms,
+            storage_options,
+            # in process mode, shards log on their own
+            storage_queue=queue.Queue() if ShardMode(mode) == ShardMode.PROCESS else None,
+            codecs=codecs,
+            rules=rules,
+            instrumentation=instrumentation,
+            storage_queue_size=storage_queue_size,
+            storage_overflow=storage_overflow,
+            deduplicator=deduplicator,
+            analytics=analytics,
+            reporter=reporter,
+        )
+        self._mode = ShardMode(mode)
+        self._shard_count = shards
+
+        if self._mode == ShardMode.TASK:
+            # shards log through the storage worker of the coordinator
+            self._shards = [
+                ControllerShard(
+                    self,
+                    batch_size=batch_size,
+                    batch_latency_ms=batch_latency_ms,
+                    storage_queue=self._storage_queue,
+                    codecs=codecs,
+                    columnar_state=columnar_state,
+                    rules=self._rules,
+                    instrumentation=instrumentation,
+                    packet_queue_size=packet_queue_size,
+                    packet_overflow=packet_overflow,
+                    deduplicator=deduplicator,
+                    analytics=analytics,
+                    reporter=reporter,
+                    lazy_decoding=lazy_decoding,
+                    log_heartbeats=log_heartbeats,
+                )
+                for _ in range(shards)
+            ]
+            return
+
+        # devices send packets to a local queue per shard,
+        # which is forwarded to the shard process in batches
+        self._inboxes = [
+            PacketQueue(packet_queue_size, packet_overflow, packet_queue_key)
+            for _ in range(shards)
+        ]
+        context = multiprocessing.get_context("spawn")
+        self._process_queues = [context.Queue() for _ in range(shards)]
+        self._results = context.Queue()
+        self._partials = [MetricsAccumulator() for _ in range(shards)]
+        self._processes = [
+            context.Process(
+                target=run_process_shard,
+                args=(
+                    index,
+                    self._process_queues[index],
+                    self._results,
+                    storage_options,
+                    self._rules,
+                ),
+                daemon=True,
+            )
+            for index in range(shards)
+        ]
+        for process in self._processes:
+            process.start()
+
+    def shard_for(self, device_id: str) -> int:
+        # crc32 rather than hash(), which is randomized per process
+        return zlib.crc32(device_id.encode()) % self._shard_count
+
+    async def connect(
+        self, device: SmartDevice, payload: str, codecs: tuple[str, ...] = ()
+    ) -> asyncio.Queue:
+        """
+        Connects the device to its shard and returns the packet queue of that shard.
+        """
+        # the coordinator only keeps the device objects, to send commands to them
+        self._connected_devices.register(device)
+        index = self.shard_for(str(device.id))
+
+        if self._mode == ShardMode.TASK:
+            return await self._shards[index].connect(device, payload, codecs)
+
+        self._negotiate_codec(device, codecs)
+        device.set_reporter(self._reporter)
+        self._process_queues[index].put(("connect", payload))
+        return self._inboxes[index]
+
+    async def consume(self):
+        async with asyncio.TaskGroup() as tg:
+            if self._mode == ShardMode.TASK:
+                for shard in self._shards:
+                    tg.create_task(shard.consume())
+            else:
+                for index in range(self._shard_count):
+                    tg.create_task(self._forward(index))
+                tg.create_task(self._collect_results())
+                # critical events are handled by the coordinator
+                tg.create_task(self._dispatcher.run())
+
+    async def _forward(self, index: int):
+        # batch packets to amortize the cost of sending them to another process
+        while True:
+            packets = await self._next_batch(self._inboxes[index])
+            self._process_queues[index].put(("packets", packets))
+
+    async def _collect_results(self):
+        # results are received by a daemon thread,
+        # so waiting for them never holds up event loop shutdown
+        results = asyncio.Queue()
+        threading.Thread(
+            target=self._receive_results,
+            args=(asyncio.get_running_loop(), results),
+            daemon=True,
+        ).start()
+
+        while True:
+            index, events, state, processed = await results.get()
+            self._partials[index] = MetricsAccumulator.from_state(state)
+            self._processed_packets += processed
+
+            if self._deduplicator is not None:
+                # only devices with events are known here
+                events = self._deduplicator.filter(None, events)
+            for payload, critical_event in events:
+                self.handle_critical_event(payload, critical_event)
+
+            if processed:
+                self._report_metrics()
+
+    def _receive_results(self, loop, results: asyncio.Queue) -> None:
+        # runs in a separate thread
+        running_shards = self._shard_count
+        while running_shards:
+            result = self._results.get()
+            if result is None:
+                # a shard process stopped
+                running_shards -= 1
+                continue
+            loop.call_soon_threadsafe(results.put_nowait, result)
+
+    def _queued_packets(self) -> int:
+        if self._mode == ShardMode.TASK:
+            return sum(shard._packet_queue.qsize() for shard in self._shards)
+        return sum(inbox.qsize() for inbox in self._inboxes)
+
+    def queue_stats(self) -> dict:
+        """
+        Returns the storage queue statistics and the packet queue statistics
+        summed over all shards.
+        """
+        if self._mode == ShardMode.TASK:
+            packet_queues = [shard._packet_queue for shard in self._shards]
+        else:
+            packet_queues = self._inboxes
+
+        packet_stats = [packet_queue.stats() for packet_queue in packet_queues]
+        packet_queue = dict(packet_stats[0])
+        for counter in ("maxsize", "depth", "dropped", "coalesced"):
+            packet_queue[counter] = sum(stats[counter] for stats in packet_stats)
+
+        return {
+            "packet_queue": packet_queue,
+            "storage_queue": self._storage_queue_stats(),
+        }
+
+    def get_metrics(self, recompute: bool = False) -> dict:
+        """
+        Returns the house-wide metrics, merged from the partial metrics of every shard.
+        """
+        if self._mode == ShardMode.PROCESS:
+            return MetricsAccumulator.merge(self._partials).metrics()
+
+        if recompute:
+            for shard in self._shards:
+                shard.get_metrics(recompute=True)
+        return MetricsAccumulator.merge(shard._metrics for shard in self._shards).metrics()
+
+    @property
+    def processed_packets(self) -> int:
+        if self._mode == ShardMode.PROCESS:
+            return self._processed_packets
+        return sum(shard.processed_packets for shard in self._shards)
+
+    def end_storage_thread(self):
+        if self._mode == ShardMode.PROCESS:
+            # stop shard processes, which stop their own storage workers
+            for process_queue in self._process_queues:
+                process_queue.put(None)
+            for process in self._processes:
+                process.join()
+
+        super().end_storage_thread()
@@ -1,27 +1,448 @@
-from queue import Queue
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Empty
+
+from .DurabilityPolicy import DurabilityPolicy
+from .Instrumentation import Instrumentation
+from .HistoryLog import LogFormat, TextLogEncoder, BinaryLogEncoder
+from .HistoryIndex import HistoryIndexWriter, index_path, resume_log
+from .LogRotation import (
+    LogCompression,
+    compress_segment,
+    list_segments,
+    remove_segment,
+    segment_path,
+)
+
+
+class LogMarker:
+    """
+    Put on the storage queue to learn where the payloads queued before it
+    end in the log: once they are written, the worker resolves the marker
+    with the (segment number, offset) of that position.
+    """
+
+    # never coalesced with payloads by a StorageQueue
+    device_id = None
+
+    def __init__(self):
+        self._position: tuple[int, int] | None = None
+        self._written = threading.Event()
+
+    def resolve(self, position: tuple[int, int]) -> None:
+        self._position = position
+        self._written.set()
+
+    def wait(self, timeout: float | None = None) -> tuple[int, int] | None:
+        """
+        Returns the position, or None if it was not written within timeout.
+        """
+        self._written.wait(timeout)
+        return self._position
 
 
 class StorageWorker:
-    def __init__(self, queue: Queue):
+    def __init__(
+        self,
+        queue: Queue,
+        path: str = "history.log",
+        batch_size: int = 512,
+        batch_latency_ms: float = 5.0,
+        durability: DurabilityPolicy = DurabilityPolicy.EVERY_BATCH,
+        flush_interval_ms: float = 1000.0,
+        fsync: bool = False,
+        log_format: LogFormat = LogFormat.TEXT,
+        instrumentation: Instrumentation | None = None,
+        index_block_size: int | None = None,
+        append: bool = True,
+        rotate_bytes: int | None = None,
+        rotate_seconds: float | None = None,
+        compression: LogCompression = LogCompression.NONE,
+        compression_workers: int = 1,
+        retention_segments: int | None = None,
+        retention_seconds: float | None = None,
+    ):
+        """
+        Logs payloads from the queue to a file using group commit:
+        every payload already waiting in the queue (up to batch_size, waiting at most
+        batch_latency_ms for more) is written with a single write call.
+
+        durability selects when written data is flushed to the OS
+        (see DurabilityPolicy), flush_interval_ms is used by DurabilityPolicy.INTERVAL_MS,
+        and if fsync is set, every flush is followed by an fsync to reach the disk.
+
+        log_format selects between the repr() text log and the compact binary log
+        (see HistoryLog).
+
+        If instrumentation is given, the latency of every commit is recorded in it.
+
+        If index_block_size is given (64 KiB suits most logs), a sparse index of the log
+        is kept in "<path>.idx", with an entry per index_block_size bytes of log
+        (see HistoryIndex, which queries the log through it, and scans the whole log
+        without it).
+
+        If append is set, an existing log is continued instead of truncated.
+        The log is sealed once it reaches rotate_bytes or is rotate_seconds old:
+        it is renamed to "<path>.000001", "<path>.000002", ... and a new log is started.
+        Sealed segments are compressed (see LogCompression) by a pool of
+        compression_workers processes, or in the worker's own thread if that is 0.
+        Only the newest retention_segments sealed segments, and those younger than
+        retention_seconds, are kept.
+        """
         self._queue = queue
+        self._path = path
+        self._batch_size = batch_size
+        self._batch_latency_ms = batch_latency_ms
+        self._durability = DurabilityPolicy(durability)
+        self._flush_interval_ms = flush_interval_ms
+        self._fsync = fsync
+        self._log_format = LogFormat(log_format)
+        self._instruments = instrumentation
+        self._index_block_size = index_block_size
+        self._append = append
+        self._rotate_bytes = rotate_bytes
+        self._rotate_seconds = rotate_seconds
+        self._compression = LogCompression(compression)
+        self._compression_workers = compression_workers
+        self._retention_segments = retention_segments
+        self._retention_seconds = retention_seconds
+
+        # the segment being written, see _open_segment
+        self._file = None
+        self._encoder = None
+        self._index = None
+        self._header_size = 0
+        self._segment_opened = 0.0
+
+        segments = list_segments(path)
+        self._next_segment = segments[-1][0] + 1 if segments else 1
+        self._compressor: ProcessPoolExecutor | None = None
+        # sealed segments waiting for the process pool
+        self._compressing: set[str] = set()
+        # markers taken off the queue, resolved once the batch before them is written
+        self._markers: list[LogMarker] = []
+        # set once the log is open (and an existing one prepared for appending)
+        self.ready = threading.Event()
+
+        # statistics, for tuning the durability policy
+        self._batches = 0
+        self._records = 0
+        self._max_batch_size = 0
+        self._commit_seconds = 0.0
+        self._max_commit_seconds = 0.0
+        self._rotations = 0
+        self._segments_compressed = 0
+        self._compression_errors = 0
+        self._compressed_bytes_in = 0
+        self._compressed_bytes_out = 0
+        self._compression_seconds = 0.0
+        self._segments_removed = 0
 
     def run(self):
         # runs in a separate thread
 
-        with open("history.log", "w") as file:
-            while True:
-                # this will block
-                # until there is something in the queue
-                log = self._queue.get()
+        self._open_segment(self._append)
+        self.ready.set()
+        last_flush = time.monotonic()
+        pending_flush = False
+        running = True
+
+        while running:
+            deadlines = []
+            if pending_flush and self._durability == DurabilityPolicy.INTERVAL_MS:
+                # wake up in time to flush data written in an earlier batch
+                deadlines.append(last_flush + self._flush_interval_ms / 1000)
+            if self._rotate_seconds is not None and self._segment_written():
+                # and to seal a segment that is old enough, even if no more payloads arrive
+                deadlines.append(self._segment_opened + self._rotate_seconds)
+            timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+
+            batch, running = self._next_batch(timeout)
+
+            start = time.perf_counter()
+            if batch:
+                offset = self._file.tell()
+                self._write(self._file, self._encoder, batch)
+                if self._index is not None:
+                    self._index.add(offset, self._file.tell() - offset, batch)
+                pending_flush = True
+
+            if pending_flush and self._should_flush(last_flush):
+                self._flush(self._file)
+                if self._index is not None:
+                    # readers see the index as far as the log
+                    self._index.flush()
+                last_flush = time.monotonic()
+                pending_flush = False
+
+            if batch:
+                self._record_commit(len(batch), time.perf_counter() - start)
+
+            for marker in self._markers:
+                # the segment is numbered when it is sealed
+                marker.resolve((self._next_segment, self._file.tell()))
+            self._markers.clear()
+
+            if self._should_rotate():
+                # sealing flushes the segment
+                self._rotate()
+                last_flush = time.monotonic()
+                pending_flush = False
+
+        self._close_segment()
+        if self._compressor is not None:
+            # wait for the segments still being compressed
+            self._compressor.shutdown(wait=True)
+        self._apply_retention()
+
+    def _open_segment(self, append: bool) -> None:
+        """
+        Opens the log for writing, continuing it if append is set and it exists.
+        """
+        encoder = (
+            BinaryLogEncoder()
+            if self._log_format == LogFormat.BINARY
+            else TextLogEncoder()
+        )
+        self._header_size = len(encoder.header())
+
+        file = None
+        if append and os.path.exists(self._path) and os.path.getsize(self._path) > 0:
+            try:
+                size, index = resume_log(self._path, self._log_format, encoder, self._index_block_size)
+            except ValueError:
+                # written in another format, set it aside as a sealed segment
+                self._seal()
+            else:
+                file = open(self._path, "r+b")
+                # overwrite a record left partially written
+                file.truncate(size)
+                file.seek(size)
+
+        if file is None:
+            index = None
+            if self._index_block_size is not None:
+                index = HistoryIndexWriter(self._path, self._log_format, encoder, self._index_block_size)
+            elif os.path.exists(index_path(self._path)):
+                # left from an earlier log, it would not match this one
+                os.remove(index_path(self._path))
+            file = open(self._path, "wb")
+            file.write(encoder.header())
+
+        self._file = file
+        self._encoder = encoder
+        self._index = index
+        self._segment_opened = time.monotonic()
+
+    def _close_segment(self) -> None:
+        self._flush(self._file)
+        self._file.close()
+        if self._index is not None:
+            self._index.close()
+
+    def _segment_written(self) -> bool:
+        return self._file.tell() > self._header_size
+
+    def _should_rotate(self) -> bool:
+        if not self._segment_written():
+            return False
+        if self._rotate_bytes is not None and self._file.tell() >= self._rotate_bytes:
+            return True
+        return (
+            self._rotate_seconds is not None
+            and time.monotonic() - self._segment_opened >= self._rotate_seconds
+        )
+
+    def _rotate(self) -> None:
+        self._close_segment()
+        self._seal()
+        self._apply_retention()
+        self._open_segment(False)
+
+    def _seal(self) -> None:
+        """
+        Renames the (closed) log and its index to the next segment, and compresses it.
+        """
+        segment = segment_path(self._path, self._next_segment)
+        self._next_segment += 1
+        os.replace(self._path, segment)
+        if os.path.exists(index_path(self._path)):
+            os.replace(index_path(self._path), index_path(segment))
+        self._rotations += 1
+
+        if self._compression == LogCompression.NONE:
+            return
+        if self._compression_workers == 0:
+            # in the writer thread, which stalls writing until the segment is compressed
+            self._record_compression(compress_segment(segment, self._compression))
+            return
+
+        if self._compressor is None:
+            self._compressor = ProcessPoolExecutor(max_workers=self._compression_workers)
+        self._compressing.add(segment)
+        future = self._compressor.submit(compress_segment, segment, self._compression)
+        future.add_done_callback(lambda future: self._compressed(segment, future))
+
+    def _compressed(self, segment: str, future) -> None:
+        # runs in the process pool's thread
+        self._compressing.discard(segment)
+        if future.exception() is not None:
+            self._compression_errors += 1
+        else:
+            self._record_compression(future.result())
+
+    def _record_compression(self, result: tuple[int, int, float]) -> None:
+        size, compressed_size, seconds = result
+        self._segments_compressed += 1
+        self._compressed_bytes_in += size
+        self._compressed_bytes_out += compressed_size
+        self._compression_seconds += seconds
+
+    def _apply_retention(self) -> None:
+        if self._retention_segments is None and self._retention_seconds is None:
+            return
+
+        # segments still being compressed are left to a later pass
+        segments = [
+            segment
+            for _, segment in list_segments(self._path)
+            if segment not in self._compressing
+        ]
+        expired = []
+        if self._retention_segments is not None:
+            expired = segments[: max(0, len(segments) - self._retention_segments)]
+            segments = segments[len(expired) :]
+        if self._retention_seconds is not None:
+            oldest = time.time() - self._retention_seconds
+            expired += [segment for segment in segments if os.path.getmtime(segment) < oldest]
+
+        for segment in expired:
+            remove_segment(segment)
+            self._segments_removed += 1
+
+    def _next_batch(self, timeout: float | None) -> tuple[list, bool]:
+        """
+        Collects the next batch of logs from the queue.
+        Returns the batch and whether the worker should keep running.
+        """
+        batch = []
+        try:
+            # this will block
+            # until there is something in the queue (or the flush timeout passes)
+            log = self._queue.get(timeout=timeout)
+        except Empty:
+            return batch, True
+
+        deadline = time.monotonic() + self._batch_latency_ms / 1000
+        while True:
+            # condition to explicitly break the loop and
+            # end thread
+            # if there is 'None' in the queue, we break
+            if log is None:
+                return batch, False
+            if isinstance(log, LogMarker):
+                # the batch ends at the marker
+                self._markers.append(log)
+                return batch, True
+
+            batch.append(log)
+            if len(batch) >= self._batch_size:
+                return batch, True
+
+            try:
+                log = self._queue.get_nowait()
+            except Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return batch, True
+                try:
+                    log = self._queue.get(timeout=remaining)
+                except Empty:
+                    return batch, True
+
+    def _write(self, file, encoder, batch: list) -> None:
+        if self._durability == DurabilityPolicy.EVERY_RECORD:
+            for log in batch:
+                file.write(encoder.encode((log,)))
+                self._flush(file)
+        else:
+            # write the whole batch at once
+            file.write(encoder.encode(batch))
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def log_format(self) -> LogFormat:
+        return self._log_format
+
+    @property
+    def active_segment(self) -> int:
+        """
+        Number the log being written gets when it is sealed.
+        """
+        return self._next_segment
+
+    def _should_flush(self, last_flush: float) -> bool:
+        if self._durability == DurabilityPolicy.EVERY_BATCH:
+            return True
+        if self._durability == DurabilityPolicy.INTERVAL_MS:
+            return (time.monotonic() - last_flush) * 1000 >= self._flush_interval_ms
+        # every-record batches are already flushed while writing,
+        # os-default is never flushed explicitly
+        return False
+
+    def _flush(self, file) -> None:
+        # flush to hand data over to the OS
+        file.flush()
+        if self._fsync:
+            # and force it to disk
+            os.fsync(file.fileno())
 
-                # condition to explicitly break the loop and
-                # end thread
-                # if there is 'None' in the queue, we break
-                if log is None:
-                    break
+    def _record_commit(self, batch_size: int, seconds: float) -> None:
+        self._batches += 1
+        self._records += batch_size
+        self._max_batch_size = max(self._max_batch_size, batch_size)
+        self._commit_seconds += seconds
+        self._max_commit_seconds = max(self._max_commit_seconds, seconds)
 
-                # write log in file
-                file.write(f"{log}\n")
-                # flush to write immediately
-                file.flush()
+        if self._instruments is not None:
+            self._instruments.record("storage_commit", int(seconds * 1e9))
+            self._instruments.count("storage_records", batch_size)
 
+    def stats(self) -> dict:
+        """
+        Returns batch size and commit latency statistics.
+        """
+        batches = self._batches
+        return {
+            "durability": self._durability.value,
+            "batches": batches,
+            "records": self._records,
+            "average_batch_size": self._records / batches if batches else 0.0,
+            "max_batch_size": self._max_batch_size,
+            "average_commit_latency_ms": (
+                self._commit_seconds / batches * 1000 if batches else 0.0
+            ),
+            "max_commit_latency_ms": self._max_commit_seconds * 1000,
+            "queue_depth": self._queue.qsize(),
+            "rotations": self._rotations,
+            "compression": {
+                "codec": self._compression.value,
+                "segments": self._segments_compressed,
+                "pending": len(self._compressing),
+                "errors": self._compression_errors,
+                "ratio": (
+                    self._compressed_bytes_in / self._compressed_bytes_out
+                    if self._compressed_bytes_out else 0.0
+                ),
+                "throughput_mb_s": (
+                    self._compressed_bytes_in / 2**20 / self._compression_seconds
+                    if self._compression_seconds else 0.0
+                ),
+            },
+            "segments_removed": self._segments_removed,
+        }
@@ -0,0 +1,574 @@
+import asyncio
+import json
+import socket
+import struct
+from collections import deque
+
+from models.devices import DeviceCommand
+from models.devices.DeviceCommand import encode_commands, decode_commands
+from .PacketCodec import CODECS, LOCATION_BY_VALUE, packet_device_id
+
+# every frame (all little endian):
+#
+#   u32 body length, u8 kind, u32 channel, body
+#
+# A channel is a device on a connection: many devices share one connection,
+# their frames interleaved. Over UDP, a datagram holds one or more packet frames.
+FRAME_HEADER = struct.Struct("<IBI")
+
+# device -> controller: {"codecs": [...], "packet": first packet (JSON)}
+FRAME_HELLO = 0x01
+# controller -> device: name of the negotiated codec
+FRAME_WELCOME = 0x02
+# device -> controller: a JSON packet, as UTF-8
+FRAME_JSON_PACKET = 0x03
+# device -> controller: a binary packet
+FRAME_BINARY_PACKET = 0x04
+# controller -> device: a batch of commands, as encode_commands() writes them
+FRAME_COMMANDS = 0x05
+# device -> controller: JSON list of errors (None if applied), one per command
+FRAME_RESULTS = 0x06
+
+# larger frames mean a corrupt stream
+MAX_FRAME = 16 * 2**20
+UDP_RECEIVE_BUFFER = 4 * 2**20
+
+
+def frame(kind: int, channel: int, body: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(body), kind, channel) + body
+
+
+def packet_frame(channel: int, packet) -> bytes:
+    # JSON packets are strings, binary packets bytes
+    if isinstance(packet, str):
+        return frame(FRAME_JSON_PACKET, channel, packet.encode())
+    return frame(FRAME_BINARY_PACKET, channel, packet)
+
+
+def frame_packet(kind: int, body: memoryview):
+    if kind == FRAME_JSON_PACKET:
+        return str(body, "utf-8")
+    return bytes(body)
+
+
+class FrameProtocol(asyncio.Protocol):
+    """
+    Splits a stream into frames, and writes frames in batches: frames written in
+    the same event loop iteration go out with a single send, so a sender can
+    pipeline packets without waiting for the previous ones to leave.
+    """
+
+    def __init__(self):
+        self._transport = None
+        self._buffer = bytearray()
+        self._outgoing: list[bytes] = []
+        # set while the transport's write buffer is below its high-water mark
+        self._writable = asyncio.Event()
+        self._writable.set()
+        # set by a subclass to stop parsing until resume_frames()
+        self._paused = False
+        self.frames_received = 0
+        self.frames_sent = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def connection_made(self, transport) -> None:
+        self._transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self.bytes_received += len(data)
+        self._buffer += data
+        self._parse()
+
+    def _parse(self) -> None:
+        buffer = self._buffer
+        offset = 0
+        view = memoryview(buffer)
+        try:
+            while not self._paused and len(buffer) - offset >= FRAME_HEADER.size:
+                length, kind, channel = FRAME_HEADER.unpack_from(buffer, offset)
+                if length > MAX_FRAME:
+                    self._transport.close()
+                    return
+                end = offset + FRAME_HEADER.size + length
+                if end > len(buffer):
+                    break
+                self.frames_received += 1
+                self.frame_received(kind, channel, view[offset + FRAME_HEADER.size : end])
+                offset = end
+        finally:
+            view.release()
+        # the bytearray cannot be resized while a view of it exists
+        del buffer[:offset]
+
+    def resume_frames(self) -> None:
+        self._paused = False
+        self._parse()
+
+    def frame_received(self, kind: int, channel: int, body: memoryview) -> None:
+        """
+        body is only valid during the call.
+        """
+        pass
+
+    def send(self, data: bytes) -> None:
+        if self._transport is None or self._transport.is_closing():
+            raise ConnectionResetError("connection closed")
+        if not self._outgoing:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._outgoing.append(data)
+        self.frames_sent += 1
+
+    def _flush(self) -> None:
+        data = b"".join(self._outgoing)
+        self._outgoing.clear()
+        if not self._transport.is_closing():
+            self._transport.write(data)
+            self.bytes_sent += len(data)
+
+    async def drain(self) -> None:
+        """
+        Waits until the peer keeps up with the frames sent.
+        """
+        await self._writable.wait()
+
+    def pause_writing(self) -> None:
+        self._writable.clear()
+
+    def resume_writing(self) -> None:
+        self._writable.set()
+
+    def connection_lost(self, exc) -> None:
+        # wake up senders, which then find the connection closed
+        self._writable.set()
+
+
+class RemoteDevice:
+    """
+    Stands in for a device connected over the network, in the controller's registry:
+    commands sent to it travel back over its connection.
+    """
+
+    def __init__(self, connection: "ServerConnection", channel: int, status: dict, device_id: str):
+        self._connection = connection
+        self._channel = channel
+        self._id = device_id
+        self._name = status["name"]
+        self._location = LOCATION_BY_VALUE[status["location"]]
+        self._device_type = status["device_type"]
+        # futures of the command batches sent, acknowledged in order
+        self._results: deque[asyncio.Future] = deque()
+
+    def set_codec(self, codec) -> None:
+        self._connection.send(frame(FRAME_WELCOME, self._channel, codec.name.encode()))
+
+    def set_reporter(self, reporter) -> None:
+        # remote devices report on their own side
+        pass
+
+    async def receive_commands(self, commands: list[DeviceCommand]) -> list[str | None]:
+        """
+        Raises ConnectionResetError if the device's connection is lost.
+        """
+        result = asyncio.get_running_loop().create_future()
+        self._connection.send(frame(FRAME_COMMANDS, self._channel, encode_commands(commands).encode()))
+        self._results.append(result)
+        return await result
+
+    def _acknowledged(self, errors: list) -> None:
+        if self._results:
+            result = self._results.popleft()
+            if not result.done():
+                result.set_result(errors)
+
+    def _disconnected(self) -> None:
+        while self._results:
+            result = self._results.popleft()
+            if not result.done():
+                result.set_exception(ConnectionResetError(f"device {self._name} disconnected"))
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def location(self):
+        return self._location
+
+    @property
+    def device_type(self):
+        return self._device_type
+
+
+class ServerConnection(FrameProtocol):
+    def __init__(self, server: "TransportServer"):
+        super().__init__()
+        self._server = server
+        # channel -> (device, packet queue of the device)
+        self._channels: dict[int, tuple[RemoteDevice, asyncio.Queue]] = {}
+        # devices still connecting, and the packets they sent meanwhile,
+        # queued once the handshake completes
+        self._connecting: dict[int, asyncio.Task] = {}
+        self._waiting: dict[int, deque] = {}
+
+    def connection_made(self, transport) -> None:
+        super().connection_made(transport)
+        self._server._connections.add(self)
+
+    def frame_received(self, kind: int, channel: int, body: memoryview) -> None:
+        if kind == FRAME_JSON_PACKET or kind == FRAME_BINARY_PACKET:
+            entry = self._channels.get(channel)
+            if entry is not None:
+                self._server.enqueue(self, entry[1], frame_packet(kind, body))
+            elif channel in self._waiting:
+                self._waiting[channel].append(frame_packet(kind, body))
+            else:
+                self._server.dropped_packets += 1
+        elif kind == FRAME_HELLO:
+            hello = json.loads(str(body, "utf-8"))
+            self._waiting[channel] = deque()
+            self._connecting[channel] = asyncio.create_task(self._hello(channel, hello))
+        elif kind == FRAME_RESULTS:
+            entry = self._channels.get(channel)
+            if entry is not None:
+                entry[0]._acknowledged(json.loads(str(body, "utf-8")))
+
+    async def _hello(self, channel: int, hello: dict) -> None:
+        packet = hello["packet"]
+        packet_data = json.loads(packet)
+        device = RemoteDevice(self, channel, packet_data["payload"], packet_data["device_id"])
+        queue = await self._server.controller.connect(device, packet, codecs=tuple(hello["codecs"]))
+        self._server._queues[device.id] = queue
+
+        # packets arriving meanwhile are still appended, and queued in order
+        waiting = self._waiting[channel]
+        while waiting:
+            await queue.put(waiting.popleft())
+            self._server.packets += 1
+        del self._waiting[channel]
+        self._channels[channel] = (device, queue)
+        del self._connecting[channel]
+        self._server.devices += 1
+
+    def connection_lost(self, exc) -> None:
+        super().connection_lost(exc)
+        self._server._connections.discard(self)
+        for task in self._connecting.values():
+            task.cancel()
+        for device, _ in self._channels.values():
+            device._disconnected()
+
+
+class DatagramIngress(asyncio.DatagramProtocol):
+    """
+    Packets over UDP, from devices that connected over TCP. Packets carry their
+    device id, so channels are ignored: a packet goes to the packet queue its device
+    got when it connected (its shard's, with a ShardedController), and packets of
+    devices that did not connect are dropped.
+    """
+
+    def __init__(self, server: "TransportServer"):
+        self._server = server
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        server = self._server
+        offset = 0
+        while len(data) - offset >= FRAME_HEADER.size:
+            length, kind, _ = FRAME_HEADER.unpack_from(data, offset)
+            end = offset + FRAME_HEADER.size + length
+            if end > len(data) or kind not in (FRAME_JSON_PACKET, FRAME_BINARY_PACKET):
+                break
+            packet = frame_packet(kind, memoryview(data)[offset + FRAME_HEADER.size : end])
+            offset = end
+            packet_queue = server._queues.get(packet_device_id(packet))
+            if packet_queue is None:
+                server.dropped_packets += 1
+                continue
+            try:
+                packet_queue.put_nowait(packet)
+                server.packets += 1
+            except asyncio.QueueFull:
+                # datagrams are best effort, never wait for room
+                server.dropped_packets += 1
+
+
+class TransportServer:
+    """
+    Network ingress of a controller: devices connect over TCP (see ConnectionPool),
+    many of them multiplexed on a connection, and their packets are put on the
+    packet queue the controller returned when they connected, as the packets of
+    in-process devices are (the queue of their shard, with a ShardedController).
+
+    A connection stops being read while the packet queue is full (with
+    OverflowPolicy.BLOCK), so devices are held back as in-process ones are.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self._server = None
+        self._datagrams = None
+        self._connections: set[ServerConnection] = set()
+        # device id -> packet queue returned by the controller when the device connected
+        self._queues: dict[str, asyncio.Queue] = {}
+        self.devices = 0
+        self.packets = 0
+        self.dropped_packets = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0, udp_port: int | None = None) -> None:
+        """
+        Listens on host and port (any free port for 0), and for packets over UDP on
+        udp_port, if given (0 for any free port).
+        """
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: ServerConnection(self), host, port)
+        if udp_port is not None:
+            self._datagrams, _ = await loop.create_datagram_endpoint(
+                lambda: DatagramIngress(self), local_addr=(host, udp_port)
+            )
+            # datagrams arriving while the event loop is busy wait in the socket buffer
+            # (capped by the kernel's limit)
+            self._datagrams.get_extra_info("socket").setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER
+            )
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.sockets[0].getsockname()[:2]
+
+    @property
+    def udp_address(self) -> tuple[str, int] | None:
+        if self._datagrams is None:
+            return None
+        return self._datagrams.get_extra_info("sockname")[:2]
+
+    def enqueue(self, connection: ServerConnection, queue: asyncio.Queue, packet) -> None:
+        try:
+            queue.put_nowait(packet)
+            self.packets += 1
+        except asyncio.QueueFull:
+            # stop reading the connection until the packet is queued
+            connection._paused = True
+            connection._transport.pause_reading()
+            asyncio.create_task(self._enqueue_later(connection, queue, packet))
+
+    async def _enqueue_later(self, connection: ServerConnection, queue: asyncio.Queue, packet) -> None:
+        await queue.put(packet)
+        self.packets += 1
+        if not connection._transport.is_closing():
+            connection._transport.resume_reading()
+            connection.resume_frames()
+
+    async def close(self) -> None:
+        if self._datagrams is not None:
+            self._datagrams.close()
+        self._server.close()
+        for connection in list(self._connections):
+            connection._transport.close()
+        await self._server.wait_closed()
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._connections),
+            "devices": self.devices,
+            "packets": self.packets,
+            "dropped_packets": self.dropped_packets,
+            "bytes_received": sum(connection.bytes_received for connection in self._connections),
+        }
+
+
+class ClientConnection(FrameProtocol):
+    def __init__(self, pool: "ConnectionPool"):
+        super().__init__()
+        self._pool = pool
+        # channel -> device
+        self._devices: dict[int, object] = {}
+        # channel -> future of the codec the controller negotiated
+        self._welcomes: dict[int, asyncio.Future] = {}
+        self._next_channel = 0
+
+    def open_channel(self, device) -> int:
+        channel = self._next_channel
+        self._next_channel += 1
+        self._devices[channel] = device
+        return channel
+
+    def frame_received(self, kind: int, channel: int, body: memoryview) -> None:
+        if kind == FRAME_COMMANDS:
+            device = self._devices.get(channel)
+            if device is not None:
+                commands = decode_commands(str(body, "utf-8"))
+                asyncio.create_task(self._apply(device, channel, commands))
+        elif kind == FRAME_WELCOME:
+            welcome = self._welcomes.pop(channel, None)
+            if welcome is not None and not welcome.done():
+                welcome.set_result(CODECS[str(body, "utf-8")])
+
+    async def _apply(self, device, channel: int, commands: list[DeviceCommand]) -> None:
+        errors = await device.receive_commands(commands)
+        if not self._transport.is_closing():
+            self.send(frame(FRAME_RESULTS, channel, json.dumps(errors).encode()))
+
+    def connection_lost(self, exc) -> None:
+        super().connection_lost(exc)
+        for welcome in self._welcomes.values():
+            if not welcome.done():
+                welcome.set_exception(ConnectionResetError("connection to the controller lost"))
+
+
+class DatagramSender(asyncio.DatagramProtocol):
+    """
+    Sends packet frames over UDP, the frames written in the same event loop
+    iteration packed into as few datagrams of at most max_datagram bytes as they
+    fit in (a receiving event loop reads one datagram per iteration).
+    """
+
+    def __init__(self, max_datagram: int):
+        self._max_datagram = max_datagram
+        self._transport = None
+        self._outgoing: list[bytes] = []
+        self.datagrams_sent = 0
+        self.bytes_sent = 0
+
+    def connection_made(self, transport) -> None:
+        self._transport = transport
+
+    def send(self, data: bytes) -> None:
+        if not self._outgoing:
+            asyncio.get_running_loop().call_soon(self._flush)
+        self._outgoing.append(data)
+
+    def _flush(self) -> None:
+        datagram = []
+        size = 0
+        for data in self._outgoing:
+            if datagram and size + len(data) > self._max_datagram:
+                self._sendto(b"".join(datagram))
+                datagram.clear()
+                size = 0
+            datagram.append(data)
+            size += len(data)
+        if datagram:
+            self._sendto(b"".join(datagram))
+        self._outgoing.clear()
+
+    def _sendto(self, datagram: bytes) -> None:
+        self._transport.sendto(datagram)
+        self.datagrams_sent += 1
+        self.bytes_sent += len(datagram)
+
+    def close(self) -> None:
+        self._transport.close()
+
+
+class DeviceChannel:
+    """
+    What a device connected through a ConnectionPool sends its packets to,
+    in place of the controller's packet queue.
+    """
+
+    def __init__(self, connection: ClientConnection, channel: int, datagrams=None):
+        self._connection = connection
+        self._channel = channel
+        self._datagrams = datagrams
+
+    def put_nowait(self, packet) -> None:
+        if self._datagrams is not None:
+            self._datagrams.send(packet_frame(self._channel, packet))
+            return
+        self._connection.send(packet_frame(self._channel, packet))
+
+    async def put(self, packet) -> None:
+        """
+        Waits only if the controller does not keep up with the connection.
+        """
+        self.put_nowait(packet)
+        await self._connection.drain()
+
+
+class ConnectionPool:
+    """
+    Connects devices to a TransportServer over a fixed number of connections,
+    devices spread over them round-robin. Passed to SmartDevice.connect or
+    SmartDevice.run in place of the controller.
+
+    If udp_address is given, devices send their packets there over UDP (best effort)
+    once connected, in datagrams of at most max_datagram bytes; connecting and
+    commands still go over TCP.
+    """
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        connections: int = 4,
+        udp_address: tuple[str, int] | None = None,
+        max_datagram: int = 1400,
+    ):
+        if connections < 1:
+            raise ValueError("connections must be at least 1")
+        self._address = address
+        self._udp_address = udp_address
+        self._max_datagram = max_datagram
+        self._size = connections
+        # connections, opened on first use
+        self._connections: list[asyncio.Future] = []
+        self._datagrams = None
+        self._next = 0
+
+    async def _connection(self) -> ClientConnection:
+        index = self._next % self._size
+        self._next += 1
+        if index == len(self._connections):
+            # devices connecting meanwhile wait for the same connection
+            opening = asyncio.ensure_future(self._open())
+            self._connections.append(opening)
+        return await self._connections[index]
+
+    async def _open(self) -> ClientConnection:
+        loop = asyncio.get_running_loop()
+        _, connection = await loop.create_connection(lambda: ClientConnection(self), *self._address)
+        return connection
+
+    async def connect(self, device, payload: str, codecs: tuple[str, ...] = ()) -> DeviceChannel:
+        """
+        Connects the device to the controller, like Controller.connect, and returns
+        the channel the device sends its packets to.
+        """
+        connection = await self._connection()
+        channel = connection.open_channel(device)
+        welcome = asyncio.get_running_loop().create_future()
+        connection._welcomes[channel] = welcome
+        connection.send(
+            frame(FRAME_HELLO, channel, json.dumps({"codecs": list(codecs), "packet": payload}).encode())
+        )
+        device.set_codec(await welcome)
+
+        if self._udp_address is not None and self._datagrams is None:
+            loop = asyncio.get_running_loop()
+            _, self._datagrams = await loop.create_datagram_endpoint(
+                lambda: DatagramSender(self._max_datagram), remote_addr=self._udp_address
+            )
+        return DeviceChannel(connection, channel, self._datagrams)
+
+    async def close(self) -> None:
+        for opening in self._connections:
+            connection = await opening
+            connection._transport.close()
+        if self._datagrams is not None:
+            self._datagrams.close()
+
+    def stats(self) -> dict:
+        connections = [opening.result() for opening in self._connections if opening.done()]
+        stats = {
+            "connections": len(connections),
+            "devices": sum(len(connection._devices) for connection in connections),
+            "frames_sent": sum(connection.frames_sent for connection in connections),
+            "bytes_sent": sum(connection.bytes_sent for connection in connections),
+        }
+        if self._datagrams is not None:
+            stats["datagrams_sent"] = self._datagrams.datagrams_sent
+            stats["bytes_sent"] += self._datagrams.bytes_sent
+        return stats
@@ -0,0 +1,252 @@
+import math
+import time
+from array import array
+
+from models.devices import DevicePayload
+from .DeviceLocation import DeviceLocation
+from .PacketCodec import SCHEMAS, PayloadSchema
+
+# schema field formats aggregated over time (booleans as 0/1, so their mean is a fraction)
+NUMERIC_FORMATS = frozenset({"d", "i", "?"})
+
+
+class BucketRing:
+    """
+    Time buckets of one (device type, location) pair: per bucket, the number of
+    payloads and the sum, min and max of every numeric field. Buckets are reused
+    once they fall out of the history, so memory stays fixed.
+    """
+
+    def __init__(self, schema: PayloadSchema, slots: int):
+        self.device_type = schema.device_type
+        self.field_names = [name for name, format_ in schema.fields if format_ in NUMERIC_FORMATS]
+        # bucket number held by every slot, -1 for never used
+        self.buckets = array("q", [-1]) * slots
+        self.counts = array("q", [0]) * slots
+        # field -> (sums, mins, maxs)
+        self.columns = {
+            name: (array("d", [0.0]) * slots, array("d", [0.0]) * slots, array("d", [0.0]) * slots)
+            for name in self.field_names
+        }
+        self._columns = [(name, *arrays) for name, arrays in self.columns.items()]
+
+    def add(self, bucket: int, slot: int, payload: DevicePayload) -> bool:
+        """
+        Adds a payload to a bucket. Returns False, leaving the ring as it was,
+        if the slot already holds a newer bucket (the payload is too old to keep).
+        """
+        held = self.buckets[slot]
+        if held != bucket:
+            if held > bucket:
+                return False
+            # the slot held an expired bucket
+            self.buckets[slot] = bucket
+            self.counts[slot] = 1
+            for name, sums, mins, maxs in self._columns:
+                value = getattr(payload, name)
+                sums[slot] = mins[slot] = maxs[slot] = value
+            return True
+
+        self.counts[slot] += 1
+        for name, sums, mins, maxs in self._columns:
+            value = getattr(payload, name)
+            sums[slot] += value
+            if value < mins[slot]:
+                mins[slot] = value
+            elif value > maxs[slot]:
+                maxs[slot] = value
+        return True
+
+
+class WindowedAnalytics:
+    """
+    Rolling count, mean, min, max and rate of every numeric payload field,
+    per device location and device type, over windows of up to the longest
+    configured one (e.g. the last minute, 15 minutes or hour).
+
+    Payloads are pre-aggregated into time buckets of bucket_seconds, kept in a fixed
+    ring per (device type, location) pair; a query combines the buckets of its window,
+    so neither updates nor queries depend on how much history was recorded.
+    Windows are rounded up to whole buckets and include the current bucket.
+
+    Payloads may be recorded out of order (e.g. when replaying the history log),
+    but those older than the kept history are ignored, and counted in expired.
+    """
+
+    def __init__(
+        self,
+        windows: tuple[float, ...] = (60.0, 900.0, 3600.0),
+        bucket_seconds: float = 10.0,
+        clock=time.time,
+    ):
+        if bucket_seconds <= 0:
+            raise ValueError("bucket_seconds must be positive")
+
+        self._windows = tuple(windows)
+        self._bucket_seconds = bucket_seconds
+        self._slots = math.ceil(max(self._windows) / bucket_seconds)
+        self._clock = clock
+
+        # (payload class, location) -> bucket ring, created on the first payload
+        self._rings: dict[tuple[type, DeviceLocation], BucketRing] = {}
+        self._schemas = {schema.payload_class: schema for schema in SCHEMAS.values()}
+        # newest bucket recorded so far
+        self._newest = -1
+        # payloads ignored for being older than the kept history
+        self.expired = 0
+
+    def record(self, payloads, now: float | None = None) -> None:
+        """
+        Adds a list of payloads received at time now (the clock's current time if not given).
+        """
+        if now is None:
+            now = self._clock()
+        bucket = int(now // self._bucket_seconds)
+        if bucket <= self._newest - self._slots:
+            self.expired += len(payloads)
+            return
+        self._newest = max(self._newest, bucket)
+        slot = bucket % self._slots
+
+        rings = self._rings
+        for payload in payloads:
+            key = (type(payload), payload.location)
+            ring = rings.get(key)
+            if ring is None:
+                schema = self._schemas.get(key[0])
+                if schema is None:
+                    continue
+                ring = rings[key] = BucketRing(schema, self._slots)
+            if not ring.add(bucket, slot, payload):
+                self.expired += 1
+
+    def query(
+        self,
+        field: str | None = None,
+        window: float = 60.0,
+        location: DeviceLocation | None = None,
+        device_type: str | None = None,
+        now: float | None = None,
+    ) -> dict:
+        """
+        Returns the count, rate (payloads per second), mean, min and max of a field
+        over the last window seconds, for the devices at a location and/or of a type
+        (all devices if neither is given). Without a field, only count and rate are returned.
+        """
+        window_buckets = math.ceil(window / self._bucket_seconds)
+        if window_buckets > self._slots:
+            raise ValueError(f"window longer than the kept history ({max(self._windows)} s)")
+
+        if now is None:
+            now = self._clock()
+        newest = int(now // self._bucket_seconds)
+        # (bucket, slot) of every bucket in the window
+        window_slots = [
+            (bucket, bucket % self._slots) for bucket in range(newest - window_buckets + 1, newest + 1)
+        ]
+
+        count = 0
+        total = 0.0
+        minimum = math.inf
+        maximum = -math.inf
+        for (_, ring_location), ring in self._rings.items():
+            if location is not None and ring_location != location:
+                continue
+            if device_type is not None and ring.device_type != device_type:
+                continue
+
+            columns = ring.columns.get(field) if field is not None else None
+            if field is not None and columns is None:
+                # devices of this type do not report the field
+                continue
+
+            buckets = ring.buckets
+            for bucket, slot in window_slots:
+                if buckets[slot] != bucket:
+                    # no payloads in that bucket
+                    continue
+                count += ring.counts[slot]
+                if columns is not None:
+                    sums, mins, maxs = columns
+                    total += sums[slot]
+                    minimum = min(minimum, mins[slot])
+                    maximum = max(maximum, maxs[slot])
+
+        result = {"count": count, "rate": count / (window_buckets * self._bucket_seconds)}
+        if field is not None:
+            result["mean"] = total / count if count else None
+            result["min"] = minimum if count else None
+            result["max"] = maximum if count else None
+        return result
+
+    def state(self) -> tuple:
+        """
+        Returns a copy of the buckets as a plain (picklable) tuple, e.g. for checkpoints.
+        """
+        rings = [
+            (
+                ring.device_type,
+                location.value,
+                array("q", ring.buckets),
+                array("q", ring.counts),
+                {name: tuple(array("d", column) for column in columns) for name, columns in ring.columns.items()},
+            )
+            for (_, location), ring in self._rings.items()
+        ]
+        return self._bucket_seconds, self._slots, rings
+
+    def restore(self, state: tuple) -> None:
+        """
+        Replaces the buckets with the ones of a state().
+        Raises ValueError if it was taken with other bucket settings.
+        """
+        bucket_seconds, slots, rings = state
+        if bucket_seconds != self._bucket_seconds or slots != self._slots:
+            raise ValueError("analytics state was taken with other bucket settings")
+
+        self._rings = {}
+        self._newest = -1
+        for device_type, location, buckets, counts, columns in rings:
+            schema = SCHEMAS[device_type]
+            ring = BucketRing(schema, slots)
+            ring.buckets = buckets
+            ring.counts = counts
+            ring.columns = columns
+            ring._columns = [(name, *arrays) for name, arrays in columns.items()]
+            self._rings[(schema.payload_class, DeviceLocation(location))] = ring
+            self._newest = max(self._newest, max(buckets, default=-1))
+
+    def summary(self, now: float | None = None) -> dict:
+        """
+        Returns every numeric field, per location and per device type,
+        over every configured window.
+        """
+        if now is None:
+            now = self._clock()
+
+        fields_by_type = {}
+        for ring in self._rings.values():
+            fields_by_type.setdefault(ring.device_type, ring.field_names)
+        locations = {location for _, location in self._rings}
+
+        summary = {}
+        for window in self._windows:
+            by_type = {
+                device_type: {
+                    field: self.query(field, window, device_type=device_type, now=now)
+                    for field in fields
+                }
+                for device_type, fields in fields_by_type.items()
+            }
+            by_location = {
+                location.value: {
+                    device_type: {
+                        field: self.query(field, window, location, device_type, now)
+                        for field in fields
+                    }
+                    for device_type, fields in fields_by_type.items()
+                }
+                for location in locations
+            }
+            summary[f"{window:g}s"] = {"device_type": by_type, "location": by_location}
+        return summary
@@ -1,7 +1,52 @@
 from .DeviceLocation import DeviceLocation
 from .Controller import Controller
+from .ColumnarStore import ColumnarStore
+from .CommandDispatcher import CommandDispatcher, CommandResult
+from .DurabilityPolicy import DurabilityPolicy
+from .EventDeduplicator import EventDeduplicator, TriggerMode
+from .HistoryLog import LogFormat
+from .HistoryIndex import HistoryIndex
+from .DeviceRegistry import DeviceRegistry
+from .DeviceScheduler import DeviceScheduler
+from .DecodePool import DecodePool
+from .DeltaMerger import DeltaMerger
+from .LogRotation import LogCompression
+from .Instrumentation import Instrumentation
+from .LazyDecoder import LazyDecoder
+from .MetricsAccumulator import MetricsAccumulator
+from .OverflowPolicy import OverflowPolicy
+from .Reporter import Reporter, ReportFormat
+from .RulesEngine import RulesEngine
+from .ShardedController import ShardedController, ShardMode
+from .Transport import TransportServer, ConnectionPool
+from .WindowedAnalytics import WindowedAnalytics
 
 __all__ = [
     "DeviceLocation",
     "Controller",
+    "ColumnarStore",
+    "CommandDispatcher",
+    "CommandResult",
+    "DurabilityPolicy",
+    "EventDeduplicator",
+    "TriggerMode",
+    "LogFormat",
+    "HistoryIndex",
+    "DeviceRegistry",
+    "DeviceScheduler",
+    "DecodePool",
+    "DeltaMerger",
+    "LogCompression",
+    "Instrumentation",
+    "LazyDecoder",
+    "MetricsAccumulator",
+    "OverflowPolicy",
+    "Reporter",
+    "ReportFormat",
+    "RulesEngine",
+    "ShardedController",
+    "ShardMode",
+    "TransportServer",
+    "ConnectionPool",
+    "WindowedAnalytics",
 ]
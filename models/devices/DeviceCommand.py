@@ -0,0 +1,98 @@
+import json
+from dataclasses import dataclass, fields
+from typing import ClassVar
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceCommand:
+    """
+    A command the controller sends to a device.
+    str() gives the command string devices accepted before commands were typed,
+    e.g. "set_target_temp 20.0".
+    """
+
+    name: ClassVar[str]
+
+    def arguments(self) -> tuple:
+        return tuple(getattr(self, field.name) for field in fields(self))
+
+    def to_dict(self) -> dict:
+        return {"command": self.name, **{field.name: getattr(self, field.name) for field in fields(self)}}
+
+    def __str__(self) -> str:
+        return " ".join((self.name, *map(str, self.arguments())))
+
+
+@dataclass(frozen=True, slots=True)
+class SetTargetTemp(DeviceCommand):
+    name: ClassVar[str] = "set_target_temp"
+    temperature: float
+
+
+@dataclass(frozen=True, slots=True)
+class TakeSnapshot(DeviceCommand):
+    name: ClassVar[str] = "take_snapshot"
+
+
+@dataclass(frozen=True, slots=True)
+class TurnOn(DeviceCommand):
+    name: ClassVar[str] = "turn_on"
+
+
+@dataclass(frozen=True, slots=True)
+class TurnOff(DeviceCommand):
+    name: ClassVar[str] = "turn_off"
+
+
+@dataclass(frozen=True, slots=True)
+class SetBrightness(DeviceCommand):
+    name: ClassVar[str] = "set_brightness"
+    brightness: int
+
+
+@dataclass(frozen=True, slots=True)
+class Resync(DeviceCommand):
+    """
+    Asks a device sending deltas for a keyframe, handled by every SmartDevice.
+    """
+
+    name: ClassVar[str] = "resync"
+
+
+# command name -> command class
+COMMANDS: dict[str, type[DeviceCommand]] = {
+    command.name: command
+    for command in (SetTargetTemp, TakeSnapshot, TurnOn, TurnOff, SetBrightness, Resync)
+}
+
+
+def parse_command(text: str) -> DeviceCommand:
+    """
+    Parses a command string, e.g. "set_brightness 50".
+    Raises ValueError for unknown or malformed commands.
+    """
+    name, *values = text.split()
+    command = COMMANDS.get(name)
+    if command is None:
+        raise ValueError(f"Unknown command: {text}")
+
+    command_fields = fields(command)
+    if len(values) != len(command_fields):
+        raise ValueError(f"Malformed command: {text}")
+    # field types are the argument converters (float, int)
+    return command(*(field.type(value) for field, value in zip(command_fields, values)))
+
+
+def encode_commands(commands: list[DeviceCommand]) -> str:
+    """
+    Encodes a batch of commands as JSON, to be sent like packets.
+    """
+    return json.dumps([command.to_dict() for command in commands])
+
+
+def decode_commands(data: str) -> list[DeviceCommand]:
+    commands = []
+    for item in json.loads(data):
+        item = dict(item)
+        commands.append(COMMANDS[item.pop("command")](**item))
+    return commands
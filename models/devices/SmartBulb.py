@@ -1,9 +1,10 @@
 from models import DeviceLocation
 from .SmartDevice import SmartDevice, DevicePayload
+from .DeviceCommand import DeviceCommand, TurnOn, TurnOff, SetBrightness
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class BulbPayload(DevicePayload):
     is_on: bool
     brightness: int
@@ -30,18 +31,17 @@ class SmartBulb(SmartDevice):
         # bulb state doesn't change over time unless commanded
         pass
 
-    def execute_command(self, command: str) -> None:
+    def apply_command(self, command: DeviceCommand) -> None:
         # NOTE: there are no automatic (self-applied) commands for bulbs
         #  but changes happen from user input, which get
         #  reflected to the controller
-        if command == "turn_on":
+        if isinstance(command, TurnOn):
             self._is_on = True
             self._brightness = 100
-        elif command == "turn_off":
+        elif isinstance(command, TurnOff):
             self._is_on = False
             self._brightness = 0
-        elif command.startswith("set_brightness"):
-            _, value = command.split()
-            self._brightness = int(value)
+        elif isinstance(command, SetBrightness):
+            self._brightness = command.brightness
         else:
-            print(f"Unknown command: {command}")
+            raise ValueError(f"Unsupported command: {command}")
@@ -1,10 +1,11 @@
 from datetime import datetime
 from .SmartDevice import SmartDevice, DevicePayload
+from .DeviceCommand import DeviceCommand, TakeSnapshot, TurnOff
 from dataclasses import dataclass
 import random
 
 
-@dataclass
+@dataclass(slots=True)
 class CameraPayload(DevicePayload):
     motion_detected: bool
     battery_level: int
@@ -47,14 +48,14 @@ class SmartCamera(SmartDevice):
         # decrease battery level over time
         self._battery_level -= 0.25 if self._battery_level > 0 else 0
 
-    def execute_command(self, command: str) -> None:
-        if command == "take_snapshot":
+    def apply_command(self, command: DeviceCommand) -> None:
+        if isinstance(command, TakeSnapshot):
             # take a snapshot only if on
             if self._is_on:
                 self._last_snapshot = datetime.now()
-                print(f"[{self._name}]: Snapshot taken at {self._last_snapshot}")
-        elif command == "turn_off":
+                self._report(f"[{self._name}]: Snapshot taken at {self._last_snapshot}")
+        elif isinstance(command, TurnOff):
             self._is_on = False
-            print(f"[{self._name}]: Camera turned off")
+            self._report(f"[{self._name}]: Camera turned off")
         else:
-            print(f"Unknown command: {command}")
+            raise ValueError(f"Unsupported command: {command}")
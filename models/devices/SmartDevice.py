@@ -2,67 +2,154 @@ import json
 from abc import ABC, abstractmethod
 import uuid
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from models import Controller, DeviceLocation
+from .DeviceCommand import DeviceCommand, Resync, parse_command
 import asyncio
 
 
-@dataclass
+@dataclass(slots=True)
 class DevicePayload:
     device_id: str
     name: str
     location: DeviceLocation
+    # time the device sent the payload
+    timestamp: datetime | None = field(default=None, kw_only=True)
 
 
 class SmartDevice(ABC):
+    # packet codecs the device can encode with, in order of preference
+    supported_codecs = ("binary-delta", "binary", "json-delta", "json")
+    # with a delta codec, packets sent between two keyframes
+    keyframe_interval = 12
+
     def __init__(self, name: str, location: DeviceLocation):
         self._id = uuid.uuid4()
+        self._device_id = str(self._id)
         self._name = name
         self._location = location
         self._device_type = "GENERIC"
         self._controller_queue: asyncio.Queue | None = None
+        # codec negotiated with the controller on connect (JSON until then)
+        self._codec = None
+        # the controller's reporter, if it has one, set on connect
+        self._reporter = None
+        # with a delta codec: number of the latest packet, status sent in the latest
+        # packet (None until the first keyframe), packets since the latest keyframe
+        self._sequence = 0
+        self._reported: dict | None = None
+        self._since_keyframe = 0
 
     @abstractmethod
     def get_status(self) -> dict:
         pass
 
     @abstractmethod
-    def execute_command(self, command: str) -> None:
+    def apply_command(self, command: DeviceCommand) -> None:
+        """
+        Raises ValueError for commands the device does not support.
+        """
         pass
 
+    def execute_command(self, command: str) -> None:
+        # command strings, as sent before commands were typed
+        try:
+            self._handle_command(parse_command(command))
+        except ValueError:
+            self._report(f"Unknown command: {command}")
+
+    def _handle_command(self, command: DeviceCommand) -> None:
+        if isinstance(command, Resync):
+            # the next packet is a keyframe
+            self._reported = None
+            return
+        self.apply_command(command)
+
+    async def receive_commands(self, commands: list[DeviceCommand]) -> list[str | None]:
+        """
+        Applies a batch of commands from the controller's command dispatcher.
+        Returns an error message (None if applied) for every command.
+        """
+        errors = []
+        for command in commands:
+            try:
+                self._handle_command(command)
+                errors.append(None)
+            except ValueError as error:
+                errors.append(str(error))
+        return errors
+
     @abstractmethod
     def update_state(self) -> None:
         pass
 
-    async def connect(self, controller: Controller) -> None:
-        # send a payload to the controller to register the device
+    def set_codec(self, codec) -> None:
+        """
+        Called by the controller with the codec negotiated on connect.
+        """
+        self._codec = codec
+
+    def set_reporter(self, reporter) -> None:
+        """
+        Called by the controller on connect, with the Reporter its output goes through.
+        """
+        self._reporter = reporter
+
+    def _report(self, message: str) -> None:
+        if self._reporter is not None:
+            self._reporter.message(message)
+        else:
+            print(message)
+
+    def build_packet(self):
         status = self.get_status()
+        if self._codec is not None and self._codec.delta:
+            return self._build_report(status)
+        if self._codec is not None:
+            return self._codec.encode(self._device_id, datetime.now(), status)
+
         packet = {
-            "device_id": str(self._id),
+            "device_id": self._device_id,
             "timestamp": datetime.now().isoformat(),
             "payload": status,
         }
-        self._controller_queue = await controller.connect(self, json.dumps(packet))
-        print(f"Device {self._name} connected.")
+        return json.dumps(packet)
+
+    def _build_report(self, status: dict):
+        # a keyframe every keyframe_interval packets, the changed fields in between
+        self._sequence += 1
+        previous = self._reported
+        self._reported = status
+        if previous is None or self._since_keyframe >= self.keyframe_interval:
+            self._since_keyframe = 0
+            return self._codec.encode(self._device_id, datetime.now(), status, self._sequence)
+        self._since_keyframe += 1
+        return self._codec.encode_delta(self._device_id, datetime.now(), self._sequence, status, previous)
 
-    async def run(self, controller: Controller) -> None:
+    async def connect(self, controller: Controller) -> None:
+        # send a payload to the controller to register the device
+        # (always JSON, since no codec is negotiated yet)
+        self._codec = None
+        self._reported = None
+        self._controller_queue = await controller.connect(
+            self, self.build_packet(), codecs=self.supported_codecs
+        )
+        self._report(f"Device {self._name} connected.")
+
+    async def run(self, controller: Controller, interval: float = 5.0) -> None:
         await self.connect(controller)
 
         while True:
-            status = self.get_status()
-            packet = {
-                "device_id": str(self._id),
-                "timestamp": datetime.now().isoformat(),
-                "payload": status,
-            }
+            await self.send_status()
+            await asyncio.sleep(interval)  # send status every interval (5 seconds by default)
 
-            await self._controller_queue.put(json.dumps(packet))
+    async def send_status(self) -> None:
+        # waits only if the controller's packet queue is bounded and full
+        await self._controller_queue.put(self.build_packet())
 
-            # update device state to simulate changes over time
-            self.update_state()
-
-            await asyncio.sleep(5)  # send status every 5 seconds
+        # update device state to simulate changes over time
+        self.update_state()
 
     @property
     def id(self):
@@ -71,3 +158,11 @@ class SmartDevice(ABC):
     @property
     def name(self):
         return self._name
+
+    @property
+    def location(self):
+        return self._location
+
+    @property
+    def device_type(self):
+        return self._device_type
@@ -1,8 +1,9 @@
 from dataclasses import dataclass
 from .SmartDevice import SmartDevice, DevicePayload
+from .DeviceCommand import DeviceCommand, SetTargetTemp
 
 
-@dataclass
+@dataclass(slots=True)
 class ThermostatPayload(DevicePayload):
     current_temp: float
     target_temp: float
@@ -39,10 +40,9 @@ class SmartThermostat(SmartDevice):
             # decrease humidity slightly when cooling
             self._humidity -= 0.01 if self._humidity > 0 else 0
 
-    def execute_command(self, command: str) -> None:
-        if command.startswith("set_target_temp"):
-            _, value = command.split()
-            self._target_temp = float(value)
-            print(f"[{self._name}]: target temperature set to {self._target_temp}°C")
+    def apply_command(self, command: DeviceCommand) -> None:
+        if isinstance(command, SetTargetTemp):
+            self._target_temp = command.temperature
+            self._report(f"[{self._name}]: target temperature set to {self._target_temp}°C")
         else:
-            print(f"Unknown command: {command}")
+            raise ValueError(f"Unsupported command: {command}")
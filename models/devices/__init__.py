@@ -1,3 +1,12 @@
+from .DeviceCommand import (
+    DeviceCommand,
+    SetTargetTemp,
+    TakeSnapshot,
+    TurnOn,
+    TurnOff,
+    SetBrightness,
+    Resync,
+)
 from .SmartDevice import SmartDevice, DevicePayload
 from .SmartBulb import SmartBulb, BulbPayload
 from .SmartThermostat import SmartThermostat, ThermostatPayload
@@ -12,4 +21,11 @@ __all__ = [
     "ThermostatPayload",
     "CameraPayload",
     "DevicePayload",
+    "DeviceCommand",
+    "SetTargetTemp",
+    "TakeSnapshot",
+    "TurnOn",
+    "TurnOff",
+    "SetBrightness",
+    "Resync",
 ]
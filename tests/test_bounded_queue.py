@@ -0,0 +1,105 @@
+import asyncio
+from operator import attrgetter
+
+import pytest
+
+from models import OverflowPolicy
+from models.BoundedQueue import PacketQueue, StorageQueue
+from models.StorageWorker import LogMarker
+
+
+class Item:
+    def __init__(self, device_id, value):
+        self.device_id = device_id
+        self.value = value
+
+
+def drain(storage_queue):
+    items = []
+    while not storage_queue.empty():
+        items.append(storage_queue.get_nowait())
+    return items
+
+
+def values(items):
+    return [item.value if isinstance(item, Item) else item for item in items]
+
+
+def test_drop_oldest_drops_the_oldest_item():
+    storage_queue = StorageQueue(3, OverflowPolicy.DROP_OLDEST, attrgetter("device_id"))
+    for value in range(5):
+        storage_queue.put(Item(f"device-{value}", value))
+
+    assert values(drain(storage_queue)) == [2, 3, 4]
+    assert storage_queue.stats()["dropped"] == 2
+
+
+@pytest.mark.parametrize("overflow", [OverflowPolicy.DROP_OLDEST, OverflowPolicy.COALESCE])
+def test_markers_and_sentinels_are_never_dropped(overflow):
+    storage_queue = StorageQueue(3, overflow, attrgetter("device_id"))
+    marker = LogMarker()
+    storage_queue.put(marker)
+    storage_queue.put(Item("a", 1))
+    storage_queue.put(None)
+    storage_queue.put(Item("b", 2))
+    storage_queue.put(Item("c", 3))
+
+    items = drain(storage_queue)
+
+    assert items[0] is marker
+    assert values(items[1:]) == [None, 3]
+    assert storage_queue.stats()["dropped"] == 2
+
+
+@pytest.mark.parametrize("overflow", [OverflowPolicy.DROP_OLDEST, OverflowPolicy.COALESCE])
+def test_queue_of_markers_overfills_rather_than_dropping_them(overflow):
+    storage_queue = StorageQueue(2, overflow, attrgetter("device_id"))
+    markers = [LogMarker() for _ in range(3)]
+    for marker in markers:
+        storage_queue.put(marker)
+
+    assert drain(storage_queue) == markers
+    assert storage_queue.stats()["dropped"] == 0
+
+
+def test_coalesce_keeps_the_newest_item_of_every_device_in_place():
+    storage_queue = StorageQueue(3, OverflowPolicy.COALESCE, attrgetter("device_id"))
+    storage_queue.put(Item("a", 1))
+    storage_queue.put(Item("b", 2))
+    storage_queue.put(Item("a", 3))
+    storage_queue.put(Item("c", 4))
+    storage_queue.put(Item("d", 5))
+
+    assert values(drain(storage_queue)) == [2, 4, 5]
+    stats = storage_queue.stats()
+    assert (stats["coalesced"], stats["dropped"]) == (1, 1)
+
+
+def test_packet_queue_block_waits_for_room():
+    async def run():
+        packet_queue = PacketQueue(1, OverflowPolicy.BLOCK)
+        packet_queue.put_nowait("first")
+        with pytest.raises(asyncio.QueueFull):
+            packet_queue.put_nowait("second")
+
+        sender = asyncio.create_task(packet_queue.put("second"))
+        await asyncio.sleep(0)
+        assert not sender.done()
+        assert await packet_queue.get() == "first"
+        await sender
+        assert await packet_queue.get() == "second"
+        assert packet_queue.stats()["dropped"] == 0
+
+    asyncio.run(run())
+
+
+def test_packet_queue_drop_oldest_never_blocks():
+    async def run():
+        packet_queue = PacketQueue(2, OverflowPolicy.DROP_OLDEST)
+        for packet in ("a", "b", "c"):
+            packet_queue.put_nowait(packet)
+        return [packet_queue.get_nowait() for _ in range(packet_queue.qsize())], packet_queue.stats()
+
+    packets, stats = asyncio.run(run())
+    assert packets == ["b", "c"]
+    assert stats["dropped"] == 1
@@ -0,0 +1,118 @@
+import asyncio
+import queue
+import time
+
+import pytest
+
+from models import Controller, DeviceLocation
+from models.AnalyticsEngine import AnalyticsEngine
+from models.Checkpoint import ControllerState, write_snapshot
+from models.HistoryLog import LogFormat
+from models.devices import SmartThermostat, SmartBulb, ThermostatPayload, BulbPayload
+
+
+def make_devices():
+    return [
+        SmartThermostat("Thermostat 1", DeviceLocation.KITCHEN, 21.0, 22.0, 40.0),
+        SmartThermostat("Thermostat 2", DeviceLocation.GARDEN, 12.0, 20.0, 60.0),
+        SmartThermostat("Thermostat 3", DeviceLocation.BEDROOM, 19.5, 21.0, 55.0),
+        SmartBulb("Bulb 1", DeviceLocation.OFFICE, 80),
+        SmartBulb("Bulb 2", DeviceLocation.HALLWAY, 10),
+    ]
+
+
+def payload_of(device):
+    status = device.get_status()
+    if isinstance(device, SmartThermostat):
+        return ThermostatPayload(
+            str(device.id),
+            device.name,
+            device.location,
+            status["current_temp"],
+            status["target_temp"],
+            status["humidity"],
+        )
+    return BulbPayload(str(device.id), device.name, device.location, status["is_on"], status["brightness"])
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    devices = make_devices()
+    path = str(tmp_path / "checkpoint")
+    write_snapshot(
+        path,
+        ControllerState(
+            payloads=[payload_of(device) for device in devices],
+            analytics=None,
+            log_position=None,
+            log_format=LogFormat.BINARY,
+            created=time.time(),
+        ),
+    )
+    return path, devices
+
+
+@pytest.mark.parametrize("columnar_state", [False, True])
+def test_warm_start_restores_metrics(snapshot, columnar_state):
+    path, devices = snapshot
+    controller = Controller(storage_queue=queue.Queue(), columnar_state=columnar_state)
+
+    result = controller.warm_start(path)
+
+    assert result["devices"] == len(devices)
+    metrics = controller.get_metrics()
+    expected = AnalyticsEngine.get_metrics(controller._connected_devices)
+    assert metrics["total_connected_devices"] == len(devices)
+    assert metrics["average_temperature"] == pytest.approx(expected["average_temperature"])
+    assert metrics["average_humidity"] == pytest.approx(expected["average_humidity"])
+
+
+@pytest.mark.parametrize("columnar_state", [False, True])
+def test_restored_device_reconnecting_is_counted_once(snapshot, columnar_state):
+    path, devices = snapshot
+    controller = Controller(storage_queue=queue.Queue(), columnar_state=columnar_state)
+    controller.warm_start(path)
+
+    asyncio.run(devices[0].connect(controller))
+
+    assert controller.get_metrics()["total_connected_devices"] == len(devices)
+    assert controller._connected_devices.lookup(str(devices[0].id)) is devices[0]
+
+
+def test_warm_start_without_snapshot(tmp_path):
+    controller = Controller(storage_queue=queue.Queue())
+
+    assert controller.warm_start(str(tmp_path / "missing")) is None
+
+
+@pytest.mark.parametrize("log_format", [LogFormat.TEXT, LogFormat.BINARY])
+def test_warm_start_replays_the_log_after_the_snapshot(tmp_path, log_format):
+    storage_options = {"path": str(tmp_path / "history.log"), "log_format": log_format}
+    checkpoint_path = str(tmp_path / "checkpoint")
+    devices = make_devices()
+    controller = Controller(storage_options=storage_options, checkpoint_path=checkpoint_path)
+    try:
+        for device in devices:
+            asyncio.run(device.connect(controller))
+        controller._process_batch([device.build_packet() for device in devices])
+        assert asyncio.run(controller.checkpoint())["devices"] == len(devices)
+
+        # written to the log only
+        for device in devices:
+            device.update_state()
+        controller._process_batch([device.build_packet() for device in devices])
+        expected = {str(device.id): controller._connected_devices.get_payload(str(device.id)) for device in devices}
+    finally:
+        controller.end_storage_thread()
+
+    restarted = Controller(storage_options=storage_options, checkpoint_path=checkpoint_path)
+    try:
+        result = restarted.warm_start()
+    finally:
+        restarted.end_storage_thread()
+
+    assert result["devices"] == len(devices)
+    assert result["replayed"] == len(devices)
+    for device_id, payload in expected.items():
+        assert restarted._connected_devices.get_payload(device_id) == payload
+    assert restarted.get_metrics() == pytest.approx(controller.get_metrics())
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from models import ColumnarStore, DeviceLocation
+from models.AnalyticsEngine import AnalyticsEngine
+from models.ColumnarStore import ColumnarMetrics
+from models.devices import ThermostatPayload, BulbPayload
+
+LOCATIONS = list(DeviceLocation)
+
+
+def random_payload(rng, device_id):
+    location = rng.choice(LOCATIONS)
+    if rng.random() < 0.7:
+        return ThermostatPayload(
+            device_id, device_id, location, rng.uniform(5.0, 35.0), rng.uniform(15.0, 25.0), rng.uniform(0.0, 100.0)
+        )
+    return BulbPayload(device_id, device_id, location, rng.random() < 0.5, rng.randint(0, 100))
+
+
+def assert_metrics_match(actual, payloads):
+    expected = AnalyticsEngine.get_metrics(payloads)
+    assert actual["total_connected_devices"] == expected["total_connected_devices"]
+    assert actual["average_temperature"] == pytest.approx(expected["average_temperature"])
+    assert actual["average_humidity"] == pytest.approx(expected["average_humidity"])
+
+
+def test_running_sums_follow_upserts_and_removes():
+    rng = random.Random(7)
+    store = ColumnarStore()
+    payloads = {}
+
+    for step in range(2_000):
+        device_id = f"device-{rng.randrange(200)}"
+        if device_id in payloads and rng.random() < 0.2:
+            store.remove(device_id)
+            del payloads[device_id]
+        else:
+            previous = payloads.get(device_id)
+            payload = random_payload(rng, device_id)
+            if previous is not None and type(previous) is not type(payload):
+                # a device keeps its type
+                store.remove(device_id)
+            store.upsert(payload)
+            payloads[device_id] = payload
+        if step % 100 == 0:
+            assert_metrics_match(store.get_metrics(), payloads)
+
+    assert_metrics_match(store.get_metrics(), payloads)
+
+
+def test_recompute_matches_running_sums():
+    rng = random.Random(3)
+    store = ColumnarStore()
+    metrics = ColumnarMetrics(store)
+    payloads = {}
+    for index in range(500):
+        payload = random_payload(rng, f"device-{index}")
+        store.upsert(payload)
+        metrics.add(payload)
+        payloads[payload.device_id] = payload
+
+    running = metrics.metrics()
+    metrics.recompute(payloads)
+
+    assert metrics.metrics() == pytest.approx(running)
+    assert metrics.state()[2:] == (sum(isinstance(p, ThermostatPayload) for p in payloads.values()), 500)
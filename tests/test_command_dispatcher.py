@@ -0,0 +1,52 @@
+import asyncio
+
+from models import CommandDispatcher, DeviceLocation
+from models.devices import SmartThermostat, SetTargetTemp
+
+
+class FaultyThermostat(SmartThermostat):
+    async def receive_commands(self, commands):
+        raise RuntimeError("firmware fault")
+
+
+class Messages:
+    def __init__(self):
+        self.messages = []
+
+    def message(self, message):
+        self.messages.append(message)
+
+
+async def deliver(dispatcher, devices):
+    runner = asyncio.create_task(dispatcher.run())
+    for device in devices:
+        dispatcher.send(str(device.id), device, SetTargetTemp(20.0))
+        dispatcher.send(str(device.id), device, SetTargetTemp(21.0))
+    while dispatcher.pending:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    # the dispatcher is still serving devices after the fault
+    healthy = devices[-1]
+    dispatcher.send(str(healthy.id), healthy, SetTargetTemp(19.0))
+    while dispatcher.pending:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert not runner.done()
+    runner.cancel()
+
+
+def test_faulty_device_fails_its_commands_without_stopping_the_dispatcher():
+    faulty = FaultyThermostat("Faulty", DeviceLocation.KITCHEN, 18.0, 20.0, 50.0)
+    healthy = SmartThermostat("Healthy", DeviceLocation.OFFICE, 18.0, 20.0, 50.0)
+    results = []
+    reporter = Messages()
+    dispatcher = CommandDispatcher(on_result=results.append, reporter=reporter)
+
+    asyncio.run(deliver(dispatcher, [faulty, healthy]))
+
+    stats = dispatcher.stats()
+    assert stats["failed"] == 2
+    assert stats["acknowledged"] == 3
+    assert all("firmware fault" in result.error for result in results if result.device_id == str(faulty.id))
+    assert healthy.get_status()["target_temp"] == 19.0
+    assert len(reporter.messages) == 1 and str(faulty.id) in reporter.messages[0]
@@ -0,0 +1,142 @@
+import asyncio
+import queue
+
+import pytest
+
+from models import Controller, DeviceLocation, Instrumentation
+from models.devices import SmartBulb
+
+
+def test_queue_stats_with_a_plain_storage_queue():
+    storage_queue = queue.Queue()
+    storage_queue.put("payload")
+    instrumentation = Instrumentation()
+    controller = Controller(storage_queue=storage_queue, instrumentation=instrumentation)
+
+    stats = controller.queue_stats()
+
+    assert stats["storage_queue"] == {"depth": 1}
+    assert stats["packet_queue"]["depth"] == 0
+    assert instrumentation.snapshot()["gauges"]["queues"] == stats
+
+
+def drain(storage_queue):
+    items = []
+    while not storage_queue.empty():
+        items.append(storage_queue.get_nowait())
+    return items
+
+
+@pytest.mark.parametrize("codecs", [("json",), ("binary",), ("binary-delta",)])
+@pytest.mark.parametrize("log_heartbeats", [True, False])
+def test_heartbeats_are_logged(codecs, log_heartbeats):
+    storage_queue = queue.Queue()
+    controller = Controller(
+        storage_queue=storage_queue,
+        codecs=codecs,
+        lazy_decoding=True,
+        log_heartbeats=log_heartbeats,
+    )
+    bulb = SmartBulb("Bulb", DeviceLocation.OFFICE, 40)
+    asyncio.run(bulb.connect(controller))
+
+    controller._process_batch([bulb.build_packet()])
+    # unchanged: a heartbeat
+    controller._process_batch([bulb.build_packet()])
+
+    logged = drain(storage_queue)
+    last_seen = controller._connected_devices.last_seen(str(bulb.id))
+    if log_heartbeats:
+        assert [payload.brightness for payload in logged] == [40, 40]
+        assert logged[0].timestamp < logged[1].timestamp == last_seen
+    else:
+        assert len(logged) == 1 and logged[0].timestamp < last_seen
+
+
+async def next_batch(controller, queued, later=(), later_delay=0.0):
+    for packet in queued:
+        controller._packet_queue.put_nowait(packet)
+
+    async def send_later():
+        await asyncio.sleep(later_delay)
+        for packet in later:
+            controller._packet_queue.put_nowait(packet)
+
+    sender = asyncio.create_task(send_later())
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    batch = await controller._next_batch()
+    elapsed = loop.time() - start
+    await sender
+    return batch, elapsed
+
+
+def test_batch_flushes_at_batch_size_without_waiting():
+    controller = Controller(storage_queue=queue.Queue(), batch_size=4, batch_latency_ms=10_000.0)
+
+    async def run():
+        first = await next_batch(controller, range(10))
+        second = await next_batch(controller, [])
+        return first, second, controller._packet_queue.qsize()
+
+    (first, first_elapsed), (second, second_elapsed), left = asyncio.run(run())
+    assert first == [0, 1, 2, 3] and second == [4, 5, 6, 7]
+    assert left == 2
+    assert first_elapsed < 1.0 and second_elapsed < 1.0
+
+
+def test_batch_flushes_when_batch_latency_runs_out():
+    controller = Controller(storage_queue=queue.Queue(), batch_size=100, batch_latency_ms=50.0)
+
+    batch, elapsed = asyncio.run(next_batch(controller, ["a", "b", "c"]))
+
+    assert batch == ["a", "b", "c"]
+    assert 0.04 <= elapsed < 1.0
+
+
+def test_batch_takes_packets_arriving_while_it_waits():
+    controller = Controller(storage_queue=queue.Queue(), batch_size=3, batch_latency_ms=10_000.0)
+
+    batch, elapsed = asyncio.run(next_batch(controller, ["a"], later=["b", "c", "d"], later_delay=0.01))
+
+    # full once the later packets arrive, long before the latency runs out
+    assert batch == ["a", "b", "c"]
+    assert elapsed < 1.0
+    assert controller._packet_queue.qsize() == 1
+
+
+def test_default_batches_hold_a_single_packet():
+    controller = Controller(storage_queue=queue.Queue())
+
+    batch, _ = asyncio.run(next_batch(controller, ["a", "b"]))
+
+    assert batch == ["a"]
+
+
+def test_micro_batched_consume_processes_every_packet():
+    storage_queue = queue.Queue()
+    controller = Controller(storage_queue=storage_queue, batch_size=8, batch_latency_ms=5.0)
+    bulbs = [SmartBulb(f"Bulb {index}", DeviceLocation.OFFICE, index) for index in range(5)]
+
+    async def run():
+        for bulb in bulbs:
+            await bulb.connect(controller)
+        consumer = asyncio.create_task(controller.consume())
+        for _ in range(4):
+            for bulb in bulbs:
+                await bulb._controller_queue.put(bulb.build_packet())
+        for _ in range(500):
+            if controller.processed_packets == 20:
+                break
+            await asyncio.sleep(0.01)
+        consumer.cancel()
+        try:
+            await consumer
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+
+    assert controller.processed_packets == 20
+    assert len(drain(storage_queue)) == 20
+    assert controller.get_metrics()["total_connected_devices"] == 5
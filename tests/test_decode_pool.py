@@ -0,0 +1,125 @@
+import asyncio
+import queue
+
+import pytest
+
+from models import Controller, DecodePool, DeviceLocation, RulesEngine
+from models.DecodePool import decode_rows
+from models.PacketCodec import CODECS, decode_packet
+from models.devices import SmartThermostat, SmartBulb, SmartCamera
+
+
+class Silent:
+    def message(self, message):
+        pass
+
+
+def make_devices(codec):
+    devices = [
+        SmartThermostat("Cold", DeviceLocation.KITCHEN, 5.0, 16.0, 50.0),
+        SmartThermostat("Humid", DeviceLocation.BATHROOM, 21.0, 21.0, 90.0),
+        SmartThermostat("Fine", DeviceLocation.BEDROOM, 21.0, 21.0, 50.0),
+        SmartBulb("Bulb", DeviceLocation.OFFICE, 30),
+        SmartCamera("Camera", DeviceLocation.GARAGE, 5.0),
+    ]
+    for device in devices:
+        device.set_reporter(Silent())
+        device.set_codec(CODECS[codec])
+    return devices
+
+
+def make_packets(devices, rounds=40):
+    packets = []
+    for _ in range(rounds):
+        for device in devices:
+            device.update_state()
+            packets.append(device.build_packet())
+    return packets
+
+
+@pytest.mark.parametrize("codec", ["json", "binary"])
+def test_pool_matches_decoding_in_place(codec):
+    devices = make_devices(codec)
+    packets = make_packets(devices)
+    registry = {str(device.id) for device in devices}
+    rules = RulesEngine()
+    pool = DecodePool(workers=2, min_batch=1)
+
+    try:
+        rows = asyncio.run(pool.decode(packets, rules))
+    finally:
+        pool.close()
+    payloads, classified = pool.payloads(rows, registry)
+
+    expected = [decode_packet(packet) for packet in packets]
+    assert payloads == expected
+    assert classified == rules.evaluate(expected)
+    assert pool.stats()["batches"] == 1 and pool.stats()["packets"] == len(packets)
+
+
+def test_rows_of_unregistered_devices_are_dropped():
+    devices = make_devices("binary")
+    packets = make_packets(devices, rounds=1)
+    rows = decode_rows(packets, RulesEngine())
+
+    payloads, _ = DecodePool().payloads(rows, {str(devices[0].id)})
+
+    assert [payload.device_id for payload in payloads] == [str(devices[0].id)]
+
+
+def test_small_batches_are_decoded_in_place():
+    pool = DecodePool(workers=1, min_batch=4)
+
+    assert not pool.offloads([b""] * 3)
+    assert pool.offloads([b""] * 4)
+
+
+def test_controller_offloads_large_batches():
+    def run(decode_workers):
+        devices = make_devices("binary")
+        controller = Controller(
+            storage_queue=queue.Queue(),
+            # the batches are large enough to offload once the packets are all queued
+            batch_size=40,
+            batch_latency_ms=50.0,
+            codecs=("binary",),
+            decode_workers=decode_workers,
+            offload_batch_size=16,
+        )
+
+        async def consume():
+            for device in devices:
+                await device.connect(controller)
+                device.set_reporter(Silent())
+            packets = make_packets(devices, rounds=8)
+            consumer = asyncio.create_task(controller.consume())
+            for packet in packets:
+                await controller._packet_queue.put(packet)
+            for _ in range(1_000):
+                if controller.processed_packets == len(packets):
+                    break
+                await asyncio.sleep(0.01)
+            consumer.cancel()
+            try:
+                await consumer
+            except asyncio.CancelledError:
+                pass
+
+        asyncio.run(consume())
+        return controller
+
+    offloaded = run(2)
+    in_place = run(0)
+
+    assert offloaded.processed_packets == in_place.processed_packets == 40
+    assert offloaded._offload.stats()["batches"] >= 1
+    assert offloaded.get_metrics()["total_connected_devices"] == 5
+    # the critical events the workers found were handled
+    assert offloaded._dispatcher.stats()["acknowledged"] >= 1
+    assert in_place._dispatcher.stats()["acknowledged"] >= 1
+
+
+@pytest.mark.parametrize("options", [{"lazy_decoding": True}, {"codecs": ("binary-delta",)}])
+def test_offloading_rejects_stateful_decoding(options):
+    with pytest.raises(ValueError):
+        Controller(storage_queue=queue.Queue(), decode_workers=2, **options)
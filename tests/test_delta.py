@@ -0,0 +1,188 @@
+import asyncio
+import queue
+
+import pytest
+
+from models import Controller, DeltaMerger, DeviceLocation, DeviceRegistry, OverflowPolicy
+from models.BoundedQueue import PacketQueue
+from models.PacketCodec import CODECS, decode_packet, decode_report, merge_delta, packet_device_id, packet_queue_key
+from models.devices import SmartThermostat, SmartBulb, Resync
+
+DELTA_CODECS = ["json-delta", "binary-delta"]
+
+
+class Silent:
+    def message(self, message):
+        pass
+
+
+def connected(device, codec):
+    # what Controller.connect does: the first packet is a full JSON one
+    registry = DeviceRegistry()
+    registry.register(device, decode_packet(device.build_packet()))
+    device.set_codec(CODECS[codec])
+    return registry
+
+
+@pytest.mark.parametrize("codec", DELTA_CODECS)
+def test_keyframe_then_deltas(codec):
+    device = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 18.0, 22.0, 40.0)
+    connected(device, codec)
+
+    keyframe = decode_report(device.build_packet())
+    assert keyframe.sequence == 1 and keyframe.payload is not None
+    assert keyframe.payload.current_temp == 18.0
+
+    device.update_state()
+    delta = decode_report(device.build_packet())
+    assert delta.sequence == 2 and delta.payload is None
+    # heating changes the temperature and humidity only
+    assert set(delta.changes) == {"current_temp", "humidity"}
+
+    merged = merge_delta(keyframe.payload, delta)
+    assert merged.current_temp == pytest.approx(18.4)
+    assert merged.target_temp == 22.0
+    assert merged.timestamp == delta.timestamp
+
+
+@pytest.mark.parametrize("codec", DELTA_CODECS)
+def test_keyframe_every_interval(codec):
+    device = SmartBulb("Bulb", DeviceLocation.OFFICE, 50)
+    connected(device, codec)
+
+    reports = [decode_report(device.build_packet()) for _ in range(2 * (device.keyframe_interval + 1))]
+
+    keyframes = [report.sequence for report in reports if report.payload is not None]
+    assert keyframes == [1, device.keyframe_interval + 2]
+    assert [report.sequence for report in reports] == list(range(1, len(reports) + 1))
+
+
+@pytest.mark.parametrize("codec", DELTA_CODECS)
+def test_merger_rebuilds_payloads_and_counts_heartbeats(codec):
+    device = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 18.0, 22.0, 40.0)
+    registry = connected(device, codec)
+    merger = DeltaMerger()
+
+    packets = []
+    for _ in range(4):
+        packets.append(device.build_packet())
+        device.update_state()
+    # the target is reached: nothing changes any more
+    device._current_temp = device._target_temp
+    packets.append(device.build_packet())
+    packets.append(device.build_packet())
+
+    payloads, heartbeats = merger.decode(packets, registry)
+
+    assert [payload.current_temp for payload in payloads] == pytest.approx([18.0, 18.4, 18.8, 19.2, 22.0])
+    assert [device_id for device_id, _ in heartbeats] == [str(device.id)]
+    assert merger.stats() == {"keyframes": 1, "deltas": 4, "heartbeats": 1, "gaps": 0, "dropped": 0}
+
+
+@pytest.mark.parametrize("codec", DELTA_CODECS)
+def test_gap_requests_a_single_resync(codec):
+    device = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 18.0, 22.0, 40.0)
+    registry = connected(device, codec)
+    gaps = []
+    merger = DeltaMerger(gaps.append)
+
+    payloads, _ = merger.decode([device.build_packet()], registry)
+    registry.update(payloads[-1])
+    device.update_state()
+    # lost on the way
+    device.build_packet()
+    after_gap = []
+    for _ in range(3):
+        device.update_state()
+        after_gap.append(device.build_packet())
+
+    payloads, _ = merger.decode(after_gap, registry)
+
+    assert payloads == []
+    assert gaps == [str(device.id)]
+    assert merger.stats()["dropped"] == 3
+
+    # the controller answers the gap with a Resync command
+    device._handle_command(Resync())
+    device.update_state()
+    payloads, _ = merger.decode([device.build_packet()], registry)
+    assert [payload.current_temp for payload in payloads] == pytest.approx([device._current_temp])
+    device.update_state()
+    payloads, _ = merger.decode([device.build_packet()], registry)
+    assert len(payloads) == 1 and merger.stats()["gaps"] == 1
+
+
+def test_unknown_devices_are_dropped():
+    device = SmartBulb("Bulb", DeviceLocation.OFFICE, 50)
+    device.set_codec(CODECS["binary-delta"])
+
+    assert DeltaMerger().decode([device.build_packet()], DeviceRegistry()) == ([], [])
+
+
+def test_full_packets_pass_through():
+    device = SmartBulb("Bulb", DeviceLocation.OFFICE, 50)
+    registry = connected(device, "binary")
+
+    payloads, heartbeats = DeltaMerger().decode([device.build_packet()], registry)
+
+    assert [payload.brightness for payload in payloads] == [50] and heartbeats == []
+
+
+def test_controller_sends_resync_on_gap():
+    controller = Controller(storage_queue=queue.Queue(), codecs=("binary-delta", "json"))
+    device = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 18.0, 22.0, 40.0)
+    device.set_reporter(Silent())
+    asyncio.run(device.connect(controller))
+
+    controller._process_batch([device.build_packet()])
+    device.update_state()
+    device.build_packet()
+    device.update_state()
+    controller._process_batch([device.build_packet()])
+
+    assert controller.decoding_stats()["delta"]["gaps"] == 1
+    assert controller._dispatcher.pending == 1
+
+
+@pytest.mark.parametrize("codec", DELTA_CODECS)
+def test_device_id_of_keyframes_and_deltas(codec):
+    device = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 18.0, 22.0, 40.0)
+    connected(device, codec)
+
+    keyframe = device.build_packet()
+    device.update_state()
+    delta = device.build_packet()
+
+    assert packet_device_id(keyframe) == packet_device_id(delta) == str(device.id)
+    assert packet_queue_key(keyframe) == str(device.id)
+    assert packet_queue_key(delta) is None
+
+
+@pytest.mark.parametrize("overflow", [OverflowPolicy.DROP_OLDEST, OverflowPolicy.COALESCE])
+@pytest.mark.parametrize("codec", DELTA_CODECS)
+def test_bounded_queue_drops_only_keyframes(codec, overflow):
+    devices = [SmartThermostat(f"Thermostat {index}", DeviceLocation.KITCHEN, 18.0, 22.0, 40.0) for index in range(4)]
+    for device in devices:
+        connected(device, codec)
+    capacity = 8
+
+    async def run():
+        packet_queue = PacketQueue(capacity, overflow, packet_queue_key)
+        sent = []
+        for _ in range(3 * devices[0].keyframe_interval):
+            for device in devices:
+                device.update_state()
+                packet = device.build_packet()
+                sent.append(packet)
+                packet_queue.put_nowait(packet)
+        return sent, [packet_queue.get_nowait() for _ in range(packet_queue.qsize())], packet_queue.stats()
+
+    sent, queued, stats = asyncio.run(run())
+
+    deltas = [packet for packet in sent if packet_queue_key(packet) is None]
+    keyframes = [packet for packet in queued if packet_queue_key(packet) is not None]
+    # every delta is kept, in order, and the full queue takes it out on the keyframes
+    assert [packet for packet in queued if packet_queue_key(packet) is None] == deltas
+    assert len(keyframes) <= capacity
+    assert stats["dropped"] + stats["coalesced"] == len(sent) - len(queued)
+    assert stats["dropped"] + stats["coalesced"] > 0
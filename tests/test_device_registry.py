@@ -0,0 +1,77 @@
+import pytest
+
+from models import ColumnarStore, DeviceLocation, DeviceRegistry
+from models.devices import SmartThermostat, SmartBulb, ThermostatPayload
+
+
+def thermostat_payload(device, current_temp=20.0):
+    return ThermostatPayload(str(device.id), device.name, device.location, current_temp, 21.0, 50.0)
+
+
+@pytest.fixture(params=[False, True], ids=["objects", "columnar"])
+def registry(request):
+    return DeviceRegistry(ColumnarStore() if request.param else None)
+
+
+def test_register_and_indexes(registry):
+    thermostat = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 20.0, 21.0, 50.0)
+    bulb = SmartBulb("Bulb", DeviceLocation.KITCHEN, 40)
+    registry.register(thermostat, thermostat_payload(thermostat))
+    registry.register(bulb)
+
+    assert registry.by_type("THERMOSTAT") == [thermostat]
+    assert sorted(registry.by_location(DeviceLocation.KITCHEN), key=str) == sorted([thermostat, bulb], key=str)
+    assert registry.get_payload(str(thermostat.id)).current_temp == 20.0
+    assert registry.get_payload(str(bulb.id)) is None
+
+    assert registry.unregister(str(bulb.id)) is bulb
+    assert str(bulb.id) not in registry
+    assert registry.by_location(DeviceLocation.KITCHEN) == [thermostat]
+
+
+def test_restore_registers_devices_without_a_device_object(registry):
+    thermostat = SmartThermostat("Thermostat", DeviceLocation.BEDROOM, 20.0, 21.0, 50.0)
+    device_id = str(thermostat.id)
+
+    assert registry.restore(thermostat_payload(thermostat)) is None
+
+    assert device_id in registry and len(registry) == 1
+    assert registry.lookup(device_id) is None
+    assert registry.get_payload(device_id).current_temp == 20.0
+    # restored devices get no commands, so they are left out of device lookups
+    assert registry.by_type("THERMOSTAT") == []
+    assert list(registry.devices()) == []
+
+
+def test_restore_replaces_the_payload_of_a_known_device(registry):
+    thermostat = SmartThermostat("Thermostat", DeviceLocation.BEDROOM, 20.0, 21.0, 50.0)
+    registry.restore(thermostat_payload(thermostat, 20.0))
+
+    registry.restore(thermostat_payload(thermostat, 23.5))
+
+    assert len(registry) == 1
+    assert registry.get_payload(str(thermostat.id)).current_temp == 23.5
+
+
+def test_restored_device_connecting_replaces_the_entry(registry):
+    thermostat = SmartThermostat("Thermostat", DeviceLocation.BEDROOM, 20.0, 21.0, 50.0)
+    device_id = str(thermostat.id)
+    registry.restore(thermostat_payload(thermostat, 20.0))
+
+    registry.register(thermostat, thermostat_payload(thermostat, 22.0))
+
+    assert len(registry) == 1
+    assert registry.lookup(device_id) is thermostat
+    assert registry.by_type("THERMOSTAT") == [thermostat]
+    assert registry.by_location(DeviceLocation.BEDROOM) == [thermostat]
+    assert registry.get_payload(device_id).current_temp == 22.0
+
+
+def test_unregister_restored_device(registry):
+    thermostat = SmartThermostat("Thermostat", DeviceLocation.BEDROOM, 20.0, 21.0, 50.0)
+    registry.restore(thermostat_payload(thermostat))
+
+    assert registry.unregister(str(thermostat.id)) is None
+
+    assert len(registry) == 0
+    assert list(registry.values()) == []
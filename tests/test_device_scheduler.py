@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from models import DeviceScheduler
+
+
+class Device:
+    def __init__(self, name, scheduler, sent, on_send=None):
+        self.name = name
+        self._scheduler = scheduler
+        self._sent = sent
+        self._on_send = on_send
+
+    async def send_status(self):
+        self._sent.append((round(self._scheduler.now, 6), self.name))
+        # a device's packet goes through the controller's queue
+        await asyncio.sleep(0)
+        if self._on_send is not None:
+            self._on_send(self)
+
+
+def make_scheduler():
+    return DeviceScheduler(tick_ms=100.0, slots=8, jitter=0.0, virtual_clock=True)
+
+
+def times(sent, name):
+    return [now for now, sent_by in sent if sent_by == name]
+
+
+def test_devices_are_sent_when_due():
+    scheduler = make_scheduler()
+    sent = []
+    # intervals longer than a turn of the wheel wait in their slot for the next turns
+    intervals = {"fast": 0.3, "slow": 0.5, "slowest": 1.7}
+    for name, interval in intervals.items():
+        scheduler.add(Device(name, scheduler, sent), interval)
+
+    asyncio.run(scheduler.run(duration=10.0))
+
+    assert sent == sorted(sent, key=lambda entry: entry[0])
+    for name, interval in intervals.items():
+        sent_at = times(sent, name)
+        assert sent_at[0] <= interval
+        assert [later - earlier for earlier, later in zip(sent_at, sent_at[1:])] == pytest.approx(
+            [interval] * (len(sent_at) - 1)
+        )
+    assert scheduler.sent_packets == len(sent)
+    assert scheduler.now == pytest.approx(10.0)
+
+
+def test_remove_while_sending():
+    scheduler = make_scheduler()
+    sent = []
+    removing = Device("removing", scheduler, sent, on_send=scheduler.remove)
+    staying = Device("staying", scheduler, sent)
+    scheduler.add(removing, 0.1)
+    scheduler.add(staying, 0.1)
+
+    asyncio.run(scheduler.run(duration=1.0))
+
+    assert times(sent, "removing") == [pytest.approx(0.1)]
+    # ticks 1 to 9 of the 10 run
+    assert len(times(sent, "staying")) == 9
+    assert len(scheduler) == 1
+
+
+def test_remove_another_device_due_at_the_same_tick():
+    scheduler = make_scheduler()
+    sent = []
+    other = Device("other", scheduler, sent)
+    first = Device("first", scheduler, sent, on_send=lambda _: scheduler.remove(other))
+    scheduler.add(first, 0.1)
+    scheduler.add(other, 0.1)
+
+    asyncio.run(scheduler.run(duration=1.0))
+
+    # both were due at the first tick, where other was removed before its turn
+    assert len(times(sent, "first")) == 9
+    assert times(sent, "other") == []
+    assert len(scheduler) == 1
+
+
+def test_add_again_replaces_the_schedule():
+    scheduler = make_scheduler()
+    sent = []
+    device = Device("device", scheduler, sent)
+    scheduler.add(device, 0.2)
+    asyncio.run(scheduler.run(duration=1.0))
+    before = len(sent)
+
+    scheduler.remove(device)
+    scheduler.add(device, 0.5)
+    scheduler.add(device, 0.5)
+    asyncio.run(scheduler.run(duration=2.0))
+
+    later = times(sent, "device")[before:]
+    # the stale entries of the previous schedules are never sent
+    assert [b - a for a, b in zip(later, later[1:])] == pytest.approx([0.5] * (len(later) - 1))
+    # the first status within the first interval after adding
+    assert 1.0 < later[0] <= 1.5 and len(later) >= 3
+    assert len(scheduler) == 1
+
+
+def test_add_again_while_sending():
+    scheduler = make_scheduler()
+    sent = []
+    device = Device("device", scheduler, sent, on_send=lambda device: scheduler.add(device, 0.4))
+    scheduler.add(device, 0.1)
+
+    asyncio.run(scheduler.run(duration=0.2))
+    device._on_send = None
+    asyncio.run(scheduler.run(duration=2.0))
+
+    sent_at = times(sent, "device")
+    # sent once on the old schedule, then only on the new one
+    assert sent_at[0] == pytest.approx(0.1)
+    assert [b - a for a, b in zip(sent_at[1:], sent_at[2:])] == pytest.approx([0.4] * (len(sent_at) - 2))
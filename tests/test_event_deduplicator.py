@@ -0,0 +1,137 @@
+import asyncio
+import queue
+from datetime import datetime, timedelta
+
+from models import Controller, DeviceLocation, EventDeduplicator, TriggerMode
+from models.CriticalEvent import CriticalEvent
+from models.devices import SmartThermostat, ThermostatPayload, SetTargetTemp, TurnOff
+
+NOW = datetime(2026, 1, 1)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def payload(device_id, current_temp=5.0, timestamp=NOW):
+    return ThermostatPayload(device_id, device_id, DeviceLocation.KITCHEN, current_temp, 21.0, 50.0, timestamp=timestamp)
+
+
+def admitted(deduplicator, device_ids, events):
+    return [(payload.device_id, event) for payload, event in deduplicator.filter(device_ids, events)]
+
+
+def test_level_events_are_held_back_for_the_cooldown():
+    clock = Clock()
+    deduplicator = EventDeduplicator(cooldown=10.0, mode=TriggerMode.LEVEL, clock=clock)
+    low = [(payload("a"), CriticalEvent.LOW_TEMPERATURE)]
+
+    assert admitted(deduplicator, ["a"], low) == [("a", CriticalEvent.LOW_TEMPERATURE)]
+    clock.now = 9.9
+    assert admitted(deduplicator, ["a"], low) == []
+    clock.now = 10.0
+    assert admitted(deduplicator, ["a"], low) == [("a", CriticalEvent.LOW_TEMPERATURE)]
+    assert deduplicator.stats()["suppressed_events"] == 1
+
+
+def test_cooldowns_are_per_device_and_event():
+    deduplicator = EventDeduplicator(cooldown=10.0, clock=Clock())
+    deduplicator.filter(None, [(payload("a"), CriticalEvent.LOW_TEMPERATURE)])
+
+    events = [
+        (payload("a"), CriticalEvent.LOW_TEMPERATURE),
+        (payload("a"), CriticalEvent.HIGH_HUMIDITY),
+        (payload("b"), CriticalEvent.LOW_TEMPERATURE),
+    ]
+
+    assert admitted(deduplicator, None, events) == [
+        ("a", CriticalEvent.HIGH_HUMIDITY),
+        ("b", CriticalEvent.LOW_TEMPERATURE),
+    ]
+
+
+def test_edge_events_wait_for_the_device_to_leave_the_state():
+    clock = Clock()
+    deduplicator = EventDeduplicator(cooldown=0.0, mode=TriggerMode.EDGE, clock=clock)
+    low = [(payload("a"), CriticalEvent.LOW_TEMPERATURE)]
+
+    assert len(admitted(deduplicator, ["a"], low)) == 1
+    clock.now = 1000.0
+    # still critical, however long it has been
+    assert admitted(deduplicator, ["a"], low) == []
+    # a payload without the event ends the state
+    assert admitted(deduplicator, ["a"], []) == []
+    assert deduplicator.stats()["active_events"] == 0
+    assert len(admitted(deduplicator, ["a"], low)) == 1
+
+
+def test_edge_events_fall_back_to_the_cooldown_without_device_ids():
+    clock = Clock()
+    deduplicator = EventDeduplicator(cooldown=5.0, mode=TriggerMode.EDGE, clock=clock)
+    low = [(payload("a"), CriticalEvent.LOW_TEMPERATURE)]
+
+    assert len(admitted(deduplicator, None, low)) == 1
+    clock.now = 4.0
+    assert admitted(deduplicator, None, low) == []
+    clock.now = 5.0
+    assert len(admitted(deduplicator, None, low)) == 1
+
+
+def test_per_event_overrides():
+    clock = Clock()
+    deduplicator = EventDeduplicator(
+        cooldown=60.0,
+        cooldowns={CriticalEvent.HIGH_HUMIDITY: 1.0},
+        modes={CriticalEvent.LOW_TEMPERATURE: TriggerMode.EDGE},
+        clock=clock,
+    )
+    humid = [(payload("a"), CriticalEvent.HIGH_HUMIDITY)]
+    cold = [(payload("b"), CriticalEvent.LOW_TEMPERATURE)]
+    deduplicator.filter(["a", "b"], humid + cold)
+
+    clock.now = 61.0
+    # humidity is level triggered with its own cooldown, temperature edge triggered
+    assert admitted(deduplicator, ["a", "b"], humid + cold) == [("a", CriticalEvent.HIGH_HUMIDITY)]
+
+
+def test_commands_wait_for_a_newer_payload():
+    deduplicator = EventDeduplicator()
+    old = payload("a", timestamp=NOW - timedelta(hours=1))
+
+    assert deduplicator.admit_command(old, SetTargetTemp(22.0))
+    # the device has not reported since
+    assert not deduplicator.admit_command(old, SetTargetTemp(22.0))
+    # another command is sent
+    assert deduplicator.admit_command(old, TurnOff())
+    assert deduplicator.admit_command(payload("a", timestamp=datetime.now() + timedelta(seconds=1)), TurnOff())
+    assert deduplicator.stats()["suppressed_commands"] == 1
+
+
+def test_forget_drops_the_state_of_a_device():
+    deduplicator = EventDeduplicator(cooldown=60.0, mode=TriggerMode.EDGE, clock=Clock())
+    low = [(payload("a"), CriticalEvent.LOW_TEMPERATURE)]
+    deduplicator.filter(["a"], low)
+    deduplicator.admit_command(low[0][0], SetTargetTemp(22.0))
+
+    deduplicator.forget("a")
+
+    assert len(admitted(deduplicator, ["a"], low)) == 1
+    assert deduplicator.admit_command(low[0][0], SetTargetTemp(22.0))
+
+
+def test_controller_handles_a_sustained_event_once():
+    deduplicator = EventDeduplicator(cooldown=60.0)
+    controller = Controller(storage_queue=queue.Queue(), deduplicator=deduplicator)
+    # too cold, with a target below a safe temperature
+    thermostat = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 5.0, 16.0, 50.0)
+    asyncio.run(thermostat.connect(controller))
+
+    for _ in range(5):
+        controller._process_batch([thermostat.build_packet()])
+
+    assert controller._dispatcher.pending == 1
+    assert deduplicator.stats()["suppressed_events"] == 4
@@ -0,0 +1,58 @@
+import queue
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import DeviceLocation, HistoryIndex, LogFormat
+from models.StorageWorker import StorageWorker
+from models.devices import ThermostatPayload
+
+START = datetime(2026, 1, 1)
+DEVICES = 40
+
+
+def make_payloads(count):
+    # devices first logged late end up after the last indexed block
+    return [
+        ThermostatPayload(
+            f"device-{index % DEVICES if index < count // 2 else index % (2 * DEVICES)}",
+            "Thermostat",
+            DeviceLocation.KITCHEN,
+            float(index),
+            21.0,
+            50.0,
+            timestamp=START + timedelta(seconds=index),
+        )
+        for index in range(count)
+    ]
+
+
+@pytest.mark.parametrize("log_format", [LogFormat.TEXT, LogFormat.BINARY])
+@pytest.mark.parametrize("index_block_size", [None, 1024, 1_000_000])
+def test_query_by_device(tmp_path, log_format, index_block_size):
+    path = str(tmp_path / "history.log")
+    payloads = make_payloads(2_000)
+    storage_queue = queue.Queue()
+    worker = StorageWorker(
+        storage_queue,
+        batch_size=16,
+        batch_latency_ms=0.0,
+        path=path,
+        log_format=log_format,
+        index_block_size=index_block_size,
+    )
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    for payload in payloads:
+        storage_queue.put(payload)
+    storage_queue.put(None)
+    thread.join()
+
+    with HistoryIndex(path, log_format) as index:
+        for number in (0, DEVICES - 1, DEVICES, 2 * DEVICES - 1):
+            device_id = f"device-{number}"
+            expected = [payload.current_temp for payload in payloads if payload.device_id == device_id]
+            assert expected
+            assert [payload.current_temp for payload in index.query(device_id)] == expected
+        assert list(index.query("device-unknown")) == []
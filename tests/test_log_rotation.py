@@ -0,0 +1,130 @@
+import gzip
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import DeviceLocation, HistoryIndex, LogCompression, LogFormat
+from models.HistoryIndex import index_path
+from models.LogRotation import list_segments
+from models.StorageWorker import StorageWorker
+from models.devices import ThermostatPayload
+
+START = datetime(2026, 1, 1)
+
+
+def make_payloads(count, first=0):
+    return [
+        ThermostatPayload(
+            f"device-{index % 7}",
+            f"Thermostat {index % 7}",
+            DeviceLocation.KITCHEN,
+            float(index),
+            21.0,
+            50.0,
+            timestamp=START + timedelta(seconds=index),
+        )
+        for index in range(first, first + count)
+    ]
+
+
+def run_worker(payloads, **options):
+    storage_queue = queue.Queue()
+    worker = StorageWorker(storage_queue, batch_size=16, batch_latency_ms=0.0, **options)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    for payload in payloads:
+        storage_queue.put(payload)
+    storage_queue.put(None)
+    thread.join()
+    return worker
+
+
+def read_log(path, log_format, directory):
+    """
+    Reads the sealed segments (decompressing them) and the active log, oldest first.
+    """
+    payloads = []
+    for number, segment in list_segments(path):
+        if segment.endswith(".gz"):
+            plain = os.path.join(directory, f"plain.{number}")
+            with gzip.open(segment, "rb") as source, open(plain, "wb") as target:
+                target.write(source.read())
+            segment = plain
+        with HistoryIndex(segment, log_format) as index:
+            payloads.extend(index.query())
+    with HistoryIndex(path, log_format) as index:
+        payloads.extend(index.query())
+    return payloads
+
+
+@pytest.mark.parametrize("index_block_size", [None, 4096])
+@pytest.mark.parametrize("log_format", [LogFormat.TEXT, LogFormat.BINARY])
+def test_rotate_by_size_keeps_every_record(tmp_path, log_format, index_block_size):
+    path = str(tmp_path / "history.log")
+    payloads = make_payloads(2_000)
+
+    worker = run_worker(
+        payloads, path=path, log_format=log_format, rotate_bytes=16 * 1024, index_block_size=index_block_size
+    )
+
+    segments = list_segments(path)
+    assert len(segments) >= 2
+    # every segment keeps the index of its own records, if there is one
+    indexed = [os.path.exists(index_path(segment)) for _, segment in segments] + [os.path.exists(index_path(path))]
+    assert indexed == [index_block_size is not None] * (len(segments) + 1)
+    assert worker.stats()["rotations"] == len(segments)
+    # sealed once a batch takes them past the limit
+    assert all(os.path.getsize(segment) < 2 * 16 * 1024 for _, segment in segments)
+    assert read_log(path, log_format, str(tmp_path)) == payloads
+
+
+@pytest.mark.parametrize("workers", [0, 1])
+def test_sealed_segments_are_compressed(tmp_path, workers):
+    path = str(tmp_path / "history.log")
+    payloads = make_payloads(2_000)
+
+    worker = run_worker(
+        payloads,
+        path=path,
+        log_format=LogFormat.BINARY,
+        rotate_bytes=8 * 1024,
+        compression=LogCompression.GZIP,
+        compression_workers=workers,
+    )
+
+    segments = list_segments(path)
+    assert segments and all(segment.endswith(".gz") for _, segment in segments)
+    assert worker.stats()["compression"]["segments"] == len(segments)
+    assert read_log(path, LogFormat.BINARY, str(tmp_path)) == payloads
+
+
+def test_retention_keeps_the_newest_segments(tmp_path):
+    path = str(tmp_path / "history.log")
+    payloads = make_payloads(2_000)
+
+    run_worker(payloads, path=path, log_format=LogFormat.BINARY, rotate_bytes=8 * 1024, retention_segments=2)
+
+    segments = list_segments(path)
+    assert len(segments) == 2
+    records = read_log(path, LogFormat.BINARY, str(tmp_path))
+    # the newest records, without a gap
+    assert records == payloads[-len(records) :]
+
+
+@pytest.mark.parametrize("log_format", [LogFormat.TEXT, LogFormat.BINARY])
+def test_restart_appends_and_cuts_off_a_partial_record(tmp_path, log_format):
+    path = str(tmp_path / "history.log")
+    first = make_payloads(300)
+    second = make_payloads(300, first=300)
+    run_worker(first, path=path, log_format=log_format)
+    partial = b"\x01\x02\x03" if log_format == LogFormat.BINARY else b"ThermostatPayload(device_id='dev"
+    with open(path, "ab") as file:
+        # a crash in the middle of a write
+        file.write(partial)
+
+    run_worker(second, path=path, log_format=log_format)
+
+    assert read_log(path, log_format, str(tmp_path)) == first + second
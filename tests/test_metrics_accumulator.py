@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from models import DeviceLocation, MetricsAccumulator
+from models.AnalyticsEngine import AnalyticsEngine
+from models.devices import ThermostatPayload, BulbPayload, CameraPayload
+
+LOCATIONS = list(DeviceLocation)
+
+
+def random_payload(rng, device_id, kind):
+    location = rng.choice(LOCATIONS)
+    if kind == 0:
+        return ThermostatPayload(
+            device_id, device_id, location, rng.uniform(5.0, 35.0), rng.uniform(15.0, 25.0), rng.uniform(0.0, 100.0)
+        )
+    if kind == 1:
+        return BulbPayload(device_id, device_id, location, rng.random() < 0.5, rng.randint(0, 100))
+    return CameraPayload(device_id, device_id, location, rng.random() < 0.1, rng.uniform(0.0, 100.0), None, True)
+
+
+def assert_matches_full_recompute(accumulator, connected_devices):
+    expected = AnalyticsEngine.get_metrics(connected_devices)
+    actual = accumulator.metrics()
+    assert actual["total_connected_devices"] == expected["total_connected_devices"]
+    assert actual["average_temperature"] == pytest.approx(expected["average_temperature"])
+    assert actual["average_humidity"] == pytest.approx(expected["average_humidity"])
+    assert accumulator.is_consistent(connected_devices, rel_tol=1e-6)
+
+
+def test_add_update_remove_and_reconnect_match_full_recompute():
+    rng = random.Random(5)
+    accumulator = MetricsAccumulator()
+    connected_devices = {}
+    kinds = {}
+
+    for step in range(5_000):
+        device_id = f"device-{rng.randrange(300)}"
+        kind = kinds.setdefault(device_id, rng.randrange(3))
+        action = rng.random()
+
+        if device_id not in connected_devices:
+            # connect, with or without a first payload
+            payload = random_payload(rng, device_id, kind) if action < 0.9 else None
+            accumulator.add(payload)
+            connected_devices[device_id] = payload
+        elif action < 0.1:
+            accumulator.remove(connected_devices.pop(device_id))
+        elif action < 0.2:
+            # reconnect: the previous state is dropped, the new first payload added
+            accumulator.remove(connected_devices[device_id])
+            payload = random_payload(rng, device_id, kind)
+            accumulator.add(payload)
+            connected_devices[device_id] = payload
+        else:
+            payload = random_payload(rng, device_id, kind)
+            accumulator.update(connected_devices[device_id], payload)
+            connected_devices[device_id] = payload
+
+        if step % 250 == 0:
+            assert_matches_full_recompute(accumulator, connected_devices)
+
+    assert_matches_full_recompute(accumulator, connected_devices)
+
+
+def test_recompute_rebuilds_the_running_sums():
+    rng = random.Random(9)
+    connected_devices = {f"device-{index}": random_payload(rng, f"device-{index}", index % 3) for index in range(100)}
+    accumulator = MetricsAccumulator()
+    # drifted sums
+    accumulator._temperature_sum = 1e6
+
+    accumulator.recompute(connected_devices)
+
+    assert_matches_full_recompute(accumulator, connected_devices)
+
+
+def test_merge_of_partials_matches_the_whole():
+    rng = random.Random(2)
+    connected_devices = {f"device-{index}": random_payload(rng, f"device-{index}", index % 3) for index in range(90)}
+    partials = [MetricsAccumulator() for _ in range(3)]
+    for index, payload in enumerate(connected_devices.values()):
+        partials[index % 3].add(payload)
+
+    merged = MetricsAccumulator.merge(MetricsAccumulator.from_state(partial.state()) for partial in partials)
+
+    assert_matches_full_recompute(merged, connected_devices)
+
+
+def test_empty_accumulator():
+    assert MetricsAccumulator().metrics() == {
+        "average_temperature": 0.0,
+        "average_humidity": 0.0,
+        "total_connected_devices": 0,
+    }
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+
+from models import DeviceLocation
+from models.PacketCodec import (
+    CODECS,
+    SCHEMAS,
+    decode_packet,
+    negotiate_codec,
+    packet_device_id,
+    packet_header,
+    packet_time,
+)
+from models.devices import SmartThermostat, SmartBulb, SmartCamera, TakeSnapshot
+
+SENT = datetime(2026, 3, 1, 12, 30, 15, 250_000)
+
+
+class Silent:
+    def message(self, message):
+        pass
+
+
+def make_devices():
+    camera = SmartCamera("Camera", DeviceLocation.GARAGE, 64.5)
+    camera.set_reporter(Silent())
+    snapshotting = SmartCamera("Snapshotting camera", DeviceLocation.GARDEN, 12.0)
+    snapshotting.set_reporter(Silent())
+    snapshotting.apply_command(TakeSnapshot())
+    return [
+        SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 21.5, 22.0, 45.25),
+        SmartBulb("Bulb", DeviceLocation.OFFICE, 70),
+        camera,
+        snapshotting,
+    ]
+
+
+def expected_fields(status):
+    schema = SCHEMAS[status["device_type"]]
+    fields = {name: status[name] for name in schema.field_names}
+    for name in schema.timestamp_fields:
+        fields[name] = datetime.fromisoformat(fields[name]) if fields[name] else None
+    return fields
+
+
+@pytest.mark.parametrize("codec", ["json", "binary"])
+@pytest.mark.parametrize("device", make_devices(), ids=lambda device: device.name)
+def test_round_trip(codec, device):
+    status = device.get_status()
+    packet = CODECS[codec].encode(str(device.id), SENT, status)
+
+    payload = decode_packet(packet)
+
+    assert type(payload) is SCHEMAS[status["device_type"]].payload_class
+    assert payload.device_id == str(device.id)
+    assert payload.name == device.name
+    assert payload.location == device.location
+    assert payload.timestamp == SENT
+    for name, value in expected_fields(status).items():
+        if isinstance(value, float):
+            value = pytest.approx(value)
+        assert getattr(payload, name) == value
+
+
+@pytest.mark.parametrize("codec", ["json", "binary"])
+def test_device_id_and_header_without_decoding(codec):
+    device = make_devices()[0]
+    status = device.get_status()
+    packet = CODECS[codec].encode(str(device.id), SENT, status)
+    later = CODECS[codec].encode(str(device.id), datetime(2026, 3, 1, 12, 31), status)
+    status["humidity"] += 1.0
+    changed = CODECS[codec].encode(str(device.id), SENT, status)
+
+    device_id, fingerprint, sent = packet_header(packet)
+
+    assert packet_device_id(packet) == device_id == str(device.id)
+    assert packet_time(sent) == SENT
+    # the fingerprint ignores the send time but not the status
+    assert packet_header(later)[1] == fingerprint
+    assert packet_header(changed)[1] != fingerprint
+
+
+def test_binary_packets_are_smaller_than_json():
+    for device in make_devices():
+        status = device.get_status()
+        binary = CODECS["binary"].encode(str(device.id), SENT, status)
+        text = CODECS["json"].encode(str(device.id), SENT, status)
+        assert len(binary) < len(text) / 2
+
+
+def test_unknown_device_type_is_not_decoded():
+    status = make_devices()[1].get_status()
+    status["device_type"] = "TOASTER"
+
+    assert decode_packet(CODECS["json"].encode("toaster", SENT, status)) is None
+
+
+@pytest.mark.parametrize(
+    "offered, preferred, expected",
+    [
+        (("binary", "json"), ("binary", "json"), "binary"),
+        (("json",), ("binary", "json"), "json"),
+        (("binary-delta", "binary", "json"), ("binary", "binary-delta"), "binary"),
+        # JSON is the fallback every device understands
+        ((), ("binary",), "json"),
+        (("msgpack",), ("msgpack",), "json"),
+    ],
+)
+def test_negotiate_codec(offered, preferred, expected):
+    assert negotiate_codec(offered, preferred).name == expected
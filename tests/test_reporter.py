@@ -0,0 +1,137 @@
+import asyncio
+import io
+import json
+import queue
+
+import pytest
+
+from models import Controller, DeviceLocation, Reporter, ReportFormat
+from models.devices import SmartThermostat
+
+METRICS = {"average_temperature": 20.5, "average_humidity": 45.25, "total_connected_devices": 3}
+
+
+@pytest.fixture
+def stream():
+    return io.StringIO()
+
+
+def make_reporter(stream, **options):
+    # flushed by the tests, the writer thread never gets to it
+    return Reporter(refresh_seconds=3600.0, stream=stream, **options)
+
+
+def test_messages_are_aggregated_between_refreshes(stream):
+    reporter = make_reporter(stream)
+    for _ in range(3):
+        reporter.message("cold")
+    reporter.message("motion")
+
+    reporter.flush()
+
+    assert stream.getvalue() == "cold (x3)\nmotion\n"
+    assert reporter.stats() == {
+        "reports": 1,
+        "messages_written": 2,
+        "messages_aggregated": 2,
+        "messages_skipped": 0,
+    }
+    reporter.close()
+
+
+def test_messages_beyond_max_messages_are_counted(stream):
+    reporter = make_reporter(stream, max_messages=2)
+    for index in range(5):
+        reporter.message(f"message {index}")
+    reporter.message("message 4")
+
+    reporter.flush()
+
+    assert stream.getvalue().splitlines() == ["message 0", "message 1", "... and 4 more messages"]
+    assert reporter.stats()["messages_skipped"] == 4
+    reporter.close()
+
+
+def test_only_the_latest_metrics_are_written(stream):
+    reporter = make_reporter(stream)
+    reporter.metrics({**METRICS, "total_connected_devices": 1})
+    reporter.metrics(METRICS)
+
+    reporter.flush()
+    # nothing reported since
+    reporter.flush()
+
+    report = stream.getvalue()
+    assert "AVERAGE HOUSE TEMPERATURE: 20.50 °C" in report
+    assert "TOTAL CONNECTED DEVICES: 3" in report
+    assert "TOTAL CONNECTED DEVICES: 1" not in report
+    assert reporter.stats()["reports"] == 1
+    reporter.close()
+
+
+def test_json_lines(stream):
+    reporter = make_reporter(stream, report_format=ReportFormat.JSON, max_messages=1)
+    reporter.message("cold")
+    reporter.message("cold")
+    reporter.message("motion")
+    reporter.metrics(METRICS)
+
+    reporter.flush()
+
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["type"] for record in records] == ["message", "skipped_messages", "metrics"]
+    assert records[0]["message"] == "cold" and records[0]["count"] == 2
+    assert records[1]["count"] == 1
+    assert {key: records[2][key] for key in METRICS} == METRICS
+
+
+def test_metrics_are_due_once_per_refresh(stream):
+    reporter = make_reporter(stream)
+
+    assert reporter.due()
+    reporter.metrics(METRICS)
+    assert not reporter.due()
+    reporter.close()
+
+
+def test_close_writes_what_is_left(stream):
+    reporter = make_reporter(stream)
+    reporter.message("last words")
+
+    reporter.close()
+
+    assert stream.getvalue() == "last words\n"
+
+
+def test_writer_thread_refreshes(stream):
+    reporter = Reporter(refresh_seconds=0.01, stream=stream)
+    reporter.message("hello")
+    try:
+        for _ in range(500):
+            if stream.getvalue():
+                break
+            reporter._stopped.wait(0.01)
+    finally:
+        reporter.close()
+
+    assert stream.getvalue() == "hello\n"
+
+
+def test_controller_hands_output_to_the_reporter(stream, capsys):
+    reporter = make_reporter(stream)
+    controller = Controller(storage_queue=queue.Queue(), reporter=reporter)
+    # too cold, with a target below a safe temperature
+    thermostat = SmartThermostat("Thermostat", DeviceLocation.KITCHEN, 5.0, 16.0, 50.0)
+    asyncio.run(thermostat.connect(controller))
+
+    for _ in range(3):
+        controller._process_batch([thermostat.build_packet()])
+    reporter.close()
+
+    # nothing printed by the controller or the device
+    assert capsys.readouterr().out == ""
+    report = stream.getvalue()
+    assert "Device Thermostat connected." in report
+    assert "[CRITICAL]: Thermostat temperature too low! Adjusting target temperature. (x3)" in report
+    # metrics handed over once in the refresh
+    assert report.count("TOTAL CONNECTED DEVICES: 1") == 1
@@ -0,0 +1,60 @@
+import pickle
+import random
+
+import pytest
+
+from benchmarks.rules_benchmark import make_payloads
+from models import ColumnarStore, RulesEngine
+from models.AnalyticsEngine import AnalyticsEngine, is_critical
+from models.CriticalEvent import CriticalEvent
+
+
+@pytest.fixture
+def payloads():
+    random.seed(11)
+    return make_payloads(3_000)
+
+
+def test_evaluate_matches_is_critical(payloads):
+    engine = RulesEngine()
+
+    assert engine.evaluate(payloads) == list(AnalyticsEngine.filter_events(payloads))
+    assert [engine.classify(payload) for payload in payloads] == [is_critical(payload) for payload in payloads]
+
+
+def test_evaluate_store_matches_evaluate(payloads):
+    engine = RulesEngine()
+    store = ColumnarStore()
+    for payload in payloads:
+        store.upsert(payload)
+
+    assert sorted(engine.evaluate_store(store), key=str) == sorted(
+        ((payload.device_id, event) for payload, event in engine.evaluate(payloads)), key=str
+    )
+
+
+def test_invalid_rules_keep_current_ones(payloads):
+    engine = RulesEngine()
+    expected = engine.evaluate(payloads)
+
+    with pytest.raises(ValueError):
+        engine.load([{"device_type": "THERMOSTAT", "field": "nope", "op": "<", "threshold": 1, "event": "LOW_TEMPERATURE"}])
+
+    assert engine.evaluate(payloads) == expected
+
+
+def test_loaded_rules_replace_defaults(payloads):
+    engine = RulesEngine(
+        [{"device_type": "BULB", "field": "brightness", "op": ">=", "threshold": 100, "event": "LOW_BATTERY"}]
+    )
+
+    events = engine.evaluate(payloads)
+
+    assert events
+    assert all(event == CriticalEvent.LOW_BATTERY and payload.brightness >= 100 for payload, event in events)
+
+
+def test_engine_pickles_for_worker_processes(payloads):
+    engine = pickle.loads(pickle.dumps(RulesEngine()))
+
+    assert engine.evaluate(payloads) == RulesEngine().evaluate(payloads)
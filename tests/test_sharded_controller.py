@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+import pytest
+
+from models import DeviceLocation, HistoryIndex, LogFormat, ShardedController, ShardMode
+from models.AnalyticsEngine import AnalyticsEngine
+from models.PacketCodec import decode_packet
+from models.devices import SmartThermostat, SmartBulb
+
+LOCATIONS = list(DeviceLocation)
+
+
+class Silent:
+    def message(self, message):
+        pass
+
+
+@pytest.mark.parametrize("codec", ["json-delta", "binary-delta"])
+def test_process_shards_reject_delta_codecs(tmp_path, codec):
+    with pytest.raises(ValueError):
+        ShardedController(
+            shards=2,
+            mode=ShardMode.PROCESS,
+            codecs=(codec, "json"),
+            storage_options={"path": str(tmp_path / "history.log")},
+        )
+
+
+def test_task_shards_accept_delta_codecs(tmp_path):
+    controller = ShardedController(
+        shards=2,
+        mode=ShardMode.TASK,
+        codecs=("binary-delta", "json"),
+        storage_options={"path": str(tmp_path / "history.log")},
+    )
+    try:
+        assert all(shard._deltas is not None for shard in controller._shards)
+    finally:
+        controller.end_storage_thread()
+
+
+def make_devices(count=12):
+    devices = []
+    for index in range(count):
+        if index % 3:
+            device = SmartThermostat(f"Thermostat {index}", LOCATIONS[index % len(LOCATIONS)], 15.0 + index, 21.0, 40.0)
+        else:
+            device = SmartBulb(f"Bulb {index}", LOCATIONS[index % len(LOCATIONS)], 5 * index)
+        device.set_reporter(Silent())
+        devices.append(device)
+    return devices
+
+
+async def send_packets(controller, devices, rounds):
+    queues = {}
+    for device in devices:
+        queues[device] = await controller.connect(device, device.build_packet())
+        # connecting sets the controller's reporter
+        device.set_reporter(Silent())
+    consumer = asyncio.create_task(controller.consume())
+
+    latest = {}
+    for _ in range(rounds):
+        for device in devices:
+            device.update_state()
+            packet = device.build_packet()
+            latest[str(device.id)] = decode_packet(packet)
+            await queues[device].put(packet)
+
+    sent = rounds * len(devices)
+    for _ in range(1_000):
+        if controller.processed_packets >= sent:
+            break
+        await asyncio.sleep(0.01)
+    consumer.cancel()
+    try:
+        await consumer
+    except asyncio.CancelledError:
+        pass
+    return latest
+
+
+def read_logs(paths):
+    payloads = []
+    for path in paths:
+        with HistoryIndex(path, LogFormat.TEXT) as index:
+            payloads.extend(index.query())
+    return payloads
+
+
+@pytest.mark.parametrize("mode", [ShardMode.TASK, ShardMode.PROCESS])
+def test_shards_merge_metrics_and_log_every_payload(tmp_path, mode):
+    path = str(tmp_path / "history.log")
+    shards = 3
+    devices = make_devices()
+    rounds = 5
+    controller = ShardedController(shards=shards, mode=mode, storage_options={"path": path})
+    try:
+        latest = asyncio.run(send_packets(controller, devices, rounds))
+    finally:
+        controller.end_storage_thread()
+
+    assert controller.processed_packets == rounds * len(devices)
+    expected = AnalyticsEngine.get_metrics(latest)
+    metrics = controller.get_metrics()
+    assert metrics["total_connected_devices"] == len(devices)
+    assert metrics["average_temperature"] == pytest.approx(expected["average_temperature"])
+    assert metrics["average_humidity"] == pytest.approx(expected["average_humidity"])
+
+    if mode == ShardMode.TASK:
+        # task shards log through the coordinator
+        logs = [path]
+        assert not any(os.path.exists(f"{path}.{index}") for index in range(shards))
+    else:
+        # every process shard logs the payloads of its own devices, the coordinator nothing
+        logs = [f"{path}.{index}" for index in range(shards)]
+        assert not os.path.exists(path)
+        for index, log in enumerate(logs):
+            owned = {str(device.id) for device in devices if controller.shard_for(str(device.id)) == index}
+            assert {payload.device_id for payload in read_logs([log])} == owned
+    logged = read_logs(logs)
+    assert len(logged) == rounds * len(devices)
+    assert {payload.device_id: payload for payload in logged} == latest
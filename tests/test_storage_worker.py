@@ -0,0 +1,109 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import DeviceLocation, DurabilityPolicy, HistoryIndex, LogFormat
+from models.StorageWorker import StorageWorker
+from models.devices import BulbPayload
+
+START = datetime(2026, 1, 1)
+
+
+def make_payloads(count):
+    return [
+        BulbPayload(
+            f"device-{index % 5}",
+            "Bulb",
+            DeviceLocation.OFFICE,
+            True,
+            index % 100,
+            timestamp=START + timedelta(seconds=index),
+        )
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    calls = []
+    monkeypatch.setattr(os, "fsync", calls.append)
+    return calls
+
+
+def run_queued(payloads, **options):
+    """
+    Runs a worker over payloads queued up front, so batches are always full.
+    """
+    storage_queue = queue.Queue()
+    for payload in payloads:
+        storage_queue.put(payload)
+    storage_queue.put(None)
+    worker = StorageWorker(storage_queue, **options)
+    worker.run()
+    return worker
+
+
+@pytest.mark.parametrize(
+    "durability, flush_interval_ms, expected",
+    [
+        # once per group, and once more on close
+        (DurabilityPolicy.EVERY_BATCH, 1000.0, lambda batches, records: batches + 1),
+        (DurabilityPolicy.EVERY_RECORD, 1000.0, lambda batches, records: records + 1),
+        # the interval never passes during the run
+        (DurabilityPolicy.INTERVAL_MS, 60_000.0, lambda batches, records: 1),
+        (DurabilityPolicy.INTERVAL_MS, 0.0, lambda batches, records: batches + 1),
+        (DurabilityPolicy.OS_DEFAULT, 1000.0, lambda batches, records: 1),
+    ],
+)
+@pytest.mark.parametrize("log_format", [LogFormat.TEXT, LogFormat.BINARY])
+def test_fsyncs_per_group(tmp_path, fsyncs, log_format, durability, flush_interval_ms, expected):
+    path = str(tmp_path / "history.log")
+    payloads = make_payloads(100)
+
+    worker = run_queued(
+        payloads,
+        path=path,
+        batch_size=16,
+        durability=durability,
+        flush_interval_ms=flush_interval_ms,
+        fsync=True,
+        log_format=log_format,
+    )
+
+    stats = worker.stats()
+    assert stats["batches"] == 7 and stats["records"] == 100
+    assert stats["max_batch_size"] == 16
+    assert stats["durability"] == durability.value
+    assert len(fsyncs) == expected(7, 100)
+    with HistoryIndex(path, log_format) as index:
+        assert list(index.query()) == payloads
+
+
+def test_no_fsync_unless_asked(tmp_path, fsyncs):
+    run_queued(make_payloads(50), path=str(tmp_path / "history.log"), batch_size=8)
+
+    assert fsyncs == []
+
+
+def test_group_waits_batch_latency_for_more_payloads(tmp_path):
+    storage_queue = queue.Queue()
+    worker = StorageWorker(storage_queue, path=str(tmp_path / "history.log"), batch_size=100, batch_latency_ms=200.0)
+    thread = threading.Thread(target=worker.run)
+    thread.start()
+    payloads = make_payloads(3)
+    try:
+        for payload in payloads:
+            storage_queue.put(payload)
+            # well within the batch latency
+            time.sleep(0.01)
+    finally:
+        storage_queue.put(None)
+        thread.join()
+
+    # trickling payloads were committed together
+    assert worker.stats()["batches"] == 1
+    assert worker.stats()["max_batch_size"] == 3
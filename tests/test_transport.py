@@ -0,0 +1,232 @@
+import asyncio
+import json
+import queue
+
+import pytest
+
+from models import Controller, ConnectionPool, DeviceLocation, ShardedController, TransportServer
+from models.PacketCodec import decode_packet
+from models.Transport import (
+    FRAME_HEADER,
+    FRAME_HELLO,
+    FRAME_WELCOME,
+    MAX_FRAME,
+    FrameProtocol,
+    frame,
+    packet_frame,
+)
+from models.devices import SmartThermostat, SmartBulb, SetTargetTemp
+
+
+class Frames(FrameProtocol):
+    def __init__(self):
+        super().__init__()
+        self.frames = []
+
+    def frame_received(self, kind, channel, body):
+        self.frames.append((kind, channel, bytes(body)))
+
+
+class FakeTransport:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Silent:
+    def message(self, message):
+        pass
+
+
+def make_devices(count=4):
+    devices = []
+    for index in range(count):
+        if index % 2:
+            device = SmartBulb(f"Bulb {index}", DeviceLocation.OFFICE, 10 * index)
+        else:
+            device = SmartThermostat(f"Thermostat {index}", DeviceLocation.KITCHEN, 18.0, 21.0, 50.0)
+        devices.append(device)
+    return devices
+
+
+async def receive(packet_queue, count):
+    packets = []
+    while len(packets) < count:
+        packets.append(await asyncio.wait_for(packet_queue.get(), 5))
+    return packets
+
+
+def test_frames_split_across_reads():
+    frames = [
+        (FRAME_HELLO, 0, b'{"codecs": []}'),
+        (FRAME_WELCOME, 7, b"binary"),
+        (FRAME_WELCOME, 2**32 - 1, b""),
+    ]
+    data = b"".join(frame(*entry) for entry in frames)
+    protocol = Frames()
+    protocol.connection_made(FakeTransport())
+
+    for index in range(len(data)):
+        protocol.data_received(data[index : index + 1])
+
+    assert protocol.frames == frames
+    assert protocol.frames_received == len(frames)
+    assert protocol.bytes_received == len(data)
+
+
+def test_oversized_frame_closes_the_connection():
+    transport = FakeTransport()
+    protocol = Frames()
+    protocol.connection_made(transport)
+
+    protocol.data_received(FRAME_HEADER.pack(MAX_FRAME + 1, FRAME_HELLO, 0))
+
+    assert transport.closed
+    assert protocol.frames == []
+
+
+def test_handshake_packets_and_commands_over_tcp():
+    async def run():
+        controller = Controller(storage_queue=queue.Queue(), codecs=("binary", "json"))
+        server = TransportServer(controller)
+        await server.start()
+        pool = ConnectionPool(server.address, connections=2)
+        devices = make_devices()
+        try:
+            for device in devices:
+                device.set_reporter(Silent())
+                await device.connect(pool)
+            for device in devices:
+                await device._controller_queue.put(device.build_packet())
+            packets = await receive(controller._packet_queue, len(devices))
+
+            thermostat = controller._connected_devices.lookup(str(devices[0].id))
+            errors = await asyncio.wait_for(thermostat.receive_commands([SetTargetTemp(25.0)]), 5)
+            return controller, devices, server.stats(), pool.stats(), packets, errors
+        finally:
+            await pool.close()
+            await server.close()
+
+    controller, devices, server_stats, pool_stats, packets, errors = asyncio.run(run())
+    device_ids = {str(device.id) for device in devices}
+    assert server_stats["devices"] == 4 and server_stats["connections"] == 2
+    assert pool_stats["connections"] == 2 and pool_stats["devices"] == 4
+    assert all(device_id in controller._connected_devices for device_id in device_ids)
+    # binary was negotiated, and every device's packet arrived
+    assert all(isinstance(packet, bytes) for packet in packets)
+    assert {decode_packet(packet).device_id for packet in packets} == device_ids
+    # the command travelled back to the device, and its result to the controller
+    assert errors == [None]
+    assert devices[0].get_status()["target_temp"] == 25.0
+
+
+def test_packets_sent_before_the_handshake_completes_are_queued():
+    async def run():
+        controller = Controller(storage_queue=queue.Queue())
+        server = TransportServer(controller)
+        await server.start()
+        device = make_devices(1)[0]
+        hello = json.dumps({"codecs": ["json"], "packet": device.build_packet()}).encode()
+        early = [device.build_packet(), device.build_packet()]
+
+        reader, writer = await asyncio.open_connection(*server.address)
+        try:
+            writer.write(frame(FRAME_HELLO, 3, hello) + b"".join(packet_frame(3, packet) for packet in early))
+            length, kind, channel = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+            welcome = await reader.readexactly(length)
+            packets = await receive(controller._packet_queue, len(early))
+            return (kind, channel, welcome), early, packets, server.stats()
+        finally:
+            writer.close()
+            await server.close()
+
+    welcome, early, packets, stats = asyncio.run(run())
+    assert welcome == (FRAME_WELCOME, 3, b"json")
+    assert packets == early
+    assert stats["packets"] == 2 and stats["dropped_packets"] == 0
+
+
+def test_packets_over_udp():
+    async def run():
+        controller = Controller(storage_queue=queue.Queue(), codecs=("binary",))
+        server = TransportServer(controller)
+        await server.start(udp_port=0)
+        pool = ConnectionPool(server.address, connections=1, udp_address=server.udp_address)
+        devices = make_devices()
+        try:
+            for device in devices:
+                device.set_reporter(Silent())
+                await device.connect(pool)
+            for device in devices:
+                device._controller_queue.put_nowait(device.build_packet())
+            packets = await receive(controller._packet_queue, len(devices))
+            return packets, server.stats(), pool.stats()
+        finally:
+            await pool.close()
+            await server.close()
+
+    packets, server_stats, pool_stats = asyncio.run(run())
+    assert len(packets) == 4
+    assert pool_stats["datagrams_sent"] >= 1
+    assert server_stats["packets"] == 4 and server_stats["dropped_packets"] == 0
+
+
+def test_udp_packets_of_unknown_devices_are_dropped():
+    async def run():
+        controller = Controller(storage_queue=queue.Queue())
+        server = TransportServer(controller)
+        await server.start(udp_port=0)
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(asyncio.DatagramProtocol, remote_addr=server.udp_address)
+        try:
+            transport.sendto(packet_frame(0, make_devices(1)[0].build_packet()))
+            for _ in range(100):
+                if server.dropped_packets:
+                    break
+                await asyncio.sleep(0.01)
+            return server.stats(), controller._packet_queue.qsize()
+        finally:
+            transport.close()
+            await server.close()
+
+    stats, queued = asyncio.run(run())
+    assert stats["dropped_packets"] == 1
+    assert queued == 0
+
+
+@pytest.mark.parametrize("udp", [False, True], ids=["tcp", "udp"])
+def test_sharded_controller_gets_packets_on_the_device_shard(tmp_path, udp):
+    controller = ShardedController(shards=3, storage_options={"path": str(tmp_path / "history.log")})
+
+    async def run():
+        server = TransportServer(controller)
+        await server.start(udp_port=0 if udp else None)
+        pool = ConnectionPool(server.address, connections=1, udp_address=server.udp_address)
+        devices = make_devices(8)
+        try:
+            for device in devices:
+                device.set_reporter(Silent())
+                await device.connect(pool)
+            expected = [set() for _ in controller._shards]
+            for device in devices:
+                device._controller_queue.put_nowait(device.build_packet())
+                expected[controller.shard_for(str(device.id))].add(str(device.id))
+            received = []
+            for shard, device_ids in zip(controller._shards, expected):
+                packets = await receive(shard._packet_queue, len(device_ids))
+                received.append({decode_packet(packet).device_id for packet in packets})
+            return expected, received
+        finally:
+            await pool.close()
+            await server.close()
+
+    try:
+        expected, received = asyncio.run(run())
+    finally:
+        controller.end_storage_thread()
+
+    # packets of a device are queued on its own shard, never on the coordinator's queue
+    assert received == expected
+    assert controller._packet_queue.qsize() == 0
@@ -0,0 +1,71 @@
+import pytest
+
+from models import DeviceLocation, WindowedAnalytics
+from models.devices import ThermostatPayload
+
+
+def thermostat(current_temp, location=DeviceLocation.KITCHEN):
+    return ThermostatPayload("device", "Thermostat", location, current_temp, 21.0, 50.0)
+
+
+def make_analytics():
+    # 6 buckets of 10 s
+    return WindowedAnalytics(windows=(30.0, 60.0), bucket_seconds=10.0)
+
+
+def test_query_over_a_window():
+    analytics = make_analytics()
+    analytics.record([thermostat(20.0), thermostat(22.0)], now=100.0)
+    analytics.record([thermostat(30.0)], now=125.0)
+    analytics.record([thermostat(10.0, DeviceLocation.GARDEN)], now=125.0)
+
+    kitchen = analytics.query("current_temp", 30.0, DeviceLocation.KITCHEN, now=129.0)
+    assert (kitchen["count"], kitchen["min"], kitchen["max"]) == (3, 20.0, 30.0)
+    assert kitchen["mean"] == pytest.approx(24.0)
+
+    recent = analytics.query("current_temp", 10.0, device_type="THERMOSTAT", now=129.0)
+    assert (recent["count"], recent["min"], recent["max"]) == (2, 10.0, 30.0)
+
+
+def test_old_record_does_not_wipe_a_newer_bucket():
+    analytics = make_analytics()
+    analytics.record([thermostat(20.0)], now=160.0)
+    # same slot (16 % 6 == 10 % 6), 60 s older: out of the history
+    analytics.record([thermostat(99.0)], now=100.0)
+
+    result = analytics.query("current_temp", 10.0, now=160.0)
+    assert (result["count"], result["max"]) == (1, 20.0)
+    assert analytics.expired == 1
+
+
+def test_out_of_order_records_within_the_history_are_kept():
+    analytics = make_analytics()
+    analytics.record([thermostat(20.0)], now=150.0)
+    analytics.record([thermostat(24.0)], now=125.0)
+    analytics.record([thermostat(22.0)], now=151.0)
+
+    result = analytics.query("current_temp", 60.0, now=155.0)
+    assert (result["count"], result["min"], result["max"]) == (3, 20.0, 24.0)
+    assert analytics.expired == 0
+
+
+def test_records_older_than_the_history_are_ignored_in_every_ring():
+    analytics = make_analytics()
+    analytics.record([thermostat(20.0)], now=1_000.0)
+    # a ring that never saw the newer buckets
+    analytics.record([thermostat(5.0, DeviceLocation.GARDEN)], now=100.0)
+
+    assert analytics.expired == 1
+    assert analytics.query(window=60.0, location=DeviceLocation.GARDEN, now=100.0)["count"] == 0
+
+
+def test_restore_keeps_rejecting_expired_records():
+    analytics = make_analytics()
+    analytics.record([thermostat(20.0)], now=1_000.0)
+    restored = make_analytics()
+    restored.restore(analytics.state())
+
+    restored.record([thermostat(5.0)], now=100.0)
+
+    assert restored.expired == 1
+    assert restored.query("current_temp", 10.0, now=1_000.0)["max"] == 20.0